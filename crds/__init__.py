@@ -14,6 +14,7 @@ warnings.filterwarnings(
 
 __all__ = [
     "getrecommendations",
+    "getrecommendations_many",
     "getreferences",
     "assign_bestrefs",
     "get_pickled_mapping",
@@ -37,7 +38,7 @@ from .core import exceptions
 from .core.exceptions import *
 from .core.constants import ALL_OBSERVATORIES, INSTRUMENT_KEYWORDS
 
-from .core.heavy_client import getreferences, getrecommendations
+from .core.heavy_client import getreferences, getrecommendations, getrecommendations_many
 from .core.heavy_client import get_symbolic_mapping, get_pickled_mapping
 from .core.heavy_client import get_context_name
 
@@ -7,12 +7,12 @@ For more details on the several modes of operations and command line parameters
 """
 import sys
 import os
-from collections import namedtuple, OrderedDict
+from collections import namedtuple, OrderedDict, deque
 
 # ===================================================================
 
 import crds
-from crds.core import log, config, utils, timestamp, cmdline, heavy_client
+from crds.core import log, config, utils, timestamp, cmdline, heavy_client, selectors, parallel
 from crds import diff, matches
 from . import table_effects, headers
 from crds.client import api
@@ -305,6 +305,8 @@ than errors as the default.
         self.datasets_since = self.args.datasets_since
 
         self.active_header = None   # new or old header last processed with bestrefs
+
+        self.prefetched = {}   # { (dataset, context) : (reftypes, bestrefs or exception) } computed by worker processes
     def complex_init(self):
         """Complex init tasks run inside any --pdb environment,  also unfortunately --profile."""
 
@@ -537,6 +539,12 @@ than errors as the default.
         self.add_argument("--eliminate-duplicate-cases", action="store_true",
                           help="Categorize unique bestrefs results as errors to determine representative test cases...  Replaces normal error counts with coverage counts and ids.")
 
+        self.add_argument("--selector-stats", action="store_true",
+                          help="Instrument local rmap lookups and report lookup counts, times, and Match winnowing per rmap.")
+
+        self.add_argument("-j", "--processes", type=int, default=config.BESTREFS_PROCESSES.get(),
+                          help="Compute local best references on this many worker processes,  0 for one per CPU.  Defaults to CRDS_BESTREFS_PROCESSES or 1.")
+
         cmdline.UniqueErrorsMixin.add_args(self)
 
     def setup_contexts(self):
@@ -666,14 +674,20 @@ than errors as the default.
 
     def main(self):
         """Compute bestrefs for datasets."""
-        # Finish __init__() inside --pdb
-        if self.complex_init():
-            for i, dataset in enumerate(self.new_headers):
-                if i != 0 and i % 1000 == 0:
-                    log.verbose(self.get_stat("datasets"), "sources processed", verbosity=5)
-                self.process(dataset)
-            self.post_processing()
-        self.report_stats()
+        old_selector_stats = selectors.enable_stats(self.args.selector_stats)
+        try:
+            # Finish __init__() inside --pdb
+            if self.complex_init():
+                datasets = self.process_parallel() if self.use_processes else self.new_headers
+                for i, dataset in enumerate(datasets):
+                    if i != 0 and i % 1000 == 0:
+                        log.verbose(self.get_stat("datasets"), "sources processed", verbosity=5)
+                    self.process(dataset)
+                self.post_processing()
+            self.report_stats()
+            self.report_selector_stats()
+        finally:
+            selectors.enable_stats(old_selector_stats)
         if self.args.eliminate_duplicate_cases:
             log.warning("Running in --eliminate-duplicate-cases mode;  even successful bestrefs are categorized as errors for analysis.")
         log.verbose(self.get_stat("datasets"), "sources processed", verbosity=5)
@@ -681,22 +695,94 @@ than errors as the default.
         log.standard_status()
         return log.errors()
 
+    @property
+    def use_processes(self):
+        """Return True IFF best references should be computed on worker processes."""
+        if self.args.processes == 1:
+            return False
+        if self.server_info.effective_mode == "remote":
+            log.verbose("Ignoring --processes for remote best references.")
+        elif self.args.selector_stats or log.get_verbose() >= 50:
+            log.warning("Ignoring --processes;  --selector-stats and verbose output require serial bestrefs.")
+        else:
+            return True
+        return False
+
+    def process_parallel(self):
+        """Generate the datasets of self.new_headers in order as the best references
+        of each are computed on a parallel.BestrefsPool and stored in self.prefetched.
+        """
+        order = deque()   # datasets in input order not yet processed
+        pending = {}      # { dataset : number of bestrefs computations not yet returned }
+        contexts = [self.new_context] + ([self.old_context] if self.args.old_context else [])
+        final = { context : heavy_client.get_processing_mode(self.observatory, context)[1]
+                  for context in contexts }
+        def items():
+            for dataset in self.new_headers:
+                work = self.prefetch_work(dataset)
+                order.append(dataset)
+                pending[dataset] = len(work)
+                for context, header, reftypes in work:
+                    yield (dataset, context, reftypes), final[context], header, reftypes
+        with parallel.BestrefsPool(sorted(set(final.values())), processes=self.args.processes) as pool:
+            log.verbose("Computing best references on", pool)
+            for (dataset, context, reftypes), bestrefs in pool.imap(items()):
+                self.prefetched[(dataset, context)] = (reftypes, bestrefs)
+                pending[dataset] -= 1
+                while order and pending[order[0]] == 0:
+                    del pending[order[0]]
+                    yield order.popleft()
+        yield from order
+
+    def prefetch_work(self, dataset):
+        """Return the list of (context, header, reftypes) bestrefs computations which
+        _process() will need for `dataset`.   Datasets which are skipped or fail before
+        best references are computed are left for _process() to handle and report.
+        """
+        if dataset in self.drop_ids or (self.only_ids and dataset not in self.only_ids):
+            return []
+        lookups = [(self.new_context, self.new_headers)]
+        if self.compare_prior and self.args.old_context:
+            lookups.append((self.old_context, self.old_headers))
+        work = []
+        for context, source in lookups:
+            try:
+                header = source.get_lookup_parameters(dataset)
+                instrument = utils.header_to_instrument(header)
+                reftypes = self.determine_reftypes(instrument, dataset, context, header)
+            except Exception as exc:
+                log.verbose("Deferring bestrefs for", repr(dataset), "to serial processing:", str(exc), verbosity=60)
+                break
+            if reftypes is None:
+                self.prefetched[(dataset, context)] = (None, {})
+            else:
+                work.append((context, header, reftypes))
+        return work
+
+    def report_selector_stats(self):
+        """Print the rmap lookup statistics collected for --selector-stats."""
+        if self.args.selector_stats:
+            log.info("Selector statistics:\n" + selectors.format_stats())
+
     def process(self, dataset):
         """Process best references for `dataset`,  printing dataset output,  collecting stats, trapping exceptions."""
         with log.error_on_exception("Failed processing", repr(dataset)):
-            log.verbose("=" * 120)
-            if dataset in self.drop_ids:
-                log.verbose("Skipping drop-list dataset", repr(dataset))
-                return
-            elif self.only_ids and dataset not in self.only_ids:
-                log.verbose("Skipping", repr(dataset), "not in --only-ids", verbosity=80)
-                return
-            elif self.args.files:
-                log.info("===> Processing", dataset)     # file mode
-            else:
-                log.verbose("===> Processing", dataset, verbosity=25)   # database or regression modes
-            self.increment_stat("datasets", 1)
-            self._process(dataset)
+            try:
+                log.verbose("=" * 120)
+                if dataset in self.drop_ids:
+                    log.verbose("Skipping drop-list dataset", repr(dataset))
+                    return
+                elif self.only_ids and dataset not in self.only_ids:
+                    log.verbose("Skipping", repr(dataset), "not in --only-ids", verbosity=80)
+                    return
+                elif self.args.files:
+                    log.info("===> Processing", dataset)     # file mode
+                else:
+                    log.verbose("===> Processing", dataset, verbosity=25)   # database or regression modes
+                self.increment_stat("datasets", 1)
+                self._process(dataset)
+            finally:
+                self.discard_prefetched(dataset)
 
     def _process(self, dataset):
         """Core best references,  add to update tuples."""
@@ -725,6 +811,8 @@ than errors as the default.
 
     def get_bestrefs(self, instrument, dataset, context, header):
         """Compute the bestrefs for `dataset` with respect to loaded mapping/context `ctx`."""
+        if (dataset, context) in self.prefetched:
+            return self.get_prefetched_bestrefs(dataset, context)
         with log.augment_exception("Failed determining reference types for", repr(dataset),
                                    "with respect to", (instrument, context, header)):
             reftypes = self.determine_reftypes(instrument, dataset, context, header)
@@ -736,6 +824,26 @@ than errors as the default.
                 header, reftypes=reftypes, context=context, observatory=self.observatory, fast=log.get_verbose() < 50)
         return {key.upper(): value for (key, value) in bestrefs.items()}
 
+    def discard_prefetched(self, dataset):
+        """Drop any best references prefetched for `dataset` which _process() skipped
+        or failed before using,  so they are not held for the rest of the run.
+        """
+        for context in (self.new_context, self.old_context):
+            self.prefetched.pop((dataset, context), None)
+
+    def get_prefetched_bestrefs(self, dataset, context):
+        """Return the bestrefs for `dataset` computed by process_parallel(),  or raise the
+        exception which prevented computing them as get_bestrefs() would have.
+        """
+        reftypes, bestrefs = self.prefetched.pop((dataset, context))
+        if reftypes is None:
+            return {}
+        with log.augment_exception("Failed computing bestrefs for data", repr(dataset),
+                                   "with respect to", repr(context)):
+            if isinstance(bestrefs, Exception):
+                raise bestrefs
+        return {key.upper(): value for (key, value) in bestrefs.items()}
+
     def determine_reftypes(self, instrument, dataset, context, header):
         """Based on instrument, context, header as well as command line parameters determine the list
         of reftypes that should be processed.
@@ -0,0 +1,656 @@
+"""This module defines asyncio versions of the CRDS client JSONRPC calls and file
+downloads so that services running on an event loop can call the CRDS server
+without blocking it or handing the calls to a thread executor:
+
+>> from crds.client import aio
+>> bestrefs = await aio.get_best_references_by_header_map("hst_1000.pmap", header_map)
+>> headers = await aio.get_dataset_headers_by_id("hst_1000.pmap", dataset_ids)
+>> localpaths, downloads, nbytes = await aio.AsyncFileCacher("hst_1000.pmap").get_local_files(names)
+
+Calls encode, decode, log, and classify errors exactly like their counterparts
+in crds.client.proxy and crds.client.api,  and are retried as configured by
+CRDS_CLIENT_RETRY_COUNT and CRDS_CLIENT_RETRY_DELAY_SECONDS.   The requests each
+event loop makes at once,  including file downloads,  are limited to
+CRDS_CLIENT_MAX_CONCURRENCY.
+
+HTTP is implemented on asyncio streams with the rules of crds.client.transport:
+requests send urllib's User-Agent,  verify HTTPS servers with urllib's default
+SSL context,  follow redirects like urllib,  and raise urllib.error.HTTPError for
+HTTP error statuses.   Each event loop keeps its own pool of idle keep-alive
+connections,  closed by reset_pool(),  subject to CRDS_CLIENT_KEEP_ALIVE and
+CRDS_CLIENT_POOL_SIZE.   Cancelling a call closes its connection.
+
+URLs other than http:// or https://,  and servers reached through a proxy
+configured by environment variables,  are requested by crds.client.transport on
+the event loop's default executor instead.   CRDS_DOWNLOAD_PLUGIN commands run
+as asyncio subprocesses.
+"""
+import io
+import os
+import ssl
+import asyncio
+import hashlib
+import weakref
+import functools
+import contextlib
+import http.client
+from urllib import parse
+
+# ============================================================================
+
+from crds.core import utils, log, config
+from crds.core.log import srepr
+from crds.core.exceptions import CrdsLookupError, CrdsDownloadError
+
+from . import api, proxy, transport
+
+# ============================================================================
+
+__all__ = [
+    "urlopen",
+    "HttpResponse",
+    "AsyncConnectionPool",
+    "get_pool",
+    "reset_pool",
+    "apply_with_retries",
+
+    "AsyncCheckingProxy",
+    "AsyncServiceCallBinding",
+    "AsyncFileCacher",
+
+    "get_best_references_by_header_map",
+    "get_file_info_map",
+    "get_dataset_headers_by_id",
+    "get_dataset_headers_unlimited",
+    "dump_files",
+    ]
+
+# ============================================================================
+
+_LIMITERS = weakref.WeakKeyDictionary()   # { event_loop : asyncio.Semaphore }
+
+def _limiter():
+    """Return the semaphore limiting the concurrent requests of the running event loop."""
+    loop = asyncio.get_running_loop()
+    try:
+        return _LIMITERS[loop]
+    except KeyError:
+        return _LIMITERS.setdefault(loop, asyncio.Semaphore(config.get_client_max_concurrency()))
+
+async def _run_blocking(func, *pars, **keys):
+    """Return func(*pars, **keys) computed on the default executor of the running event loop.
+    Cancelling the caller does not interrupt `func`,  which runs to completion.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *pars, **keys))
+
+async def apply_with_retries(func, *pars, **keys):
+    """Await coroutine function func() as f(*pargs, **keys) and return the result.
+    Retry on any exception as defined in config.py,  like proxy.apply_with_retries().
+    """
+    retries = config.get_client_retry_count()
+    delay = config.get_client_retry_delay_seconds()
+    for retry in range(retries):
+        try:
+            return await func(*pars, **keys)
+        except Exception as exc:
+            log.verbose_warning("FAILED: Attempt", str(retry+1), "of", retries, "with:", str(exc))
+            log.verbose_warning("FAILED: Waiting for", delay, "seconds before retrying")  # waits after total fail...
+            await asyncio.sleep(delay)
+            exc2 = exc
+    raise exc2
+
+# ============================================================================
+
+# Exceptions indicating that a reused connection was closed by the server
+# before it read the request.
+_STALE_CONNECTION_ERRORS = (ConnectionResetError, BrokenPipeError)
+
+class AsyncConnectionPool:
+    """Keeps the idle keep-alive HTTP connections of one event loop for reuse,
+    at most `maxsize` per server.
+    """
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize if maxsize is not None else config.CLIENT_POOL_SIZE.get()
+        self.connections = 0    # count of connections opened
+        self._idle = {}         # { (scheme, host, port) : [ (reader, writer), ... ] }
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(maxsize={}, connections={})".format(self.maxsize, self.connections)
+
+    def close(self):
+        """Close all idle connections."""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _reader, writer in connections:
+                writer.close()
+
+    async def request(self, url, data=None, timeout=None):
+        """Send a POST of bytes `data`,  or a GET if `data` is None,  to `url` and
+        return its HttpResponse,  following redirects by the rules of
+        transport.ConnectionPool.request().
+
+        Raises urllib.error.HTTPError for HTTP error statuses.
+        """
+        visited = {}   # { redirected url : times visited }
+        while True:
+            response = await self._request(url, data, timeout)
+            location = response.headers.get("location") or response.headers.get("uri")
+            if response.status in transport._GET_REDIRECTS and location:
+                body = await response.read()
+                url, data = transport._next_url(url, data, response, location, visited, body), None
+                if not transport._is_direct(url):
+                    return await _blocking_urlopen(url, None, timeout)
+                continue
+            if response.status >= 400:
+                raise transport._http_error(url, response, body=await response.read())
+            return response
+
+    async def _request(self, url, data, timeout):
+        """Send one request for `url` on a pooled connection and return its HttpResponse,
+        trying another connection whenever a reused one turns out to be stale.
+        """
+        parts = parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        keep_alive = config.CLIENT_KEEP_ALIVE.get()
+        headers = {"Host" : parts.netloc, "User-Agent" : transport.USER_AGENT,
+                   "Connection" : "keep-alive" if keep_alive else "close", "Accept-Encoding" : "identity"}
+        if data is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["Content-Length"] = str(len(data))
+        head = "{} {} HTTP/1.1\r\n".format("GET" if data is None else "POST", path)
+        head += "".join("{}: {}\r\n".format(name, value) for (name, value) in headers.items()) + "\r\n"
+        message = head.encode("latin-1") + (data or b"")
+        while True:
+            reader, writer, reused = await self._get(key, timeout)
+            try:
+                writer.write(message)
+                await asyncio.wait_for(writer.drain(), timeout)
+                status_line = await asyncio.wait_for(reader.readline(), timeout)
+                if not status_line:
+                    raise http.client.RemoteDisconnected("Remote end closed connection without response")
+            except _STALE_CONNECTION_ERRORS as exc:
+                writer.close()
+                if not reused:
+                    raise
+                log.verbose("Replacing stale keep-alive connection to", repr(key), ":", str(exc), verbosity=70)
+                continue
+            except BaseException:
+                writer.close()
+                raise
+            try:
+                return await self._read_head(url, key, status_line, reader, writer, timeout, keep_alive)
+            except BaseException:
+                writer.close()
+                raise
+
+    async def _read_head(self, url, key, status_line, reader, writer, timeout, keep_alive):
+        """Read the headers following `status_line` and return the HttpResponse to `url`."""
+        try:
+            version, status, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(repr(status_line))
+        lines = []
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            lines.append(line)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        headers = http.client.parse_headers(io.BytesIO(b"".join(lines)))
+        will_close = (not keep_alive or version != "HTTP/1.1" or
+                      "close" in headers.get("connection", "").lower())
+        release = None if will_close else functools.partial(self._put, key)
+        return HttpResponse(url, status, reason, headers, reader, writer, timeout, release)
+
+    async def _get(self, key, timeout):
+        """Return (reader, writer, reused) for server `key`,  reusing an idle connection if possible."""
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not (reader.at_eof() or writer.is_closing()):
+                return reader, writer, True
+            writer.close()
+        self.connections += 1
+        scheme, host, port = key
+        tls = ssl._create_default_https_context() if scheme == "https" else None   # as http.client
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=tls), timeout)
+        return reader, writer, False
+
+    def _put(self, key, reader, writer):
+        """Return the connection to server `key` to the pool,  or close it if the pool is full."""
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.maxsize:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+class HttpResponse:
+    """The status, headers, and body of the response to an HTTP request.   Its
+    connection returns to the pool once the body has been read completely,  or is
+    closed if the response is closed first.   Use it as an async context manager
+    to close it.
+    """
+    def __init__(self, url, status, reason, headers, reader, writer, timeout, release=None):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+        self._timeout = timeout
+        self._release = release
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(url={}, status={})".format(repr(self.url), self.status)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the connection of this response unless it was already released."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def read(self):
+        """Return the complete body of this response as bytes."""
+        return b"".join([data async for data in self.iter_data()])
+
+    async def iter_data(self, size=config.CRDS_DATA_CHUNK_SIZE):
+        """Yield the body of this response in blocks of at most `size` bytes."""
+        if self._writer is None:
+            return
+        if self.status in (204, 304) or 100 <= self.status < 200:
+            pass
+        elif self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                line = await self._wait(self._reader.readline())
+                length = int(line.split(b";")[0], 16)
+                if not length:
+                    break
+                async for data in self._iter_exactly(length, size):
+                    yield data
+                await self._wait(self._reader.readline())
+            while (await self._wait(self._reader.readline())).strip():   # skip trailers
+                pass
+        elif "content-length" in self.headers:
+            async for data in self._iter_exactly(int(self.headers["content-length"]), size):
+                yield data
+        else:
+            self._release = None   # the body ends when the connection does
+            while True:
+                data = await self._wait(self._reader.read(size))
+                if not data:
+                    break
+                yield data
+        self._done()
+
+    async def _iter_exactly(self, length, size):
+        """Yield exactly `length` bytes of the body in blocks of at most `size` bytes."""
+        while length > 0:
+            data = await self._wait(self._reader.read(min(length, size)))
+            if not data:
+                raise http.client.IncompleteRead(b"", length)
+            length -= len(data)
+            yield data
+
+    async def _wait(self, awaitable):
+        """Await `awaitable`,  timing out as configured by CRDS_CLIENT_TIMEOUT_SECONDS."""
+        return await asyncio.wait_for(awaitable, self._timeout)
+
+    def _done(self):
+        """Release the connection of this completely read response to its pool,  or close it."""
+        if self._release is not None:
+            reader, writer, self._writer = self._reader, self._writer, None
+            self._release(reader, writer)
+        else:
+            self.close()
+
+class _BlockingResponse:
+    """A response of crds.client.transport read on the event loop's executor,  with
+    the interface of HttpResponse.
+    """
+    def __init__(self, response):
+        self.url = response.geturl()
+        self.status = response.getcode()
+        self.reason = getattr(response, "reason", "")
+        self.headers = response.info()
+        self._response = response
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(url={}, status={})".format(repr(self.url), self.status)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the underlying response."""
+        self._response.close()
+
+    async def read(self):
+        """Return the complete body of this response as bytes."""
+        return await _run_blocking(self._response.read)
+
+    async def iter_data(self, size=config.CRDS_DATA_CHUNK_SIZE):
+        """Yield the body of this response in blocks of at most `size` bytes."""
+        while True:
+            data = await _run_blocking(self._response.read, size)
+            if not data:
+                break
+            yield data
+
+async def _blocking_urlopen(url, data, timeout):
+    """Return the response of transport.urlopen() run on the event loop's executor."""
+    return _BlockingResponse(await _run_blocking(transport.urlopen, url, data, timeout=timeout))
+
+_POOLS = weakref.WeakKeyDictionary()   # { event_loop : AsyncConnectionPool }
+
+def get_pool():
+    """Return the AsyncConnectionPool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    try:
+        return _POOLS[loop]
+    except KeyError:
+        return _POOLS.setdefault(loop, AsyncConnectionPool())
+
+def reset_pool():
+    """Close the idle connections of the running event loop's AsyncConnectionPool and
+    start a new one,  e.g. before the loop is closed.
+    """
+    pool = _POOLS.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool.close()
+
+async def urlopen(url, data=None, timeout=None):
+    """Return the HttpResponse of requesting `url`,  a POST of bytes `data` or
+    a GET if `data` is None,  like transport.urlopen().   `timeout` defaults to
+    CRDS_CLIENT_TIMEOUT_SECONDS and applies to each network operation.
+
+    Raises urllib.error.HTTPError for HTTP error statuses.
+    """
+    if timeout is None:
+        timeout = config.get_client_timeout_seconds()
+    if not transport._is_direct(url):
+        return await _blocking_urlopen(url, data, timeout)
+    return await get_pool().request(url, data, timeout)
+
+# ============================================================================
+
+class AsyncCheckingProxy:
+    """AsyncCheckingProxy converts calls to undefined methods into asyncio JSON
+    RPC service call bindings,  like proxy.CheckingProxy.
+
+    XXX NOTE: Always underscore new methods or you may hide a real JSONRPC method
+    which also appears in the proxy object's namespace with the same name.
+    """
+    def __init__(self, service_url, version='1.0'):
+        self.__version = str(version)
+        self.__service_url = service_url
+
+    def __getattr__(self, name):
+        """Return a coroutine function corresponding to JSONRPC method `name`."""
+        return AsyncServiceCallBinding(self.__service_url, name, self.__version)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(url='%s', version='%s')" % \
+            (self.__service_url, self.__version)
+
+class AsyncServiceCallBinding(proxy.ServiceCallBinding):
+    """When awaited,  AsyncServiceCallBinding issues a JSONRPC call to the associated
+    service URL.
+    """
+    async def _call(self, *args, **kwargs):
+        """Core of RPC dispatch without error interpretation, logging, or return value decoding."""
+        parameters, url = self._prepare_call(args, kwargs)
+        response = await apply_with_retries(self._call_service, parameters, url)
+        return self._load_response(response)
+
+    async def _call_service(self, parameters, url):
+        """Call the JSONRPC defined by `parameters` and raise a ServiceError on any exception."""
+        if not isinstance(parameters, bytes):
+            parameters = parameters.encode("utf-8")
+        try:
+            async with _limiter():
+                async with await urlopen(url, parameters) as channel:
+                    return (await channel.read()).decode("utf-8")
+        except Exception as exc:
+            raise self._service_error(exc) from exc
+
+    async def __call__(self, *args, **kwargs):
+        jsonrpc = await self._call(*args, **kwargs)
+        return self._get_result(jsonrpc)
+
+def get_proxy():
+    """Return an AsyncCheckingProxy for the server configured by api.set_crds_server()."""
+    return AsyncCheckingProxy(api.URL, version="1.0")
+
+# ============================================================================
+
+async def get_best_references_by_header_map(context, header_map, reftypes=None):
+    """Get best references for header_map = { dataset_id : header, ...}, } and reference types
+    where a header is a dictionary of matching parameters.
+
+    If reftypes is None,  all types are returned.
+
+    Returns { dataset_id : { reftype: bestref, ... }, ... }
+    """
+    try:
+        bestrefs_map = await get_proxy().get_best_references_by_header_map(context, header_map, reftypes)
+    except Exception as exc:
+        raise CrdsLookupError(str(exc)) from exc
+    return bestrefs_map
+
+async def get_file_info_map(observatory, files=None, fields=None):
+    """Return the info { filename : { info } } on `files` of `observatory`.
+    `fields` can be used to limit info returned to specified keys.
+    """
+    if files is not None:
+        files = tuple(sorted(files))
+    if fields is not None:
+        fields = tuple(sorted(fields))
+    return await get_proxy().get_file_info_map(observatory, files, fields)
+
+async def get_dataset_headers_by_id(context, dataset_ids, datasets_since=None):
+    """Return { dataset_id : { header } } for `dataset_ids`."""
+    context = os.path.basename(context)
+    return await get_proxy().get_dataset_headers_by_id(context, dataset_ids, datasets_since)
+
+async def get_dataset_headers_unlimited(context, ids, max_ids_per_rpc=500):
+    """Return { dataset_id : header } for `ids`,  potentially more `ids` than can
+    be serviced with a single JSONRPC request,  fetching up to `max_ids_per_rpc`
+    headers per request concurrently.   If there is a failure fetching parameters
+    for dataset_id,  `header` will be returned as a string / error message.
+    """
+    slices = [ids[i : i + max_ids_per_rpc] for i in range(0, len(ids), max_ids_per_rpc)]
+    headers = {}
+    for header_slice in await asyncio.gather(*[get_dataset_headers_by_id(context, id_slice) for id_slice in slices]):
+        headers.update(header_slice)
+    return headers
+
+# ============================================================================
+
+_DOWNLOAD_LOCK_POLL_SECONDS = 0.05
+
+_LOOP_DOWNLOAD_LOCKS = weakref.WeakKeyDictionary()   # { event_loop : { localpath : [asyncio.Lock(), count] } }
+
+@contextlib.asynccontextmanager
+async def _download_lock(localpath):
+    """Hold the lock serializing downloads of `localpath` by the coroutines of the
+    running event loop,  and then api's lock serializing them with other threads.
+    Coroutines queue on an asyncio.Lock while the api lock is polled,  so neither
+    blocks the event loop.   Like api's locks,  these are dropped once unused.
+    """
+    locks = _LOOP_DOWNLOAD_LOCKS.setdefault(asyncio.get_running_loop(), {})
+    entry = locks.setdefault(localpath, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            lock = api._get_download_lock(localpath)
+            try:
+                while not lock.acquire(blocking=False):
+                    await asyncio.sleep(_DOWNLOAD_LOCK_POLL_SECONDS)
+                try:
+                    yield
+                finally:
+                    lock.release()
+            finally:
+                api._put_download_lock(localpath)
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del locks[localpath]
+
+class AsyncFileCacher(api.FileCacher):
+    """AsyncFileCacher gets remote files with simple names into a local cache,
+    downloading them concurrently.
+    """
+    async def get_local_files(self, names):
+        """Given a list of basename `mapping_names` which are pertinent to the
+        given `pipeline_context`,   cache the mappings locally where they can
+        be used by CRDS.
+        """
+        localpaths, downloads = self.find_downloads(names)
+        if downloads:
+            n_bytes = await self.download_files(downloads, localpaths)
+        else:
+            log.verbose("Skipping download for cached files", sorted(localpaths), verbosity=60)
+            n_bytes = 0
+        return localpaths, len(downloads), n_bytes
+
+    async def download_files(self, downloads, localpaths):
+        """Concurrent file-by-file download."""
+        downloads = list(dict.fromkeys(downloads))
+        info_map = await get_file_info_map(self.observatory, downloads, ["size", "sha1sum"])
+        self.info_map = {}
+        for filename in downloads:
+            self.info_map[filename] = info_map.get(filename, "NOT FOUND unknown to server")
+        if config.writable_cache_or_verbose("Readonly cache, skipping download of (first 5):", repr(downloads[:5]), verbosity=70):
+            progress = _Progress(len(downloads), api.get_total_bytes(self.info_map))
+            results = await asyncio.gather(
+                *[self._fetch(name, localpaths[name], progress) for name in downloads], return_exceptions=True)
+            bytes_so_far = 0
+            for name, result in zip(downloads, results):
+                if isinstance(result, BaseException):
+                    if self.raise_exceptions:
+                        raise result
+                    else:
+                        log.error("Failure downloading file", repr(name), ":", str(result))
+                else:
+                    bytes_so_far += result
+            return bytes_so_far
+        return 0
+
+    async def _fetch(self, name, path, progress):
+        """Download file `name` to `path`,  reporting it to `progress`,  and return its size."""
+        if "NOT FOUND" in self.info_map[name]:
+            raise CrdsDownloadError("file is not known to CRDS server.")
+        async with _limiter():
+            log.info(progress.start("Fetching", name, path, self.catalog_file_size(name)))
+            await self.download(name, path)
+        size = os.stat(path).st_size
+        progress.done(size)
+        return size
+
+    async def download(self, name, localpath):
+        """Download a single file.   Coroutines and threads downloading the same
+        `localpath` take turns,  and only the first one fetches it.
+        """
+        async with _download_lock(localpath):
+            if os.path.exists(localpath):
+                log.verbose("Skipping download of", repr(name), "already fetched by another thread.")
+                return None
+            return await self._download(name, localpath)
+
+    async def _download(self, name, localpath):
+        """Download a single file."""
+        assert not config.get_cache_readonly(), "Readonly cache,  cannot download files " + repr(name)
+        try:
+            utils.ensure_dir_exists(localpath)
+            return await apply_with_retries(self.download_core, name, localpath)
+        except Exception as exc:
+            self.remove_file(localpath)
+            raise CrdsDownloadError(
+                "Error fetching data for", srepr(name),
+                "at CRDS server", srepr(api.get_crds_server()),
+                "with mode", srepr(config.get_download_mode()),
+                ":", str(exc)) from exc
+        except:  #  mainly for cancellation,  catch it and throw it.
+            self.remove_file(localpath)
+            raise
+
+    async def download_core(self, name, localpath):
+        """Download and verify file `name` under context `pipeline_context` to `localpath`."""
+        if config.get_download_plugin():
+            await self.plugin_download(name, localpath)
+            self.verify_file(name, localpath)
+        else:
+            sha1sum = await self.http_download(name, localpath)
+            self.verify_file(name, localpath, sha1sum)
+
+    async def http_download(self, filename, localpath):
+        """Download `filename` to `localpath` over HTTP and return its sha1sum."""
+        url = self.get_url(filename)
+        xsum = hashlib.sha1()
+        try:
+            async with await urlopen(url) as infile:
+                with open(localpath, "wb+") as outfile:
+                    async for data in infile.iter_data():
+                        xsum.update(data)
+                        outfile.write(data)
+        except Exception as exc:
+            raise CrdsDownloadError(
+                "Failed downloading", srepr(filename),
+                "from url", srepr(url), ":", str(exc)) from exc
+        return xsum.hexdigest()
+
+    async def plugin_download(self, filename, localpath):
+        """Run an external program defined by CRDS_DOWNLOAD_PLUGIN to download filename to
+        localpath,  killing it if the download is cancelled.
+        """
+        plugin_cmd = self.get_plugin_command(filename, localpath)
+        log.verbose("Running download plugin:", repr(plugin_cmd))
+        process = await asyncio.create_subprocess_shell(plugin_cmd)
+        try:
+            status = await process.wait()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            raise
+        self.check_plugin_status(status, plugin_cmd)
+
+class _Progress:
+    """Tracks the files and bytes of concurrent downloads for progress messages."""
+    def __init__(self, total_files, total_bytes):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.started = 0
+        self.bytes_so_far = 0
+
+    def start(self, activity, name, path, size):
+        """Return the progress message for starting `activity` on file `name`."""
+        message = api.file_progress(activity, name, path, size, self.bytes_so_far, self.total_bytes,
+                                    self.started, self.total_files)
+        self.started += 1
+        return message
+
+    def done(self, size):
+        """Record a completed file of `size` bytes."""
+        self.bytes_so_far += size
+
+# ============================================================================
+
+async def dump_files(pipeline_context, files, ignore_cache=False, raise_exceptions=True):
+    """Download mapping or reference `files` with respect to `pipeline_context`,
+    returning ({ name : localpath }, n_downloaded, n_bytes).
+    """
+    return await AsyncFileCacher(pipeline_context, ignore_cache, raise_exceptions).get_local_files(list(files))
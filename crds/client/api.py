@@ -8,10 +8,11 @@ import base64
 import re
 import zlib
 import html
-from urllib import request
 import warnings
 import json
 import ast
+import threading
+import contextlib
 
 # ==============================================================================
 
@@ -25,7 +26,7 @@ from crds.core.exceptions import ServiceError, CrdsLookupError
 from crds.core.exceptions import CrdsNetworkError, CrdsDownloadError
 from crds.core.exceptions import CrdsRemoteContextError
 
-from . import proxy
+from . import proxy, transport
 from .proxy import CheckingProxy
 
 # ==============================================================================
@@ -554,6 +555,43 @@ def file_progress(activity, name, path, bytes, bytes_so_far, total_bytes, nth_fi
 
 # ==============================================================================
 
+_DOWNLOAD_LOCKS = {}   # { localpath : [threading.Lock(), count of threads holding or waiting] }
+_DOWNLOAD_LOCKS_LOCK = threading.Lock()
+
+@contextlib.contextmanager
+def _download_lock(localpath):
+    """Hold the lock serializing downloads of `localpath` by the threads of this process.
+    The lock is dropped when no thread holds or waits for it,  so only the paths being
+    downloaded have locks.
+    """
+    lock = _get_download_lock(localpath)
+    try:
+        with lock:
+            yield
+    finally:
+        _put_download_lock(localpath)
+
+def _get_download_lock(localpath):
+    """Return the lock serializing downloads of `localpath`,  counting the caller as
+    holding or waiting for it until _put_download_lock().
+    """
+    with _DOWNLOAD_LOCKS_LOCK:
+        entry = _DOWNLOAD_LOCKS.setdefault(localpath, [threading.Lock(), 0])
+        entry[1] += 1
+    return entry[0]
+
+def _put_download_lock(localpath):
+    """Stop counting the caller of _get_download_lock(),  dropping the lock of `localpath`
+    once no one holds or waits for it.
+    """
+    with _DOWNLOAD_LOCKS_LOCK:
+        entry = _DOWNLOAD_LOCKS[localpath]
+        entry[1] -= 1
+        if not entry[1]:
+            del _DOWNLOAD_LOCKS[localpath]
+
+# ==============================================================================
+
 class FileCacher:
     """FileCacher gets remote files with simple names into a local cache."""
     def __init__(self, pipeline_context, ignore_cache=False, raise_exceptions=True):
@@ -568,6 +606,19 @@ class FileCacher:
         given `pipeline_context`,   cache the mappings locally where they can
         be used by CRDS.
         """
+        localpaths, downloads = self.find_downloads(names)
+        if downloads:
+            n_bytes = self.download_files(downloads, localpaths)
+        else:
+            log.verbose("Skipping download for cached files", sorted(localpaths), verbosity=60)
+            n_bytes = 0
+        return localpaths, len(downloads), n_bytes
+
+    def find_downloads(self, names):
+        """Return ({ name : localpath }, [ name_to_download, ... ]) for file basenames
+        `names`,  removing cached files which will be downloaded again if ignore_cache
+        is set.
+        """
         if isinstance(names, dict):
             names = names.values()
         localpaths = {}
@@ -590,12 +641,7 @@ class FileCacher:
                 downloads.append(name)
                 utils.remove(localpath, observatory=self.observatory)
             localpaths[name] = localpath
-        if downloads:
-            n_bytes = self.download_files(downloads, localpaths)
-        else:
-            log.verbose("Skipping download for cached files", sorted(names), verbosity=60)
-            n_bytes = 0
-        return localpaths, len(downloads), n_bytes
+        return localpaths, downloads
 
     def observatory_from_context(self):
         """Determine the observatory from `pipeline_context`,  based on name if possible."""
@@ -642,6 +688,16 @@ class FileCacher:
         return 0
 
     def download(self, name, localpath):
+        """Download a single file.   Threads downloading the same `localpath` take
+        turns,  and only the first one fetches it.
+        """
+        with _download_lock(localpath):
+            if os.path.exists(localpath):
+                log.verbose("Skipping download of", repr(name), "already fetched by another thread.")
+                return None
+            return self._download(name, localpath)
+
+    def _download(self, name, localpath):
         """Download a single file."""
         # This code is complicated by the desire to blow away failed downloads.  For the specific
         # case of KeyboardInterrupt,  the file needs to be blown away,  but the interrupt should not
@@ -687,14 +743,23 @@ class FileCacher:
 
     def plugin_download(self, filename, localpath):
         """Run an external program defined by CRDS_DOWNLOAD_PLUGIN to download filename to localpath."""
+        plugin_cmd = self.get_plugin_command(filename, localpath)
+        log.verbose("Running download plugin:", repr(plugin_cmd))
+        status = os.WEXITSTATUS(os.system(plugin_cmd))
+        self.check_plugin_status(status, plugin_cmd)
+
+    def get_plugin_command(self, filename, localpath):
+        """Return the CRDS_DOWNLOAD_PLUGIN command line which downloads filename to localpath."""
         url = self.get_url(filename)
         plugin_cmd = config.get_download_plugin()
         plugin_cmd = plugin_cmd.replace("${SOURCE_URL}", url)
         plugin_cmd = plugin_cmd.replace("${OUTPUT_PATH}", localpath)
         plugin_cmd = plugin_cmd.replace("${FILE_SIZE}", self.info_map[filename]["size"])
         plugin_cmd = plugin_cmd.replace("${FILE_SHA1SUM}", self.info_map[filename]["sha1sum"])
-        log.verbose("Running download plugin:", repr(plugin_cmd))
-        status = os.WEXITSTATUS(os.system(plugin_cmd))
+        return plugin_cmd
+
+    def check_plugin_status(self, status, plugin_cmd):
+        """Raise an exception if download plugin `plugin_cmd` exited with nonzero `status`."""
         if status != 0:
             if status == 2:
                 raise KeyboardInterrupt("Interrupted plugin.")
@@ -707,7 +772,7 @@ class FileCacher:
         """Yield the data returned from `filename` of `pipeline_context` in manageable chunks."""
         url = self.get_url(filename)
         try:
-            infile = request.urlopen(url)
+            infile = transport.urlopen(url)
             file_size = utils.human_format_number(self.catalog_file_size(filename)).strip()
             stats = utils.TimingStats()
             data = infile.read(config.CRDS_DATA_CHUNK_SIZE)
@@ -732,8 +797,10 @@ class FileCacher:
         """Return the URL used to fetch `filename` of `pipeline_context`."""
         return get_flex_uri(filename, self.observatory)
 
-    def verify_file(self, filename, localpath):
-        """Check that the size and checksum of downloaded `filename` match the server."""
+    def verify_file(self, filename, localpath, local_sha1sum=None):
+        """Check that the size and checksum of downloaded `filename` match the server.
+        `local_sha1sum` is computed from `localpath` unless it was computed during download.
+        """
         remote_info = self.info_map[filename]
         local_length = os.stat(localpath).st_size
         original_length = int(remote_info["size"])
@@ -745,7 +812,8 @@ class FileCacher:
             log.verbose("Skipping sha1sum with CRDS_DOWNLOAD_CHECKSUMS=False")
         elif remote_info["sha1sum"] not in ["", "none"]:
             original_sha1sum = remote_info["sha1sum"]
-            local_sha1sum = utils.checksum(localpath)
+            if local_sha1sum is None:
+                local_sha1sum = utils.checksum(localpath)
             if original_sha1sum != local_sha1sum:
                 raise CrdsDownloadError(
                     "downloaded file", srepr(filename),
@@ -16,6 +16,8 @@ import base64
 # import crds
 from crds.core import exceptions, log, config
 
+from . import transport
+
 # ============================================================================
 
 def init_urlopen():
@@ -106,6 +108,12 @@ class ServiceCallBinding:
 
     def _call(self, *args, **kwargs):
         """Core of RPC dispatch without error interpretation, logging, or return value decoding."""
+        parameters, url = self._prepare_call(args, kwargs)
+        response = apply_with_retries(self._call_service, parameters, url)
+        return self._load_response(response)
+
+    def _prepare_call(self, args, kwargs):
+        """Return the JSON encoded parameters and URL of a call with `args` or `kwargs`."""
         params = kwargs if len(kwargs) else args
         jsonrpc_params = {"jsonrpc": self.__version,
                           "method": self.__service_name,
@@ -125,8 +133,10 @@ class ServiceCallBinding:
         else:
             log.verbose("CRDS JSON RPC to", url, "parameters", params, "-->")
 
-        response = apply_with_retries(self._call_service, parameters, url)
+        return parameters, url
 
+    def _load_response(self, response):
+        """Load the JSONRPC response dict from the text of `response`."""
         try:
             rval = json.loads(response)
         except Exception as exc:
@@ -148,13 +158,21 @@ class ServiceCallBinding:
         if not isinstance(parameters, bytes):
             parameters = parameters.encode("utf-8")
         try:
-            channel = request.urlopen(url, parameters, timeout=timeout)
-            return channel.read().decode("utf-8")
+            with transport.urlopen(url, parameters, timeout=timeout) as channel:
+                return channel.read().decode("utf-8")
         except Exception as exc:
-            raise exceptions.ServiceError("CRDS jsonrpc failure " + repr(self.__service_name) + " " + str(exc)) from exc
+            raise self._service_error(exc) from exc
+
+    def _service_error(self, exc):
+        """Return the ServiceError reporting that calling this service failed with `exc`."""
+        return exceptions.ServiceError("CRDS jsonrpc failure " + repr(self.__service_name) + " " + str(exc))
 
     def __call__(self, *args, **kwargs):
         jsonrpc = self._call(*args, **kwargs)
+        return self._get_result(jsonrpc)
+
+    def _get_result(self, jsonrpc):
+        """Return the decoded result of JSONRPC response dict `jsonrpc` or raise its error."""
         if jsonrpc["error"]:
             decoded = html.unescape(jsonrpc["error"]["message"])
             raise self.classify_exception(decoded)
@@ -0,0 +1,308 @@
+"""This module defines the HTTP transport used by the CRDS client for JSON RPC
+calls and file downloads.   urlopen() works like urllib.request.urlopen() but
+reuses keep-alive connections from a ConnectionPool shared by all threads,  so
+that a series of requests to the same server pays for one TCP and TLS handshake
+rather than one per request:
+
+>> with transport.urlopen(url, parameters, timeout=timeout) as channel:
+..     response = channel.read()
+
+A connection returns to the pool once its response has been read completely or
+closed.   Connections the server dropped while idle are replaced transparently;
+other failures raise as they would from urllib so that callers can retry them
+with proxy.apply_with_retries().   Requests send urllib's User-Agent,  verify
+HTTPS servers with urllib's default SSL context,  and follow redirects by the
+rules of urllib.request.HTTPRedirectHandler.
+
+CRDS_CLIENT_KEEP_ALIVE=False,  URLs other than http:// or https://,  and
+servers reached through a proxy configured by environment variables use
+urllib.request.urlopen() instead.   CRDS_CLIENT_POOL_SIZE limits the idle
+connections kept per server.
+"""
+import io
+import os
+import socket
+import string
+import threading
+import http.client
+from urllib import request, error, parse
+
+# ============================================================================
+
+from crds.core import log, config
+
+# ============================================================================
+
+__all__ = [
+    "urlopen",
+    "ConnectionPool",
+    "get_pool",
+    "reset_pool",
+    ]
+
+# ============================================================================
+
+USER_AGENT = "Python-urllib/" + request.__version__   # as sent by urllib.request.urlopen()
+
+# Redirect statuses followed by GET requests,  and the subset after which a POST is redirected as a GET.
+# Like urllib,  POSTs redirected by 307 or 308 raise HTTPError.
+_GET_REDIRECTS = (301, 302, 303, 307, 308)
+_POST_REDIRECTS = (301, 302, 303)
+
+# Exceptions indicating that a reused connection was closed by the server
+# before it read the request.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+class ConnectionPool:
+    """Keeps idle keep-alive HTTP connections for reuse,  at most `maxsize` per server.
+    Connections are checked out by one thread at a time.
+    """
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize if maxsize is not None else config.CLIENT_POOL_SIZE.get()
+        self.connections = 0    # count of connections opened
+        self._idle = {}         # { (scheme, host, port) : [ idle_connection, ... ] }
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(maxsize={}, connections={})".format(self.maxsize, self.connections)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def request(self, url, data=None, timeout=None):
+        """Send a POST of bytes `data`,  or a GET if `data` is None,  to `url` and
+        return its PooledResponse,  following redirects by urllib's rules:  POSTs
+        redirected by 301, 302, or 303 are repeated as GETs,  while POSTs redirected
+        by 307 or 308,  redirects to schemes other than http, https, or ftp,  and
+        redirect loops raise HTTPError.
+
+        Raises urllib.error.HTTPError for HTTP error statuses.
+        """
+        visited = {}   # { redirected url : times visited }
+        while True:
+            response = self._request(url, data, timeout)
+            location = response.headers.get("location") or response.headers.get("uri")
+            if response.status in _GET_REDIRECTS and location:
+                new_url = _next_url(url, data, response, location, visited)
+                response.read()
+                url, data = new_url, None
+                if not _use_pool(url):
+                    return request.urlopen(url, timeout=timeout)
+                continue
+            if response.status >= 400:
+                raise _http_error(url, response)
+            return response
+
+    def _request(self, url, data, timeout):
+        """Send one request for `url` on a pooled connection and return its PooledResponse,
+        trying another connection whenever a reused one turns out to be stale.
+        """
+        parts = parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        headers = {"Host" : parts.netloc, "User-Agent" : USER_AGENT,
+                   "Connection" : "keep-alive", "Accept-Encoding" : "identity"}
+        if data is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        while True:
+            connection, reused = self._get(key, timeout)
+            try:
+                connection.request("GET" if data is None else "POST", path, body=data, headers=headers)
+                response = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS as exc:
+                connection.close()
+                if not reused:
+                    raise
+                log.verbose("Replacing stale keep-alive connection to", repr(key), ":", str(exc), verbosity=70)
+                continue
+            except BaseException:
+                connection.close()
+                raise
+            return PooledResponse(self, key, connection, response, url)
+
+    def _get(self, key, timeout):
+        """Return (connection, reused) for server `key`,  reusing an idle connection if possible."""
+        with self._lock:
+            idle = self._idle.get(key)
+            connection = idle.pop() if idle else None
+            if connection is None:
+                self.connections += 1
+        if connection is not None:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection, True
+        scheme, host, port = key
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(host, port, timeout=timeout)   # urllib's default context
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        return connection, False
+
+    def _put(self, key, connection):
+        """Return `connection` to server `key` to the pool,  or close it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+def _next_url(url, data, response, location, visited, body=None):
+    """Return the URL to request next for `response` to `url` redirecting to `location`,
+    counting it in `visited` { redirected url : times visited },  or raise the HTTPError
+    urllib raises for following it.   POSTed `data` is not sent again.   `body` is the
+    already read body of `response`,  if any.
+    """
+    if data is not None and response.status not in _POST_REDIRECTS:
+        raise _http_error(url, response, body=body)
+    new_url = _redirect_url(url, location, response, body)
+    if (visited.get(new_url, 0) >= request.HTTPRedirectHandler.max_repeats or
+        len(visited) >= request.HTTPRedirectHandler.max_redirections):
+        raise _http_error(url, response, request.HTTPRedirectHandler.inf_msg + response.reason, body)
+    visited[new_url] = visited.get(new_url, 0) + 1
+    return new_url
+
+def _redirect_url(url, location, response, body=None):
+    """Return the absolute URL redirected to by `location` in `response` to `url`,
+    quoted like urllib,  raising HTTPError for schemes urllib will not follow.
+    """
+    parts = parse.urlparse(location)
+    if parts.scheme not in ("http", "https", "ftp", ""):
+        raise _http_error(location, response,
+                          "{} - Redirection to url '{}' is not allowed".format(response.reason, location), body)
+    if not parts.path and parts.netloc:
+        parts = parts._replace(path="/")
+    location = parse.quote(parse.urlunparse(parts), encoding="iso-8859-1", safe=string.punctuation)
+    return parse.urljoin(url, location)
+
+def _http_error(url, response, reason=None, body=None):
+    """Return the HTTPError reporting `response` to `url`,  reading its body unless
+    it was already read as `body`.
+    """
+    body = io.BytesIO(response.read() if body is None else body)
+    return error.HTTPError(url, response.status, reason or response.reason, response.headers, body)
+
+class PooledResponse:
+    """The response to a request on a pooled connection,  readable like the file
+    object returned by urllib.request.urlopen().   Its connection is released to
+    the pool when the response has been completely read or is closed.
+    """
+    def __init__(self, pool, key, connection, response, url):
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(url={}, status={})".format(repr(self.url), self.status)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def getcode(self):
+        """Return the HTTP status of this response."""
+        return self.status
+
+    def geturl(self):
+        """Return the final URL of this response."""
+        return self.url
+
+    def info(self):
+        """Return the headers of this response."""
+        return self.headers
+
+    def read(self, amt=None):
+        """Return up to `amt` bytes of the response,  or all of it if `amt` is None."""
+        if self._connection is None:
+            return b""
+        data = self._response.read(amt)
+        if self._response.isclosed():
+            self._release()
+        return data
+
+    def close(self):
+        """Release this response's connection,  closing it unless the response was completely read."""
+        if self._connection is not None:
+            if not self._response.isclosed():
+                self._connection.close()
+                self._connection = None
+            else:
+                self._release()
+
+    def _release(self):
+        """Return the connection of this completely read response to the pool."""
+        connection, self._connection = self._connection, None
+        if self._response.will_close:
+            connection.close()
+        else:
+            self._pool._put(self._key, connection)
+
+# ============================================================================
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool():
+    """Return the ConnectionPool shared by the threads of this process."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool()
+        return _POOL
+
+def reset_pool():
+    """Close the idle connections of the shared ConnectionPool and start a new one,
+    e.g. after changing CRDS_CLIENT_POOL_SIZE.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.close()
+
+def _forget_pool():
+    """Drop the shared pool inherited by a forked child without closing the parent's connections."""
+    global _POOL, _POOL_LOCK
+    _POOL = None
+    _POOL_LOCK = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_pool)
+
+def urlopen(url, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """Open `url` like urllib.request.urlopen(),  POSTing bytes `data` if it is not
+    None,  using a pooled keep-alive connection where possible.
+    """
+    if not _use_pool(url):
+        return request.urlopen(url, data, timeout=timeout)
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = socket.getdefaulttimeout()
+    return get_pool().request(url, data, timeout)
+
+def _use_pool(url):
+    """Return True if `url` should be requested on a pooled connection."""
+    return config.CLIENT_KEEP_ALIVE.get() and _is_direct(url)
+
+def _is_direct(url):
+    """Return True if `url` is http:// or https:// and its server is not reached
+    through a proxy configured by environment variables.
+    """
+    parts = parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    return parts.scheme not in request.getproxies() or bool(request.proxy_bypass(parts.hostname))
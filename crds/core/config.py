@@ -7,6 +7,8 @@ import os.path
 import re
 import glob
 import getpass
+import threading
+import contextlib
 import configparser
 
 # ===========================================================================
@@ -545,7 +547,11 @@ def locate_pickle(mapping, observatory=None):
         return mapping
     if observatory is None:
         observatory = mapping_to_observatory(mapping)
-    return os.path.join(get_crds_picklepath(observatory), mapping + ".pkl")
+    return os.path.join(get_crds_picklepath(observatory), mapping + get_pickle_extension())
+
+def get_pickle_extension():
+    """Return the file extension of context pickles in CRDS_CONTEXT_PICKLE_FORMAT."""
+    return ".snap" if CONTEXT_PICKLE_FORMAT.get() == "snapshot" else ".pkl"
 
 USE_PICKLED_CONTEXTS = BooleanConfigItem("CRDS_USE_PICKLED_CONTEXTS", False,
     "When True,  CRDS contexts should be loaded from a pickled version if possible.")
@@ -553,13 +559,66 @@ USE_PICKLED_CONTEXTS = BooleanConfigItem("CRDS_USE_PICKLED_CONTEXTS", False,
 AUTO_PICKLE_CONTEXTS = BooleanConfigItem("CRDS_AUTO_PICKLE_CONTEXTS", False,
     "When True, CRDS contexts should be automatically pickled and cached after loading.")
 
+CONTEXT_PICKLE_FORMAT = StrConfigItem("CRDS_CONTEXT_PICKLE_FORMAT", "pickle",
+    "Format of saved contexts:  'pickle' for the loaded objects, 'snapshot' for compact, lazily loaded mapping tables.",
+    valid_values=["pickle", "snapshot"], lower=True)
+
+PARTITIONED_PICKLES = BooleanConfigItem("CRDS_PARTITIONED_PICKLES", False,
+    "When True, pipeline context pickles are saved as a small .pmap stub plus one pickle per .imap loaded as instruments are used.")
+
+PICKLE_MERGED_SELECTORS = BooleanConfigItem("CRDS_PICKLE_MERGED_SELECTORS", False,
+    "When True, equally weighted Match selections are merged before a context is pickled so warm starts reuse them,  at the cost of larger pickles and slower saves.")
+
 # -------------------------------------------------------------------------------------
 
+SHARED_CONTEXTS = BooleanConfigItem("CRDS_SHARED_CONTEXTS", False,
+    "When True, contexts published in shared memory by crds.heavy_client.publish_shared_context() are attached read only instead of loaded.")
+
+PARSED_MAPPING_CACHE = BooleanConfigItem("CRDS_PARSED_MAPPING_CACHE", False,
+    "When True, parsed mappings are cached by sha1sum under the pickle directory and reused by any context which refers to them.")
+
+VERIFIED_REGISTRY = StrConfigItem("CRDS_VERIFIED_REGISTRY", "auto",
+    "Trust the sha1sums of mappings whose path, size, and mtime match the cache's verified file registry: 'auto' for readonly caches, 'true', or 'false' to neither use nor update it.",
+    valid_values=["auto", "true", "false"], lower=True)
+
+def use_verified_registry():
+    """Return True IFF mappings listed unchanged in the verified file registry
+    should be loaded without rehashing them.
+    """
+    mode = VERIFIED_REGISTRY.get()
+    return mode == "true" or (mode == "auto" and get_cache_readonly())
+
+PRELOAD_WORKERS = IntConfigItem("CRDS_PRELOAD_WORKERS", 0,
+    "Number of threads used to read and parse the mappings of a pipeline context concurrently before it is pickled.  0 disables.")
+
+BESTREFS_PROCESSES = IntConfigItem("CRDS_BESTREFS_PROCESSES", 1,
+    "Number of worker processes crds.bestrefs uses to compute best references locally.  0 uses one per CPU.")
+
+BESTREFS_CHUNK_SIZE = IntConfigItem("CRDS_BESTREFS_CHUNK_SIZE", 100,
+    "Number of datasets sent to a bestrefs worker process at a time.")
+
+PROCESS_START_METHOD = StrConfigItem("CRDS_PROCESS_START_METHOD", "auto",
+    "Multiprocessing start method of bestrefs worker processes:  'auto' forks where possible so workers share preloaded contexts.",
+    valid_values=["auto", "fork", "spawn", "forkserver"], lower=True)
+
 FORCE_COMPLETE_LOAD = BooleanConfigItem("CRDS_FORCE_COMPLETE_LOAD", False,
     "When True, force CRDS contexts to load in their entirety rather than based on what is actually used.")
 
 EXPLICIT_GARBAGE_COLLECTION = BooleanConfigItem("CRDS_EXPLICIT_GARBAGE_COLLECTION", True,
     "When False, the @gc_collected function decorator skips garbage collection.")
+
+BESTREF_CACHE_SIZE = IntConfigItem("CRDS_BESTREF_CACHE_SIZE", 1000,
+    "Number of distinct parameter sets for which each loaded rmap remembers its bestref result.  0 disables.")
+
+CACHED_FUNCTION_SIZE = IntConfigItem("CRDS_CACHED_FUNCTION_SIZE", 0,
+    "Default number of results each @utils.cached function remembers, least recently used discarded first.  0 is unbounded.")
+
+MERGE_CACHE_SIZE = IntConfigItem("CRDS_MERGE_CACHE_SIZE", 1000,
+    "Number of merged selector groups each Match selector remembers.  0 disables.")
+
+MAPPING_LOADER = StrConfigItem("CRDS_MAPPING_LOADER", "exec",
+    "Loader for mapping files:  'exec' compiles and executes it,  'ast' evaluates the checked parse tree without exec.",
+    valid_values=["ast", "exec"], lower=True)
 # -------------------------------------------------------------------------------------
 
 def get_sqlite3_db_path(observatory):
@@ -641,9 +700,37 @@ def get_crds_processing_mode():
 
 # CRDS_CONTEXT = StrConfigItem("CRDS_CONTEXT", default=None)
 
+_THREAD_STATE = threading.local()
+
+def get_thread_context():
+    """Return the context which overrides CRDS_CONTEXT for the calling thread,  or None."""
+    return getattr(_THREAD_STATE, "context", None)
+
+@contextlib.contextmanager
+def thread_context(context):
+    """Within the with-block,  `context` overrides CRDS_CONTEXT for the calling
+    thread only,  so threads serving different requests can use different
+    default contexts without changing os.environ.
+
+    >>> with thread_context("jwst_0042.pmap"):
+    ...     get_crds_env_context()
+    'jwst_0042.pmap'
+    >>> get_crds_env_context()
+    """
+    if context:
+        assert is_context_spec(context), \
+            "Only override CRDS_CONTEXT with a literal or symbolic context (.pmap),  not " + repr(context)
+    old_context = get_thread_context()
+    _THREAD_STATE.context = context
+    try:
+        yield
+    finally:
+        _THREAD_STATE.context = old_context
+
 def get_crds_env_context():
-    """If it has been specified in the environment by CRDS_CONTEXT,  return the
-    pipeline context which defines CRDS best reference rules,  else None.
+    """If it has been specified for the calling thread by thread_context() or in
+    the environment by CRDS_CONTEXT,  return the pipeline context which defines
+    CRDS best reference rules,  else None.
 
     >>> os.environ["CRDS_CONTEXT"] = "jwst.pmap"
     >>> get_crds_env_context()
@@ -658,6 +745,9 @@ def get_crds_env_context():
     >>> del os.environ["CRDS_CONTEXT"]
     >>> get_crds_env_context()
     """
+    context = get_thread_context()
+    if context:
+        return context
     context = os.environ.get("CRDS_CONTEXT", None)
     if context:
         assert is_context_spec(context), \
@@ -787,6 +877,19 @@ CLIENT_TIMEOUT = IntConfigItem(
 def get_client_timeout_seconds():
     return CLIENT_TIMEOUT.get()
 
+CLIENT_MAX_CONCURRENCY = IntConfigItem(
+    "CRDS_CLIENT_MAX_CONCURRENCY", 8, "Maximum number of CRDS network requests crds.client.aio makes at once per event loop.")
+
+def get_client_max_concurrency():
+    """Return the maximum number of concurrent asyncio network requests."""
+    return max(CLIENT_MAX_CONCURRENCY.get(), 1)
+
+CLIENT_KEEP_ALIVE = BooleanConfigItem(
+    "CRDS_CLIENT_KEEP_ALIVE", True, "When True, CRDS JSON RPC calls and HTTP downloads reuse pooled keep-alive connections.")
+
+CLIENT_POOL_SIZE = IntConfigItem(
+    "CRDS_CLIENT_POOL_SIZE", 4, "Maximum number of idle keep-alive connections kept open per server.")
+
 def enable_retries(retry_count=20, delay_seconds=10):
     """Set reasonable defaults for CRDS retries"""
     CLIENT_RETRY_COUNT.set(retry_count)
@@ -79,6 +79,9 @@ class LazyFileDict(TransformedDict):
 
     Values included in special_values_set are excluded from nested loading
     and kept as literals,  e.g. N/A
+
+    Threads may demand load the same key concurrently.   Every thread gets the
+    first value installed,  so all of them see one fully loaded value per key.
     """
 
     special_values_set = set()   # Override in sub-classes as needed
@@ -125,7 +128,7 @@ class LazyFileDict(TransformedDict):
                     val = self._xx_selector[name]
                 else:
                     val = self._xx_load_keys["loader"](self._xx_selector[name], **self._xx_load_keys)
-                super(LazyFileDict, self).__setitem__(name, val)
+                val = self._contents.setdefault(name, self.transform_value(val))
             return val
         else:
             raise KeyError(name)
@@ -135,6 +138,27 @@ class LazyFileDict(TransformedDict):
         self._xx_selector[name] = value.filename
         super(LazyFileDict, self).__setitem__(name, value)
 
+    def unloaded_items(self):
+        """Return [(key, filename), ...] for the normal keys which have not been loaded yet.
+
+        NOTE:  Does not require full load.
+        """
+        return [(key, self._xx_selector[key]) for key in self.normal_keys() if key not in self._contents]
+
+    def loaded_values(self):
+        """Return the normal values which have already been loaded.
+
+        NOTE:  Does not require full load.
+        """
+        return [self._contents[key] for key in self.normal_keys() if key in self._contents]
+
+    def install(self, name, value):
+        """Install already loaded `value` for `name` without altering the selector,  as
+        if it had been demand loaded.   Return the value installed for `name`,  which
+        is an earlier one if `name` was loaded concurrently.
+        """
+        return self._contents.setdefault(self.transform_key(name), self.transform_value(value))
+
     def __delitem__(self, name):
         name = self.transform_key(name)
         del self._xx_selector[name]
@@ -104,6 +104,12 @@ class InconsistentParkeyError(MappingError):
 class MappingInsertionError(MappingError):
     """The insertion of a new file into a mapping (rmap) failed for some reason."""
 
+class SnapshotFormatError(MappingError):
+    """A context snapshot file is corrupt or has an unsupported version."""
+
+class FrozenMappingError(MappingError):
+    """A cached mapping shared by threads cannot be modified,  modify a copy."""
+
 # -------------------------------------------------------------------------------------------
 
 class ValidationError(CrdsError):
@@ -57,7 +57,7 @@ import pickle
 
 # ============================================================================
 
-from . import rmap, log, utils, config
+from . import rmap, log, utils, config, snapshot, mapping_cache
 from .constants import ALL_OBSERVATORIES
 from .log import srepr
 from .exceptions import CrdsError, CrdsBadRulesError, CrdsBadReferenceError, CrdsConfigError, CrdsDownloadError
@@ -68,7 +68,7 @@ from crds.client import api
 # ============================================================================
 
 __all__ = [
-    "getreferences", "getrecommendations",
+    "getreferences", "getrecommendations", "getrecommendations_many",
     "get_config_info", "update_config_info", "load_server_info",
     "get_processing_mode", "get_context_name",
     "version_info",
@@ -174,6 +174,34 @@ def getrecommendations(parameters, reftypes=None, context=None, ignore_cache=Fal
 
     return bestrefs
 
+def getrecommendations_many(headers, reftypes=None, context=None, ignore_cache=False,
+                            observatory="jwst", fast=False):
+    """
+    getrecommendations_many() returns the best references for many datasets at
+    once.   It is equivalent to calling getrecommendations() for each header but
+    resolves the context and checks `reftypes` only once,  and computes each
+    type of reference for all datasets of an instrument as a batch.
+
+    headers         { dataset_id : { str:  str,int,float,bool, ... }, ... }
+
+      `headers` should map dataset ids onto the best reference matching
+      parameters of each dataset,  as `parameters` of getrecommendations().
+
+    reftypes, context, ignore_cache, observatory, fast
+
+      are as for getrecommendations() and apply to every dataset.
+
+    Returns { dataset_id : { reftype : bestref_basename }, ... }
+
+      When computing locally,  the value of a dataset whose best references
+      cannot be computed is the exception getrecommendations() would have
+      raised for it,  so one bad dataset does not fail the others.
+    """
+    _final_context, bestrefs_map = _initial_recommendations_many("getrecommendations_many",
+        headers, reftypes, context, ignore_cache, observatory, fast)
+
+    return bestrefs_map
+
 def _initial_recommendations(
         name, parameters, reftypes=None, context=None, ignore_cache=False, observatory="jwst", fast=False):
 
@@ -225,6 +253,54 @@ def _initial_recommendations(
 
     return final_context, bestrefs
 
+def _initial_recommendations_many(
+        name, headers, reftypes=None, context=None, ignore_cache=False, observatory="jwst", fast=False):
+
+    """shared logic for getrecommendations_many(),  _initial_recommendations() for
+    { dataset_id : parameters, ... }.
+    """
+
+    if not fast:
+        log.verbose("="*120)
+        log.verbose(name + "() CRDS version: ", version_info())
+        log.verbose(name + "() server:", api.get_crds_server())
+        log.verbose(name + "() observatory:", observatory)
+        log.verbose(name + "() datasets:", len(headers))
+        log.verbose(name + "() reftypes:", reftypes)
+        log.verbose(name + "() context:", repr(context))
+        log.verbose(name + "() ignore_cache:", ignore_cache)
+
+        check_observatory(observatory)
+        headers = { dataset_id : check_parameters(parameters)
+                    for (dataset_id, parameters) in headers.items() }
+        check_reftypes(reftypes)
+        check_context(context)
+
+    mode, final_context = get_processing_mode(observatory, context)
+
+    log.verbose("Final effective context is", repr(final_context))
+
+    if mode == "local":
+        log.verbose("Computing best references locally.")
+        bestrefs_map = local_bestrefs_many(
+            headers, reftypes=reftypes, context=final_context, ignore_cache=ignore_cache)
+    else:
+        log.verbose("Computing best references remotely.")
+        bestrefs_map = api.get_best_references_by_header_map(final_context, headers, reftypes=reftypes)
+
+    if not fast:
+        update_config_info(observatory)
+        log.verbose(name + "() results:\n", log.PP(bestrefs_map), verbosity=65)
+        computed = [ dataset_id for (dataset_id, bestrefs) in bestrefs_map.items()
+                     if not isinstance(bestrefs, Exception) ]
+        instruments = { utils.header_to_instrument(headers[dataset_id]) for dataset_id in computed }
+        for instrument in sorted(instruments):
+            warn_bad_context(observatory, final_context, instrument)
+        for dataset_id in computed:
+            warn_bad_references(observatory, bestrefs_map[dataset_id])
+
+    return final_context, bestrefs_map
+
 # ============================================================================
 
 # This is cached because it should only produce output *once* per program run.
@@ -355,6 +431,24 @@ def local_bestrefs(parameters, reftypes, context, ignore_cache=False):
                 "Failed caching mapping files:", str(exc)) from exc
         return hv_best_references(context, parameters, reftypes)
 
+def local_bestrefs_many(headers, reftypes, context, ignore_cache=False):
+    """Perform bestref computations for { dataset_id : parameters, ... } `headers`
+    locally as for local_bestrefs().
+    """
+    try:
+        if ignore_cache:
+            raise IOError("explicitly ignoring cache.")
+        return hv_best_references_many(context, headers, reftypes)
+    except IOError as exc:
+        log.verbose("Caching mapping files for context", srepr(context))
+        try:
+            api.dump_mappings(context, ignore_cache=ignore_cache)
+        except CrdsError as exc:
+            traceback.print_exc()
+            raise CrdsDownloadError(
+                "Failed caching mapping files:", str(exc)) from exc
+        return hv_best_references_many(context, headers, reftypes)
+
 # =============================================================================
 
 def hv_best_references(context_file, header, include=None, condition=True):
@@ -375,25 +469,64 @@ def hv_best_references(context_file, header, include=None, condition=True):
     log.verbose("Bestrefs header:\n", log.PP(minheader))
     return ctx.get_best_references(minheader, include=include)
 
+def hv_best_references_many(context_file, headers, include=None, condition=True):
+    """Compute the best references for each of { dataset_id : header, ... }
+    `headers` as hv_best_references() does,  returning { dataset_id : bestrefs, ... }.
+
+    Headers which are computed for the same set of filekinds are looked up with
+    one call to the context's get_best_references_batch(),  which groups them
+    by instrument and computes each filekind of a group as a batch.
+
+    Errors are reported per dataset:  the bestrefs of a dataset which cannot be
+    computed are the exception hv_best_references() would have raised for it.
+    """
+    ctx = get_symbolic_mapping(context_file, cached=True)
+    dataset_ids = list(headers.keys())
+    conditioned_headers = utils.condition_headers(headers.values()) if condition else headers.values()
+    groups = {}
+    bestrefs_map = {}
+    for dataset_id, conditioned in zip(dataset_ids, conditioned_headers):
+        try:
+            if include is None:
+                filekinds = set(ctx.locate.header_to_reftypes(conditioned, context_file))
+                filekinds = tuple(sorted(set(ctx.get_filekinds(conditioned)) & filekinds))
+            else:
+                filekinds = tuple(include)
+            minheader = ctx.minimize_header(conditioned)
+        except Exception as exc:
+            bestrefs_map[dataset_id] = exc
+            continue
+        ids, minheaders = groups.setdefault(filekinds, ([], []))
+        ids.append(dataset_id)
+        minheaders.append(minheader)
+    for filekinds, (ids, minheaders) in groups.items():
+        bestrefs = ctx.get_best_references_batch(minheaders, include=list(filekinds))
+        bestrefs_map.update(zip(ids, bestrefs))
+    return { dataset_id : bestrefs_map[dataset_id] for dataset_id in dataset_ids }
+
 # ============================================================================
 
 # !!!!! interface to jwst.stpipe.crds_client
 
 # Because get_processing_mode is a cached function,  it's results will not
-# change after the first call without some special action.
+# change after the first call without some special action.   A context set
+# for the calling thread by config.thread_context() is part of the cache key.
 
-@utils.cached
 def get_processing_mode(observatory, context=None):
     """Return the processing mode (local, remote) and the .pmap name to be used
     for best references selections.
     """
+    return _get_processing_mode(observatory, context, config.get_thread_context())
+
+@utils.cached
+def _get_processing_mode(observatory, context, _thread_context):
+    """Cached get_processing_mode() for the context override of the calling thread."""
     info = get_config_info(observatory)
 
     final_context = get_final_context(info, context)
 
     return info.effective_mode, final_context
 
-@utils.cached
 def get_context_name(observatory, context=None):
     """Return the .pmap name of the default context based on:
 
@@ -410,7 +543,8 @@ def get_context_name(observatory, context=None):
 def get_final_context(info, context):
     """Based on env CRDS_CONTEXT, the `context` parameter, and the server's reported,
     cached, or defaulted `operational_context`,  choose the pipeline mapping which
-    defines the reference selection rules.
+    defines the reference selection rules.   `info` is shared by all threads and is
+    not modified.
 
     Returns   a .pmap name
     """
@@ -418,12 +552,10 @@ def get_final_context(info, context):
     if context:  # context parameter trumps all, <observatory>-operational is default
         input_context = context
         log.verbose("Using reference file selection rules", srepr(input_context), "defined by caller.")
-        info.status = "context parameter"
     elif env_context:
         input_context = env_context
         log.verbose("Using reference file selection rules", srepr(input_context),
                     "defined by environment CRDS_CONTEXT.")
-        info.status = "env var CRDS_CONTEXT"
     else:
         input_context = str(info.operational_context)
         log.verbose("Using reference file selection rules", srepr(input_context), "defined by", info.status + ".")
@@ -671,6 +803,17 @@ def get_symbolic_mapping(
         abs_mapping, cached=cached, use_pickles=use_pickles, save_pickles=save_pickles, **keys)
 
 
+def get_derived_mapping(mapping, old_mapping, observatory=None, **keys):
+    """Return symbolic or literal context `mapping` loaded from the already
+    loaded context `old_mapping`,  sharing every nested mapping which did not
+    change and loading only those which did.   This lets long running services
+    switch to a new operational context without reloading it.
+
+    WARNING: symbolic names require a server connection to interpret.
+    """
+    abs_mapping = translate_date_based_context(mapping, observatory)
+    return rmap.derive_mapping(abs_mapping, old_mapping, cached=True, **keys)
+
 # ============================================================================
 
 @utils.cached   # check callers for .uncached before removing.
@@ -684,6 +827,11 @@ def get_pickled_mapping(mapping, cached=True, use_pickles=None, save_pickles=Non
         use_pickles = config.USE_PICKLED_CONTEXTS
     if save_pickles is None:
         save_pickles = config.AUTO_PICKLE_CONTEXTS
+    if config.SHARED_CONTEXTS and config.is_simple_crds_mapping(mapping):
+        try:
+            return load_shared_mapping(mapping)
+        except FileNotFoundError:
+            log.verbose("Context", repr(mapping), "is not published in shared memory,  loading it.")
     if use_pickles and config.is_simple_crds_mapping(mapping):
         try:
             loaded = load_pickled_mapping(mapping)
@@ -702,15 +850,53 @@ def load_pickled_mapping(mapping):
     Although pickles for sub-mappings may exist, only the highest level pickle
     in the hierarchy is read.  In general pickles for sub-mappings should not
     exist because of storage waste.
+
+    When CRDS_CONTEXT_PICKLE_FORMAT is "snapshot",  the pickle is a memory mapped
+    context snapshot from which nested mappings are decoded on demand.
     """
-    pickle_uri = config.get_uri(mapping + ".pkl")
+    pickle_uri = config.get_uri(mapping + config.get_pickle_extension())
     if pickle_uri == "none":
         pickle_uri = config.locate_pickle(mapping)
-    pickled = utils.get_uri_content(pickle_uri, mode="binary")
-    loaded = pickle.loads(pickled)
+    if config.CONTEXT_PICKLE_FORMAT.get() == "snapshot":
+        loaded = snapshot.load_snapshot(pickle_uri)
+    else:
+        pickled = utils.get_uri_content(pickle_uri, mode="binary")
+        loaded = pickle.loads(pickled)
     log.info("Loaded pickled context", repr(mapping))
     return loaded
 
+def load_shared_mapping(mapping):
+    """Attach to the snapshot of `mapping` published in shared memory by
+    publish_shared_context(),  returning its top level mapping.   Nested mappings
+    are decoded from the shared tables as they are used,  so worker processes
+    only hold the parts of the context they need.
+    """
+    loaded = snapshot.load_snapshot(snapshot.SHARED_PREFIX + snapshot.shared_memory_name(mapping))
+    log.verbose("Attached shared context", repr(mapping))
+    return loaded
+
+def publish_shared_context(mapping, observatory=None):
+    """Load symbolic or literal context `mapping` and publish its snapshot in
+    shared memory for worker processes which set CRDS_SHARED_CONTEXTS.
+
+    Return the SharedMemory segment,  which must be kept open for as long as
+    workers may attach and unlink()'ed when the context is retired.
+    """
+    loaded = get_symbolic_mapping(mapping, observatory=observatory)
+    return snapshot.publish_shared(loaded, snapshot.shared_memory_name(loaded.filename))
+
+def load_pickled_imap(imap, **keys):
+    """Load instrument context `imap` from its own pickle,  or from its mapping
+    file through the mapping cache if the pickle cannot be loaded.   This is the selections loader of the
+    .pmap stubs saved for CRDS_PARTITIONED_PICKLES,  so only the instruments
+    actually used by a process are unpickled.
+    """
+    try:
+        return load_pickled_mapping(os.path.basename(imap))
+    except Exception as exc:
+        log.verbose("Failed loading pickle for", repr(imap), ":", str(exc), ":  loading mapping file.")
+        return rmap.get_cached_mapping(imap, **keys)
+
 def save_pickled_mapping(mapping, loaded):
     """Save live mapping `loaded` as a pickle under named based on `mapping` name."""
     pickle_file = config.locate_pickle(mapping)
@@ -718,11 +904,36 @@ def save_pickled_mapping(mapping, loaded):
         log.verbose("Pickle file", repr(pickle_file), "is not writable,  skipping pickle save.")
         return
     with log.verbose_warning_on_exception("Failed saving pickle for", repr(mapping), "to", repr(pickle_file)):
+        if config.PRELOAD_WORKERS.get() and isinstance(loaded, rmap.PipelineContext):
+            log.verbose("Preloaded", loaded.preload(workers=config.PRELOAD_WORKERS.get()), "mappings for", repr(mapping))
         loaded.force_load()
-        pickled = pickle.dumps(loaded)
+        mapping_cache.save_verified_registry()
+        if config.CONTEXT_PICKLE_FORMAT.get() == "snapshot":
+            pickled = snapshot.dumps(loaded)
+        else:
+            if config.PICKLE_MERGED_SELECTORS:
+                log.verbose("Precomputed", loaded.precompute_merges(), "merged selector groups for", repr(mapping))
+            if config.PARTITIONED_PICKLES and isinstance(loaded, rmap.PipelineContext):
+                loaded = save_pickled_imaps(loaded)
+            pickled = pickle.dumps(loaded)
         cache_atomic_write(pickle_file, pickled, "CONTEXT PICKLE")
         log.info("Saved pickled context", repr(pickle_file))
 
+def save_pickled_imaps(pmap):
+    """Save a pickle for each instrument context of fully loaded `pmap` not already
+    pickled,  returning a stub copy of `pmap` which loads its instruments from those
+    pickles on demand.   Instrument pickles are shared by all contexts which
+    include the same .imap.
+    """
+    for key, imap_name in sorted(pmap.selector.items()):
+        if pmap.selections.is_special_value(imap_name):
+            continue
+        pickle_file = config.locate_pickle(os.path.basename(imap_name))
+        if not os.path.exists(pickle_file):
+            cache_atomic_write(pickle_file, pickle.dumps(pmap.selections[key]), "INSTRUMENT PICKLE")
+    keys = dict(pmap.keys, loader=load_pickled_imap)
+    return pmap.__class__(pmap.filename, pmap.header, pmap.selector, comment=pmap.comment, **keys)
+
 def remove_pickled_mapping(mapping):
     """Delete the pickle for `mapping` from the CRDS cache."""
     pickle_file = config.locate_pickle(mapping)
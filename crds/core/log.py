@@ -103,6 +103,18 @@ are carefully reraised so the original traceback is not destroyed.
 ...     log.write("This code should not be exected.")
 CRDS - WARNING -  Testing expected verbose warning : Force verbose warning.
 
+>>> _ = log.set_verbose(old_verbose)
+
+Verbose message arguments are formatted only when the message is output,  but
+arguments like repr(x) are computed by the caller regardless.   Guard expensive
+messages in hot code with enabled_for():
+
+>>> old_verbose = log.set_verbose(50)
+>>> log.enabled_for(50), log.enabled_for(60)
+(True, False)
+>>> if log.enabled_for(60):
+...     log.verbose("Not output", repr(list(range(1000))), verbosity=60)
+
 >>> _ = log.set_verbose(old_verbose)
 """
 import sys
@@ -197,6 +209,12 @@ class CrdsLogger:
         verbosity = keys.get("verbosity", DEFAULT_VERBOSITY_LEVEL)
         return not self.verbose_level < verbosity
 
+    def enabled_for(self, verbosity=DEFAULT_VERBOSITY_LEVEL):
+        """Return True IFF a verbose message at `verbosity` would be output.  Use this
+        to skip building expensive message arguments which would be discarded.
+        """
+        return self.verbose_level >= verbosity
+
     def verbose(self, *args, **keys):
         if self.should_output(*args, **keys):
             self.debug(*args, **keys)
@@ -283,6 +301,7 @@ warning = THE_LOGGER.warn
 verbose_warning = THE_LOGGER.verbose_warning
 verbose = THE_LOGGER.verbose
 should_output = THE_LOGGER.should_output
+enabled_for = THE_LOGGER.enabled_for
 debug = THE_LOGGER.debug
 fatal_error = THE_LOGGER.fatal_error
 status = THE_LOGGER.status
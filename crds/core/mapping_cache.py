@@ -0,0 +1,187 @@
+"""This module implements persistent caches which let processes sharing a CRDS
+cache skip mapping work another process has already done:  a content addressed
+cache of parsed mappings,  and a registry of mapping files whose checksums have
+been verified.
+
+Each mapping is stored as the pickled (header, selector, comment) it parses to,
+named by its sha1sum,  under the "parsed" subdirectory of the CRDS pickle
+directory.   Because the sha1sum covers all of the mapping text except the
+sha1sum line itself,  every file with the same checksum parses identically,
+whatever its name and whichever context refers to it.   A new context which
+shares most of its rmaps with the last one therefore only parses the few rmaps
+which changed.
+
+Parsed mappings are only saved after their checksum is verified,  so an entry
+is never stored under a checksum its text does not match.
+
+The verified file registry records the (size, mtime_ns, sha1sum) of each mapping
+file whose checksum was verified when it was loaded,  keyed by absolute path,  in
+the CRDS config area.   A load of a file whose stat and declared sha1sum still
+match its entry skips rehashing the text.   By default the registry is trusted
+only for readonly caches,  where it is saved by crds.sync.
+
+>>> text = "header = { 'sha1sum' : '0123456789abcdef0123456789abcdef01234567' }"
+>>> text_sha1sum(text)
+'0123456789abcdef0123456789abcdef01234567'
+>>> text_sha1sum("header = {}") is None
+True
+"""
+import os
+import re
+import glob
+import json
+import pickle
+
+# ============================================================================
+
+from . import log, utils, config
+from .constants import ALL_OBSERVATORIES
+
+# ============================================================================
+
+SHA1SUM_RE = re.compile(r"""['"]sha1sum['"]\s*:\s*['"]([0-9a-fA-F]{40})['"]""")
+
+def text_sha1sum(text):
+    """Return the sha1sum declared in the header of mapping `text`,  or None,
+    without parsing it.
+    """
+    match = SHA1SUM_RE.search(text)
+    return match.group(1).lower() if match else None
+
+def get_parsed_path(sha1sum, observatory):
+    """Return the path of the parsed mapping cache entry for `sha1sum`."""
+    return os.path.join(config.get_crds_picklepath(observatory), "parsed", sha1sum + ".pkl")
+
+def _parsed_path(text, basename):
+    """Return the cache path for mapping `text` named `basename`,  or None if
+    `text` declares no sha1sum or `basename` implies no known observatory.
+    """
+    sha1sum = text_sha1sum(text)
+    observatory = config.mapping_to_observatory(basename)
+    if sha1sum is None or observatory not in ALL_OBSERVATORIES:
+        return None
+    return get_parsed_path(sha1sum, observatory)
+
+def load_parsed(text, basename):
+    """Return the cached (header, selector, comment) of mapping `text` named
+    `basename`,  or None if it has not been cached.
+    """
+    path = _parsed_path(text, basename)
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as handle:
+            parsed = pickle.load(handle)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        log.verbose("Failed loading parsed mapping", repr(path), "for", repr(basename), ":", str(exc))
+        return None
+    log.verbose("Loaded parsed mapping", repr(path), "for", repr(basename), verbosity=55)
+    return parsed
+
+def save_parsed(text, basename, parsed):
+    """Save the (header, selector, comment) tuple `parsed` of mapping `text`
+    named `basename` unless it is already cached.   `text` must have been
+    verified against its sha1sum.
+    """
+    from .heavy_client import cache_atomic_write
+    path = _parsed_path(text, basename)
+    if path is not None and not os.path.exists(path):
+        with log.verbose_warning_on_exception("Failed pickling parsed mapping", repr(basename)):
+            cache_atomic_write(path, pickle.dumps(parsed), "PARSED MAPPING")
+
+def clear_parsed(observatory):
+    """Remove all the parsed mapping cache entries for `observatory`."""
+    pattern = os.path.join(config.get_crds_picklepath(observatory), "parsed", "*.pkl")
+    for path in sorted(glob.glob(pattern)):
+        utils.remove(path, observatory)
+
+# ============================================================================
+
+VERIFIED_REGISTRY_NAME = "verified_mappings.json"
+
+# { observatory : { abspath : [size, mtime_ns, sha1sum], ... }, ... }
+_VERIFIED = {}
+
+# observatories with registry entries not yet saved
+_UNSAVED = set()
+
+def get_verified_registry_path(observatory):
+    """Return the path of the verified file registry for `observatory`."""
+    return os.path.join(config.get_crds_cfgpath(observatory), VERIFIED_REGISTRY_NAME)
+
+def _load_registry(observatory):
+    """Return the verified file registry of `observatory`,  reading it once."""
+    registry = _VERIFIED.get(observatory)
+    if registry is None:
+        path = get_verified_registry_path(observatory)
+        try:
+            with open(path) as handle:
+                registry = json.load(handle)
+        except FileNotFoundError:
+            registry = {}
+        except Exception as exc:
+            log.verbose_warning("Failed loading verified file registry", repr(path), ":", str(exc))
+            registry = {}
+        registry = _VERIFIED.setdefault(observatory, registry)
+    return registry
+
+def _registry_entry(filename, text):
+    """Return (observatory, abspath, [size, mtime_ns, sha1sum]) for mapping
+    `filename` with contents `text`,  or None if it can't be registered.
+    """
+    observatory = config.mapping_to_observatory(filename)
+    sha1sum = text_sha1sum(text)
+    if sha1sum is None or observatory not in ALL_OBSERVATORIES:
+        return None
+    try:
+        stats = os.stat(filename)
+    except OSError:
+        return None
+    return observatory, os.path.abspath(filename), [stats.st_size, stats.st_mtime_ns, sha1sum]
+
+def is_verified(filename, text):
+    """Return True IFF mapping `filename` with contents `text` is listed in the
+    verified file registry with its current size, mtime, and declared sha1sum,
+    and the registry is trusted.
+    """
+    if not config.use_verified_registry():
+        return False
+    entry = _registry_entry(filename, text)
+    if entry is None:
+        return False
+    observatory, path, signature = entry
+    return _load_registry(observatory).get(path) == signature
+
+def record_verified(filename, text):
+    """Add mapping `filename` with contents `text`,  just verified against its
+    sha1sum,  to the verified file registry.
+    """
+    if config.VERIFIED_REGISTRY.get() == "false":
+        return
+    entry = _registry_entry(filename, text)
+    if entry is not None:
+        observatory, path, signature = entry
+        registry = _load_registry(observatory)
+        if registry.get(path) != signature:
+            registry[path] = signature
+            _UNSAVED.add(observatory)
+
+def save_verified_registry():
+    """Merge the new entries of the verified file registries into those saved in
+    the CRDS cache by other processes and save them.
+    """
+    from .heavy_client import cache_atomic_write
+    for observatory in sorted(_UNSAVED):
+        path = get_verified_registry_path(observatory)
+        registry = _VERIFIED.pop(observatory)
+        registry = dict(_load_registry(observatory), **registry)
+        _VERIFIED[observatory] = registry
+        cache_atomic_write(path, json.dumps(registry, sort_keys=True), "VERIFIED FILE REGISTRY")
+    _UNSAVED.clear()
+
+def clear_verified_registry():
+    """Forget the verified file registries loaded by this process."""
+    _VERIFIED.clear()
+    _UNSAVED.clear()
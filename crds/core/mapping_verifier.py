@@ -176,3 +176,113 @@ class MappingVerifier(ast.NodeVisitor):
         self.generic_visit(node)
 
 MAPPING_VERIFIER = MappingVerifier()
+
+# ===================================================================
+
+COMPARE_OPS = {
+    ast.Eq : lambda left, right: left == right,
+    ast.NotEq : lambda left, right: left != right,
+    ast.Gt : lambda left, right: left > right,
+    ast.GtE : lambda left, right: left >= right,
+    ast.Lt : lambda left, right: left < right,
+    ast.LtE : lambda left, right: left <= right,
+    ast.In : lambda left, right: left in right,
+    ast.NotIn : lambda left, right: left not in right,
+}
+
+class MappingLoader(MappingVerifier):
+    """MappingLoader checks each statement of a mapping with MappingVerifier and
+    then evaluates the restricted mapping grammar directly from the checked parse
+    tree instead of compiling and exec'ing it.
+
+    >>> namespace = MAPPING_LOADER.load('''
+    ... header = { 'name' : 'test.rmap', 'parkey' : (('DETECTOR',),) }
+    ... selector = Match({ ('HRC',) : 'foo.fits', ('WFC',) : 'bar.fits' })
+    ... ''')
+    >>> sorted(namespace)
+    ['header', 'selector']
+    >>> namespace["header"]["parkey"]
+    (('DETECTOR',),)
+    >>> namespace["selector"]
+    Match
+
+    >>> MAPPING_LOADER.load("import os")
+    Traceback (most recent call last):
+    ...
+    crds.core.exceptions.MappingFormatError: Illegal statement or expression in mapping <...Import object at ...> at line 1
+
+    >>> MAPPING_LOADER.load("selector = Match({ ('HRC',) : 'foo.fits' + 'bar' })")
+    Traceback (most recent call last):
+    ...
+    crds.core.exceptions.MappingFormatError: Unknown node type in mapping <...Add object at ...>
+    """
+    def load(self, text):
+        """Parse,  check,  and evaluate mapping `text`,  returning the namespace
+        of its header, selector, and comment definitions.
+        """
+        namespace = {}
+        for node in ast.parse(text).body:
+            self.visit(node)   # raises for anything but checked assignments and expressions
+            if isinstance(node, ast.Assign):
+                namespace[node.targets[0].id] = self.evaluate(node.value, namespace)
+            else:
+                self.evaluate(node.value, namespace)
+        return namespace
+
+    def evaluate_all(self, nodes, namespace):
+        """Return the list of values of expression `nodes`,  skipping the
+        evaluate() call for the string and number constants which make up
+        most of a mapping.   Strings are interned since the same reference
+        names,  parameter values,  and match keys recur throughout a context.
+        """
+        constant, evaluate, intern = ast.Constant, self.evaluate, sys.intern
+        return [(intern(node.value) if node.value.__class__ is str else node.value)
+                if node.__class__ is constant else evaluate(node, namespace)
+                for node in nodes]
+
+    def evaluate(self, node, namespace):
+        """Return the value of expression `node` already checked by MappingVerifier.
+        Names resolve to selectors or to sections defined earlier in `namespace`.
+        """
+        if isinstance(node, ast.Constant):
+            return sys.intern(node.value) if isinstance(node.value, str) else node.value
+        elif isinstance(node, ast.Dict):
+            return dict(zip(self.evaluate_all(node.keys, namespace),
+                            self.evaluate_all(node.values, namespace)))
+        elif isinstance(node, ast.Tuple):
+            return tuple(self.evaluate_all(node.elts, namespace))
+        elif isinstance(node, ast.List):
+            return self.evaluate_all(node.elts, namespace)
+        elif isinstance(node, ast.Call):
+            args = [self.evaluate(arg, namespace) for arg in node.args]
+            return selectors.SELECTORS[node.func.id](*args)
+        elif isinstance(node, ast.Name):
+            if node.id in namespace:
+                return namespace[node.id]
+            self.assert_(node, node.id in selectors.SELECTORS, "Undefined name " + repr(node.id))
+            return selectors.SELECTORS[node.id]
+        elif isinstance(node, ast.Compare):
+            left = self.evaluate(node.left, namespace)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.evaluate(comparator, namespace)
+                if not COMPARE_OPS[type(op)](left, right):
+                    return False
+                left = right
+            return True
+        elif isinstance(node, ast.BoolOp):
+            for value in node.values:
+                result = self.evaluate(value, namespace)
+                if isinstance(node.op, ast.And) != bool(result):
+                    break
+            return result
+        elif isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return not self.evaluate(node.operand, namespace)
+            return -self.evaluate(node.operand, namespace)
+        elif isinstance(node, ast.IfExp):
+            if self.evaluate(node.test, namespace):
+                return self.evaluate(node.body, namespace)
+            return self.evaluate(node.orelse, namespace)
+        self.assert_(node, False, "Unsupported expression in mapping " + repr(node))
+
+MAPPING_LOADER = MappingLoader()
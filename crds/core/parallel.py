@@ -0,0 +1,189 @@
+"""This module implements a parallel engine for computing best references
+locally,  sharding a stream of dataset headers across a pool of worker
+processes.
+
+Workers start from contexts which are already loaded.   With the default "fork"
+start method the contexts are loaded and preloaded in the parent process before
+the pool is created,  so every worker shares the parent's copy of them.   With
+"spawn" or "forkserver",  each worker loads the contexts itself when it starts,
+attaching to shared or pickled contexts as configured by CRDS_SHARED_CONTEXTS
+and CRDS_USE_PICKLED_CONTEXTS.
+
+Headers are sent to the workers in chunks.   Results are collected in input
+order,  and a dataset whose best references could not be computed produces its
+exception rather than stopping the rest of the stream:
+
+>> with BestrefsPool(["hst_0001.pmap"], processes=8) as pool:
+..     for dataset_id, bestrefs in pool.imap(items):
+..         ...
+
+best_references() reports each of those exceptions as an error using
+log.error_on_exception(),  just as a serial loop over hv_best_references()
+wrapped in it would.
+"""
+import os
+import pickle
+import itertools
+import collections
+import multiprocessing
+from concurrent import futures
+
+# ============================================================================
+
+from . import log, config, rmap, heavy_client
+from .exceptions import CrdsError
+
+# ============================================================================
+
+__all__ = [
+    "BestrefsPool",
+    "best_references",
+    ]
+
+# ============================================================================
+
+def get_start_method():
+    """Return the multiprocessing start method used for bestrefs worker processes."""
+    method = config.PROCESS_START_METHOD.get()
+    if method == "auto":
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    return method
+
+class BestrefsPool:
+    """Computes best references for the pipeline or instrument mappings named
+    by `contexts` using up to `processes` worker processes,  sending them
+    `chunksize` datasets at a time.
+    """
+    def __init__(self, contexts, processes=None, chunksize=None, start_method=None):
+        self.contexts = list(contexts)
+        if processes is None:
+            processes = config.BESTREFS_PROCESSES.get()
+        self.processes = processes or os.cpu_count()
+        self.chunksize = chunksize or config.BESTREFS_CHUNK_SIZE.get()
+        self.start_method = start_method or get_start_method()
+        if self.start_method == "fork":
+            _preload_contexts(self.contexts)
+            initargs = (self.contexts, None, None)
+        else:
+            initargs = (self.contexts, config.get_crds_state(), log.get_exception_trap())
+        self._executor = futures.ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker, initargs=initargs)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(contexts={}, processes={}, chunksize={}, start_method={})".format(
+            self.contexts, self.processes, self.chunksize, repr(self.start_method))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes."""
+        self._executor.shutdown(wait=True)
+
+    def imap(self, items):
+        """Compute best references for each (key, context, header, include) in
+        `items`,  as heavy_client.hv_best_references(context, header, include),
+        and generate (key, bestrefs) in the order of `items`.   If bestrefs
+        computation fails for an item,  its bestrefs is the exception raised.
+
+        Items are consumed only a few chunks ahead of the results so `items`
+        can be an arbitrarily long stream.
+        """
+        pending = collections.deque()
+        items = iter(items)
+        while True:
+            chunk = list(itertools.islice(items, self.chunksize))
+            if chunk:
+                keys = [item[0] for item in chunk]
+                work = [tuple(item[1:]) for item in chunk]
+                pending.append((keys, self._executor.submit(_compute_chunk, work)))
+            if pending and (not chunk or len(pending) > 2 * self.processes):
+                keys, future = pending.popleft()
+                yield from zip(keys, future.result())
+            elif not chunk:
+                break
+
+# ============================================================================
+
+def best_references(context, headers, include=None, processes=None, chunksize=None):
+    """Compute the best references of `context` for each of `headers`,  either a
+    dictionary or an iterable of (dataset_id, header) pairs,  on a BestrefsPool,
+    generating (dataset_id, bestrefs) in order.
+
+    Datasets which fail are reported with log.error_on_exception() and generate
+    bestrefs of None,  or raise if the CRDS exception trap is disabled.
+    """
+    if isinstance(headers, dict):
+        headers = headers.items()
+    items = ((dataset_id, context, header, include) for (dataset_id, header) in headers)
+    with BestrefsPool([context], processes=processes, chunksize=chunksize) as pool:
+        for dataset_id, bestrefs in pool.imap(items):
+            if isinstance(bestrefs, Exception):
+                with log.error_on_exception("Failed computing bestrefs for", repr(dataset_id)):
+                    raise bestrefs
+                bestrefs = None
+            yield dataset_id, bestrefs
+
+# ============================================================================
+
+def _preload_contexts(contexts):
+    """Load `contexts` completely so that forked workers inherit them."""
+    for context in contexts:
+        loaded = heavy_client.get_symbolic_mapping(context, cached=True)
+        if isinstance(loaded, rmap.PipelineContext):
+            loaded.preload(config.PRELOAD_WORKERS.get() or None)
+
+def _init_worker(contexts, crds_state, exception_trap):
+    """Initialize a worker process,  restoring the parent's CRDS configuration
+    if it wasn't forked,  and loading `contexts`.
+    """
+    if crds_state is not None:
+        config.set_crds_state(crds_state)
+        log.set_exception_trap(exception_trap)
+    for context in contexts:
+        heavy_client.get_symbolic_mapping(context, cached=True)
+
+def _compute_chunk(work):
+    """Return the bestrefs or exception for each (context, header, include) in `work`.
+
+    Headers sharing the same context and include are computed together by
+    hv_best_references_many(),  which reports the failure of each dataset
+    separately,  falling back to computing them one at a time if the batch
+    fails as a whole.
+    """
+    groups = collections.defaultdict(list)
+    for i, (context, _header, include) in enumerate(work):
+        groups[(context, None if include is None else tuple(include))].append(i)
+    results = [None] * len(work)
+    for (context, include), indices in groups.items():
+        headers = { i : work[i][1] for i in indices }
+        try:
+            bestrefs = heavy_client.hv_best_references_many(context, headers, include)
+        except Exception:
+            bestrefs = { i : _compute_one(context, headers[i], include) for i in indices }
+        for i in indices:
+            results[i] = bestrefs[i]
+            if isinstance(results[i], Exception):
+                results[i] = _portable_exception(results[i])
+    return results
+
+def _compute_one(context, header, include):
+    """Return the bestrefs of `header` or the exception which prevented them."""
+    try:
+        return heavy_client.hv_best_references(context, header, include)
+    except Exception as exc:
+        return _portable_exception(exc)
+
+def _portable_exception(exc):
+    """Return `exc` if it can be returned from a worker process,  otherwise a
+    CrdsError with the same message.
+    """
+    try:
+        pickle.loads(pickle.dumps(exc))
+    except Exception:
+        return CrdsError(str(exc))
+    return exc
@@ -54,6 +54,7 @@ True
 import os.path
 import glob
 import json
+import concurrent.futures
 
 from collections import namedtuple
 
@@ -61,7 +62,7 @@ from collections import namedtuple
 
 from pkg_resources import Requirement
 
-from . import log, utils, config, selectors, substitutions
+from . import log, utils, config, selectors, substitutions, mapping_cache
 
 # XXX For backward compatability until refactored away.
 from .config import locate_file, locate_mapping, locate_reference
@@ -69,7 +70,7 @@ from .config import mapping_exists, is_mapping
 
 from . import exceptions as crexc
 from .custom_dict import LazyFileDict
-from .mapping_verifier import MAPPING_VERIFIER
+from .mapping_verifier import MAPPING_VERIFIER, MAPPING_LOADER
 from .log import srepr
 from .constants import ALL_OBSERVATORIES, INSTRUMENT_KEYWORDS
 
@@ -118,7 +119,57 @@ class LowerCaseDict(dict):
 
     >>> d["another"]
     '(ESCAPED)'
+
+    Once frozen,  the dict cannot be modified:
+
+    >>> d.freeze()
+    >>> d["this"] = "other"
+    Traceback (most recent call last):
+    ...
+    crds.core.exceptions.FrozenMappingError: Cannot modify frozen mapping header.
     """
+    _frozen = False
+
+    def freeze(self):
+        """Make this dict read-only."""
+        self._frozen = True
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise crexc.FrozenMappingError("Cannot modify frozen mapping header.")
+
+    def __setitem__(self, key, val):
+        self._check_mutable()
+        super(LowerCaseDict, self).__setitem__(key, val)
+
+    def __delitem__(self, key):
+        self._check_mutable()
+        super(LowerCaseDict, self).__delitem__(key)
+
+    def clear(self):
+        self._check_mutable()
+        super(LowerCaseDict, self).clear()
+
+    def pop(self, *args):
+        self._check_mutable()
+        return super(LowerCaseDict, self).pop(*args)
+
+    def popitem(self):
+        self._check_mutable()
+        return super(LowerCaseDict, self).popitem()
+
+    def setdefault(self, *args):
+        self._check_mutable()
+        return super(LowerCaseDict, self).setdefault(*args)
+
+    def update(self, *args, **keys):
+        self._check_mutable()
+        super(LowerCaseDict, self).update(*args, **keys)
+
+    def __reduce__(self):
+        """Restore the raw values before the frozen state when pickled or copied."""
+        return (self.__class__, (dict(self),), self.__dict__)
+
     def __getitem__(self, key):
         val = super(LowerCaseDict, self).__getitem__(key)
         # Return string values as lower case,  but exclude literal expressions surrounded by ()
@@ -157,7 +208,8 @@ class Mapping:
 
     def __init__(self, filename, header, selector, **keys):
         self.filename = filename
-        self.header = LowerCaseDict(header)   # consistent lower case values
+        # consistent lower case values,  shared with the selectors when already a LowerCaseDict
+        self.header = header if isinstance(header, LowerCaseDict) else LowerCaseDict(header)
         self.selector = selector
         self.keys = keys
         # Keys should already be as good as they get
@@ -172,6 +224,21 @@ class Mapping:
         self.parkey = self.header["parkey"]
         self.extra_keys = tuple(self.header.get("extra_keys", ()))
 
+    _frozen = False
+
+    def freeze(self):
+        """Make this mapping and its header read-only,  as it is once it is installed
+        in the mapping cache and shared by threads.   Modify a copy() instead.
+        """
+        self._frozen = True
+        self.header.freeze()
+
+    def _check_mutable(self):
+        """Raise FrozenMappingError if this mapping is frozen."""
+        if self._frozen:
+            raise crexc.FrozenMappingError(
+                "Cannot modify cached mapping", repr(self.basename) + ",  modify a copy() instead.")
+
     def _check_type(self):
         """Verify that the 'mapping' element of the header matches 'self.mapping_type'."""
         assert self.mapping == self.mapping_type, \
@@ -264,36 +331,71 @@ class Mapping:
         else:
             filename = config.locate_mapping(basename)
         text = utils.get_uri_content(filename)
-        return cls.from_string(text, basename, *args, **keys)
+        return cls._from_text(text, basename, filename, *args, **keys)
 
     @classmethod
     def from_string(cls, text, basename="(noname)", *args, **keys):
         """Construct a mapping from string `text` nominally named `basename`."""
+        return cls._from_text(text, basename, None, *args, **keys)
+
+    @classmethod
+    def _from_text(cls, text, basename, filename, *args, **keys):
+        """Construct a mapping from string `text` nominally named `basename`.   If
+        `text` was read from local file `filename`,  the checksum is not recomputed
+        when the file is unchanged since it was last verified.
+        """
         keys.pop("comment", None) #  discard comment if defined
-        header, selector, comment = cls._parse_header_selector(text, basename)
+        ignore = keys.get("ignore_checksum", False) or config.get_ignore_checksum()
+        use_parsed_cache = config.PARSED_MAPPING_CACHE.get() and not ignore
+        parsed = mapping_cache.load_parsed(text, basename) if use_parsed_cache else None
+        header, selector, comment = parsed or cls._parse_header_selector(text, basename)
         mapping = cls(basename, header, selector, comment=comment, **keys)
-        try:
-            mapping._check_hash(text)
-        except crexc.ChecksumError as exc:
-            ignore = keys.get("ignore_checksum", False) or config.get_ignore_checksum()
-            if ignore == "warn":
-                log.warning("Checksum error", ":", str(exc))
-            elif ignore:
-                pass
+        if filename and mapping_cache.is_verified(filename, text):
+            log.verbose("Skipping checksum for verified mapping", repr(filename), verbosity=80)
+        else:
+            try:
+                mapping._check_hash(text)
+            except crexc.ChecksumError as exc:
+                if ignore == "warn":
+                    log.warning("Checksum error", ":", str(exc))
+                elif ignore:
+                    pass
+                else:
+                    raise
             else:
-                raise
+                if filename:
+                    mapping_cache.record_verified(filename, text)
+        if use_parsed_cache and parsed is None:   # checksum verified above
+            mapping_cache.save_parsed(text, basename, (header, selector, comment))
         return mapping
 
     @classmethod
-    def _parse_header_selector(cls, text, where=""):
+    def from_namespace(cls, namespace, basename="(noname)", **keys):
+        """Construct a mapping nominally named `basename` from the already evaluated
+        `namespace` of a mapping file,  i.e. its "header", "selector",  and optional
+        "comment" definitions.   There is no mapping text so no checksum is verified.
+        """
+        keys.pop("comment", None) #  discard comment if defined
+        with log.augment_exception("Can't load file " + basename,
+                                   exception_class=crexc.MappingError):
+            header, selector, comment = cls._interpret_namespace(namespace)
+        return cls(basename, header, selector, comment=comment, **keys)
+
+    @classmethod
+    def _parse_header_selector(cls, text, where="", mapping_loader=None):
         """Given a mapping at `filepath`,  validate it and return a fully
-        instantiated (header, selector) tuple.
+        instantiated (header, selector) tuple.   `mapping_loader` is "ast" or
+        "exec",  defaulting to CRDS_MAPPING_LOADER.
         """
+        mapping_loader = mapping_loader or config.MAPPING_LOADER.get()
         with log.augment_exception("Can't load file " + where,
                                    exception_class=crexc.MappingError):
-            code = MAPPING_VERIFIER.compile_and_check(text)
-            header, selector, comment = cls._interpret(code)
-        return LowerCaseDict(header), selector, comment
+            if mapping_loader == "exec":
+                code = MAPPING_VERIFIER.compile_and_check(text)
+                header, selector, comment = cls._interpret(code)
+            else:
+                header, selector, comment = cls._interpret_namespace(MAPPING_LOADER.load(text))
+        return header, selector, comment
 
     @classmethod
     def _interpret(cls, code):
@@ -303,6 +405,13 @@ class Mapping:
         namespace = {}
         namespace.update(selectors.SELECTORS)
         exec(code, namespace)
+        return cls._interpret_namespace(namespace)
+
+    @classmethod
+    def _interpret_namespace(cls, namespace):
+        """Return the header, instantiated selector,  and comment defined by
+        evaluated rmap `namespace`.
+        """
         header = LowerCaseDict(namespace["header"])
         selector = namespace["selector"]
         comment = namespace.get("comment", None)
@@ -380,6 +489,7 @@ class Mapping:
         """Write out this mapping to the specified `filename`,
         or else self.filename. DOES NOT PRESERVE COMMENTS.
         """
+        self._check_mutable()
         if filename is None:
             filename = self.filename
         else:
@@ -608,6 +718,20 @@ class Mapping:
         """Return the "extended match tuples" which can be followed to arrive at `filename`."""
         return sorted([match for value in self.selections.normal_values() for match in value.file_matches(filename)])
 
+    def precompute_merges(self):
+        """Merge the equally weighted selections of all nested rmaps ahead of lookups,
+        e.g. prior to pickling.   Return the number of merged groups.
+        """
+        return sum(selector.precompute_merges() for selector in self.selections.normal_values())
+
+    def merge_cache_stats(self):
+        """Return the merged selector cache statistics of all nested rmaps,  summed."""
+        totals = dict(size=0, maxsize=0, hits=0, misses=0, evictions=0)
+        for selector in self.selections.normal_values():
+            for name, value in selector.merge_cache_stats().items():
+                totals[name] += value
+        return totals
+
     def get_derived_from(self):
         """Return the Mapping object `self` was derived from, or None."""
         for substring in self.null_derivation_substrings:
@@ -691,6 +815,7 @@ class ContextMapping(Mapping):
         Return the case-corrected value of `key` and the value that was replaced or None
         as (corrected_key, replaced_value).
         """
+        self._check_mutable()
         key, value = str(key), str(value)
         key = self.locate.match_context_key(key)
         replaced = self.selector.get(key, None)
@@ -727,6 +852,23 @@ class PipelineContext(ContextMapping):
         # is malformed:
         self.get_asdf_standard_requirement()
 
+    def preload(self, workers=None):
+        """Read and parse the instrument and reference mappings of this context
+        concurrently using up to `workers` threads,  first the .imaps,  then their
+        .rmaps.   Loaded mappings are installed in the selections of their parents,
+        and in the mapping cache for get_cached_mapping(),  in sorted order as if
+        they had been demand loaded.   Mappings which fail to load are left to fail
+        again when they are used.
+
+        Overlapping the small file reads of a cold load matters most on network
+        file systems.
+
+        Return the number of mappings loaded.
+        """
+        imaps_loaded = _preload_selections([self], workers)
+        rmaps_loaded = _preload_selections(self.selections.loaded_values(), workers)
+        return imaps_loaded + rmaps_loaded
+
     def get_best_references(self, header, include=None):
         """Return the best references for keyword map `header`.  If `include`
         is None,  collect all filekinds,  else only those listed.
@@ -736,6 +878,35 @@ class PipelineContext(ContextMapping):
         imap = self.get_imap(instrument)
         return imap.get_best_references(header, include)
 
+    def get_best_references_batch(self, headers, include=None):
+        """Return the list of get_best_references() results for each of the
+        sequence of `headers`.   Headers are grouped by instrument and each
+        group is looked up as a batch by its InstrumentContext.
+
+        The result of a header whose instrument cannot be determined or loaded
+        is the exception get_best_references() would have raised for it.
+        """
+        headers = [dict(header) for header in headers]
+        results = [None] * len(headers)
+        groups = {}
+        for i, header in enumerate(headers):
+            try:
+                instrument = self.get_instrument(header)
+            except Exception as exc:
+                results[i] = exc
+            else:
+                groups.setdefault(instrument, []).append(i)
+        for instrument, indices in groups.items():
+            try:
+                imap = self.get_imap(instrument)
+            except Exception as exc:
+                refs = [exc] * len(indices)
+            else:
+                refs = imap.get_best_references_batch([headers[i] for i in indices], include)
+            for i, ref in zip(indices, refs):
+                results[i] = ref
+        return results
+
     def get_old_references(self, header, include=None):
         """Return the old references defined in keyword map `header` using this
         context to define the types to return when `include` is None.
@@ -873,12 +1044,14 @@ class InstrumentContext(ContextMapping):
         if filekind not in self.selections:
             raise crexc.CrdsUnknownReftypeError("Unknown reference type", repr(filekind))
         if MappingSelectionsDict.is_na_value(self.selections[filekind]):
-            log.verbose("Reference type", repr(filekind),
-                        "is declared N/A at the instrument level for", repr(self.instrument), verbosity=70)
+            if log.enabled_for(70):
+                log.verbose("Reference type", repr(filekind),
+                            "is declared N/A at the instrument level for", repr(self.instrument), verbosity=70)
             raise crexc.IrrelevantReferenceTypeError("Type", repr(filekind), "is N/A for", repr(self.instrument))
         if  MappingSelectionsDict.is_omit_value(self.selections[filekind]):
-            log.verbose("Reference type", repr(filekind),
-                        "is omitted at the instrument level for", repr(self.instrument), verbosity=70)
+            if log.enabled_for(70):
+                log.verbose("Reference type", repr(filekind),
+                            "is omitted at the instrument level for", repr(self.instrument), verbosity=70)
             raise crexc.OmitReferenceTypeError("Type", repr(filekind), "is OMITTED for", repr(self.instrument))
         return self.selections[filekind]
 
@@ -897,23 +1070,52 @@ class InstrumentContext(ContextMapping):
         refs = {}
         if not include:
             include = self.selections.keys()
+        verbose = log.enabled_for(55)
         for filekind in include:
-            log.verbose("-"*120, verbosity=55)
+            if verbose:
+                log.verbose("-"*120, verbosity=55)
             filekind = filekind.lower()
-            ref = None
-            try:
-                ref = self.get_rmap(filekind).get_best_ref(header)
-            except crexc.IrrelevantReferenceTypeError:
-                ref = "NOT FOUND n/a"
-            except crexc.OmitReferenceTypeError:
-                ref = None
-            except Exception as exc:
-                ref = "NOT FOUND " + str(exc)
+            ref = self._get_filekind_ref(filekind, header)
             if ref is not None:
                 refs[filekind] = ref
-        log.verbose("-"*120, verbosity=55)
+        if verbose:
+            log.verbose("-"*120, verbosity=55)
         return refs
 
+    def _get_filekind_ref(self, filekind, header):
+        """Return the best reference of type `filekind` for `header`,  "NOT FOUND ..."
+        if it can't be determined,  or None if the type should be omitted.
+        """
+        try:
+            return self.get_rmap(filekind).get_best_ref(header)
+        except crexc.IrrelevantReferenceTypeError:
+            return "NOT FOUND n/a"
+        except crexc.OmitReferenceTypeError:
+            return None
+        except Exception as exc:
+            return "NOT FOUND " + str(exc)
+
+    def get_best_references_batch(self, headers, include=None):
+        """Return the list of get_best_references() results for each of the
+        sequence of `headers`,  computing each filekind for all `headers`
+        with a single ReferenceMapping.get_best_refs_batch().
+        """
+        headers = [dict(header) for header in headers]
+        results = [{} for _header in headers]
+        if not include:
+            include = self.selections.keys()
+        for filekind in include:
+            filekind = filekind.lower()
+            try:
+                refs = self.get_rmap(filekind).get_best_refs_batch(headers)
+            except Exception:
+                # untrapped or rmap-wide failures are reported per header exactly as get_best_references()
+                refs = [self._get_filekind_ref(filekind, header) for header in headers]
+            for result, ref in zip(results, refs):
+                if ref is not None:
+                    result[filekind] = ref
+        return results
+
     def get_old_references(self, header, include=None):
         """Returns a map of old references which were recorded in `header`,
         returning only those types listed in `include` or all types if
@@ -1088,6 +1290,8 @@ class ReferenceMapping(Mapping):
         del state["_precondition_header"]
         del state["_fallback_header"]
         del state["_rmap_update_headers"]
+        del state["_bestref_cache"]
+        del state["_bestref_cache_keys"]
         return state
 
     def __setstate__(self, state):
@@ -1113,10 +1317,63 @@ class ReferenceMapping(Mapping):
             name.lower() : self.get_expr(expr) for (name, expr) in relevant.items()
             }
 
-        self._precondition_header = self.get_hook("precondition_header", (lambda self, header: header))
-        self._fallback_header = self.get_hook("fallback_header", (lambda self, header: None))
+        self._precondition_header = self.get_hook("precondition_header", _no_precondition_header)
+        self._fallback_header = self.get_hook("fallback_header", _no_fallback_header)
         self._rmap_update_headers = self.get_hook("rmap_update_headers", None)
 
+        self._bestref_cache = utils.LruCache(config.BESTREF_CACHE_SIZE.get())
+        self._bestref_cache_keys = self._get_bestref_cache_keys()
+
+    def _get_bestref_cache_keys(self):
+        """Return the sorted tuple of header keys which fully determine the primary
+        lookup result of this rmap:  the required parkeys plus any names referenced by
+        the rmap_relevance, rmap_omit, and parkey_relevance expressions.
+
+        Return None if this rmap has a precondition_header hook,  since the hook can
+        consult any header key;  bestrefs are then cached on the entire header.
+        """
+        if self._precondition_header is not _no_precondition_header:
+            return None
+        names = set(self._required_parkeys)
+        exprs = [self._rmap_relevance_expr, self._rmap_omit_expr] + list(self._parkey_relevance_exprs.values())
+        for _source, compiled in exprs:
+            names |= _code_names(compiled)
+        return tuple(sorted(names))
+
+    def _bestref_cache_key(self, expr_header):
+        """Return the bestref cache key for conditioned `expr_header`,  or None if
+        `expr_header` contains values which cannot be used as a key.
+        """
+        try:
+            if self._bestref_cache_keys is None:
+                key = tuple(sorted(expr_header.items()))
+            else:
+                key = tuple(expr_header.get(name, _UNDEFINED_KEY) for name in self._bestref_cache_keys)
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def bestref_cache_stats(self):
+        """Return a dictionary of size, hit, miss, and eviction counts for the cache
+        of bestref results for this rmap.
+        """
+        return self._bestref_cache.stats()
+
+    def clear_bestref_cache(self):
+        """Discard all remembered bestref results for this rmap."""
+        self._bestref_cache.clear()
+
+    def precompute_merges(self):
+        """Merge the equally weighted selections of this rmap ahead of lookups,
+        e.g. prior to pickling.   Return the number of merged groups.
+        """
+        return self.selector.precompute_merges()
+
+    def merge_cache_stats(self):
+        """Return the merged selector cache statistics for this rmap."""
+        return self.selector.merge_cache_stats()
+
     def validate(self):
         """Validate the contents of this rmap against the TPN for this
         filekind / reftype.   Each field of each Match tuple must have a value
@@ -1201,68 +1458,204 @@ class ReferenceMapping(Mapping):
         else:
             return {}
 
+    def get_best_references_batch(self, headers, include=None):
+        """Batch form of the get_best_references() shim,  returning a list of results
+        for the sequence of `headers`.
+        """
+        if include is not None and self.filekind not in include:
+            raise crexc.CrdsUnknownReftypeError(self.__class__.__name__, repr(self.basename),
+                                          "can only compute bestrefs for type", repr(self.filekind), "not", include)
+        return [{ self.filekind : bestref } if bestref is not None else {}
+                for bestref in self.get_best_refs_batch(headers)]
+
     def get_best_ref(self, header):
         """Return a single best reference value associated with this .rmap and `header`.  Map exceptions
         from nested methods onto simple "NOT FOUND..." strings which are exempted from reference downloads.
         """
         try:
             return self._get_best_ref(header)
-        except crexc.IrrelevantReferenceTypeError:
+        except Exception as exc:
+            return self._not_found_result(exc)
+
+    def _not_found_result(self, exc):
+        """Map exception `exc` raised while computing a bestref onto the get_best_ref()
+        result for it,  or re-raise `exc` if exceptions are not trapped.
+        """
+        if isinstance(exc, crexc.IrrelevantReferenceTypeError):
             return "NOT FOUND n/a"
-        except crexc.OmitReferenceTypeError:
+        elif isinstance(exc, crexc.OmitReferenceTypeError):
             return None
-        except Exception as exc:
-            if log.get_exception_trap():
-                return "NOT FOUND " + str(exc)
+        elif log.get_exception_trap():
+            return "NOT FOUND " + str(exc)
+        else:
+            raise exc
+
+    def get_best_refs_batch(self, headers):
+        """Return the list of get_best_ref() results for each of `headers`,  either a
+        sequence of header dictionaries or a columnar dictionary of the form
+        { parkey : sequence or numpy array of values,  one per header }.
+
+        Headers with the same bestref cache key are looked up once.  The remaining
+        distinct headers are prepared individually and then matched with a single
+        vectorized Selector.choose_batch().
+        """
+        rows = _header_rows(headers)
+        results = [None] * len(rows)
+        groups = {}
+        for i, row in enumerate(rows):
+            cache_key = self._bestref_cache_key(utils.condition_header_keys(row))
+            if cache_key is None or cache_key in self._bestref_cache:
+                results[i] = self.get_best_ref(row)
             else:
-                raise
+                groups.setdefault(cache_key, []).append(i)
+        log_status = (log.errors(), log.warnings())
+        pending = []
+        for cache_key, indices in groups.items():
+            header_in = dict(rows[indices[0]])
+            try:
+                header = self._prepare_header(header_in, utils.condition_header_keys(header_in), cache_key, log_status)
+            except Exception as exc:
+                result = self._not_found_result(exc)
+                for i in indices:
+                    results[i] = result
+            else:
+                pending.append((cache_key, indices, header_in, header))
+        choices = self.selector.choose_batch([header for (_key, _indices, _header_in, header) in pending])
+        for (cache_key, indices, header_in, header), choice in zip(pending, choices):
+            if isinstance(choice, Exception):
+                # DNR checks and fallback headers can depend on any header value,  so handle each row.
+                for i in indices:
+                    results[i] = self._batch_result(self._retry_best_ref, rows[i], choice)
+            else:
+                self._cache_bestref(cache_key, log_status, choice)
+                result = self._batch_result(lambda: choice)
+                for i in indices:
+                    results[i] = result
+        return results
+
+    def _retry_best_ref(self, header_in, exc):
+        """Prepare `header_in` and handle failure `exc` of its primary lookup."""
+        header_in = dict(header_in)
+        header = self.map_irrelevant_parkeys_to_na(self._precondition_header(self, header_in))
+        return self._fallback_best_ref(header_in, header, exc)
+
+    def _batch_result(self, func, *args):
+        """Return the get_best_ref() form of the bestref computed by func(*args)."""
+        try:
+            return self._check_na_omit(func(*args))
+        except Exception as exc:
+            return self._not_found_result(exc)
 
     def _get_best_ref(self, header_in):
         """Return the single reference file basename appropriate for
         `header_in` selected by this ReferenceMapping.
+
+        Results of the primary lookup are remembered in a bounded LRU cache keyed on
+        the header values which determine them,  see _get_bestref_cache_keys().
         """
         header_in = dict(header_in)
-        log.verbose("Getting bestrefs:", self.basename, verbosity=55)
+        if log.enabled_for(55):
+            log.verbose("Getting bestrefs:", self.basename, verbosity=55)
         expr_header = utils.condition_header_keys(header_in)
-        self.check_rmap_omit(expr_header)     # Should bestref be omitted based on rmap_omit expr?
-        self.check_rmap_relevance(expr_header)  # Should bestref be set N/A based on rmap_relevance expr?
-        # Some filekinds, .e.g. ACS biasfile, mutate the header
-        header = self._precondition_header(self, header_in) # Execute type-specific plugin if applicable
-        header = self.map_irrelevant_parkeys_to_na(header)  # Execute rmap parkey_relevance conditions
+        cache_key = self._bestref_cache_key(expr_header)
+        if cache_key is not None:
+            bestref = self._bestref_cache.get(cache_key)
+        else:
+            bestref = utils.LruCache.MISSING
+        if bestref is utils.LruCache.MISSING:
+            bestref = self._select_best_ref(header_in, expr_header, cache_key)
+        elif isinstance(bestref, _RaisedBestref):
+            if log.enabled_for(55):
+                log.verbose("Cached bestref exception", repr(self.instrument), repr(self.filekind), verbosity=55)
+            raise bestref.exception_class(*bestref.args)
+        return self._check_na_omit(bestref)
+
+    def _check_na_omit(self, bestref):
+        """Return selector choice `bestref` or raise an exception if it is N/A or OMIT."""
+        if log.enabled_for(55):
+            log.verbose("Found bestref", repr(self.instrument), repr(self.filekind), "=", repr(bestref), verbosity=55)
+        if MappingSelectionsDict.is_na_value(bestref):
+            raise crexc.IrrelevantReferenceTypeError("Rules define this type as Not Applicable for these observation parameters.")
+        if MappingSelectionsDict.is_omit_value(bestref):
+            raise crexc.OmitReferenceTypeError("Rules define this type to be Omitted for these observation parameters.")
+        return bestref
+
+    def _select_best_ref(self, header_in, expr_header, cache_key):
+        """Return the unconverted selector choice for `header_in`.  Outcomes of the primary
+        lookup are added to the bestref cache under `cache_key` unless they issued errors or
+        warnings.  Results which depend on dnr_check() or the fallback header are not cached.
+        """
+        log_status = (log.errors(), log.warnings())
+        header = self._prepare_header(header_in, expr_header, cache_key, log_status)
         try:
             bestref = self.selector.choose(header)
         except Exception as exc:
-            # Check conditions for Do Not Reprocess dataset parameters, set to NA if True
-            dnr = self.dnr_check(header)
-            if dnr is True:
+            bestref = self._fallback_best_ref(header_in, header, exc)
+        else:
+            self._cache_bestref(cache_key, log_status, bestref)
+        return bestref
+
+    def _prepare_header(self, header_in, expr_header, cache_key, log_status):
+        """Check the rmap_omit and rmap_relevance expressions against `expr_header`,
+        caching the resulting exceptions,  then return `header_in` as transformed by
+        any precondition_header hook and parkey_relevance expressions.
+        """
+        try:
+            self.check_rmap_omit(expr_header)     # Should bestref be omitted based on rmap_omit expr?
+            self.check_rmap_relevance(expr_header)  # Should bestref be set N/A based on rmap_relevance expr?
+        except (crexc.OmitReferenceTypeError, crexc.IrrelevantReferenceTypeError) as exc:
+            self._cache_bestref(cache_key, log_status, _RaisedBestref(exc.__class__, exc.args))
+            raise
+        # Some filekinds, .e.g. ACS biasfile, mutate the header
+        header = self._precondition_header(self, header_in) # Execute type-specific plugin if applicable
+        return self.map_irrelevant_parkeys_to_na(header)  # Execute rmap parkey_relevance conditions
+
+    def _fallback_best_ref(self, header_in, header, exc):
+        """Handle exception `exc` raised by the primary lookup on prepared `header`.
+        Dataset parameters which are Do Not Reprocess make the type irrelevant,  otherwise
+        retry the lookup with the fallback header for `header_in`,  if any.
+        """
+        # Check conditions for Do Not Reprocess dataset parameters, set to NA if True
+        selectors.increment_stat(self.header.get("name", "unknown"), "dnr_checks")
+        dnr = self.dnr_check(header)
+        verbose = log.enabled_for(55)
+        if dnr is True:
+            if verbose:
                 log.verbose("DNR dataset identified - setting reference to NA", str(exc), verbosity=55)
-                raise crexc.IrrelevantReferenceTypeError("Reference type not required for DNR dataset.") from exc
+            raise crexc.IrrelevantReferenceTypeError("Reference type not required for DNR dataset.") from exc
 
+        if verbose:
             log.verbose("First selection failed:", str(exc), verbosity=55)
-            header = self._fallback_header(self, header_in) # Execute type-specific plugin if applicable
-            try:
-                if header:
-                    header = self.minimize_header(header)
+        header = self._fallback_header(self, header_in) # Execute type-specific plugin if applicable
+        try:
+            if header:
+                selectors.increment_stat(self.header.get("name", "unknown"), "fallbacks")
+                header = self.minimize_header(header)
+                if verbose:
                     log.verbose("Fallback lookup on", repr(header), verbosity=55)
-                    header = self.map_irrelevant_parkeys_to_na(header) # Execute rmap parkey_relevance conditions
-                    bestref = self.selector.choose(header)
-                else:
-                    raise
-            except Exception as exc:
+                header = self.map_irrelevant_parkeys_to_na(header) # Execute rmap parkey_relevance conditions
+                return self.selector.choose(header)
+            else:
+                raise exc
+        except Exception as exc:
+            if verbose:
                 log.verbose("Fallback selection failed:", str(exc), verbosity=55)
-                if self._reffile_required in ["YES", "NONE"]:
+            if self._reffile_required in ["YES", "NONE"]:
+                if verbose:
                     log.verbose("No match found and reference is required:",  str(exc), verbosity=55)
-                    raise
-                else:
+                raise
+            else:
+                if verbose:
                     log.verbose("No match found but reference is not required:",  str(exc), verbosity=55)
-                    raise crexc.IrrelevantReferenceTypeError("No match found and reference type is not required.") from exc
-        log.verbose("Found bestref", repr(self.instrument), repr(self.filekind), "=", repr(bestref), verbosity=55)
-        if MappingSelectionsDict.is_na_value(bestref):
-            raise crexc.IrrelevantReferenceTypeError("Rules define this type as Not Applicable for these observation parameters.")
-        if MappingSelectionsDict.is_omit_value(bestref):
-            raise crexc.OmitReferenceTypeError("Rules define this type to be Omitted for these observation parameters.")
-        return bestref
-    
+                raise crexc.IrrelevantReferenceTypeError("No match found and reference type is not required.") from exc
+
+    def _cache_bestref(self, cache_key, log_status, bestref):
+        """Remember `bestref` under `cache_key` if no errors or warnings were issued
+        since `log_status` was recorded.
+        """
+        if cache_key is not None and log_status == (log.errors(), log.warnings()):
+            self._bestref_cache[cache_key] = bestref
+
     def dnr_check(self, header):
         """Calls dnr_check function from an observatory locate.py module. 
         Returns True if conditions are met for a Do Not Reprocess dataset,
@@ -1401,8 +1794,9 @@ class ReferenceMapping(Mapping):
         try:
             source, compiled = self._rmap_relevance_expr
             relevant = eval(compiled, {}, header)   # secured
-            log.verbose("Filekind ", repr(self.instrument), repr(self.filekind),
-                        "is relevant:", relevant, repr(source), verbosity=55)
+            if log.enabled_for(55):
+                log.verbose("Filekind ", repr(self.instrument), repr(self.filekind),
+                            "is relevant:", relevant, repr(source), verbosity=55)
         except Exception as exc:
             log.warning("Failed checking relevance for", repr(self.instrument),
                         repr(self.filekind), "with expr", repr(source),
@@ -1417,8 +1811,9 @@ class ReferenceMapping(Mapping):
         source, compiled = self._rmap_omit_expr
         try:
             omit = eval(compiled, {}, header)   # secured
-            log.verbose("Filekind ", repr(self.instrument), repr(self.filekind),
-                        "should be omitted: ", omit, repr(source), verbosity=55)
+            if log.enabled_for(55):
+                log.verbose("Filekind ", repr(self.instrument), repr(self.filekind),
+                            "should be omitted: ", omit, repr(source), verbosity=55)
         except Exception as exc:
             log.warning("Failed checking OMIT for", repr(self.instrument),
                         repr(self.filekind), "with expr", repr(source),
@@ -1451,10 +1846,12 @@ class ReferenceMapping(Mapping):
             if lparkey in self._parkey_relevance_exprs:
                 source, compiled = self._parkey_relevance_exprs[lparkey]
                 relevant = eval(compiled, {}, expr_header)  # secured
-                log.verbose("Parkey", self.instrument, self.filekind, lparkey,
-                            "is relevant:", relevant, repr(source), verbosity=55)
+                if log.enabled_for(55):
+                    log.verbose("Parkey", self.instrument, self.filekind, lparkey,
+                                "is relevant:", relevant, repr(source), verbosity=55)
                 if not relevant:
-                    log.verbose("Setting irrelevant parkey", repr(parkey), "to N/A")
+                    if log.enabled_for():
+                        log.verbose("Setting irrelevant parkey", repr(parkey), "to N/A")
                     header[parkey] = "N/A"
         return header
 
@@ -1554,6 +1951,7 @@ class ReferenceMapping(Mapping):
         new = self.copy()
         new.selector.insert(header, value,
             self.tpn_valid_values if not config.ALLOW_BAD_PARKEY_VALUES else {})
+        new.clear_bestref_cache()
         return new
 
     def delete(self, terminal):
@@ -1563,6 +1961,7 @@ class ReferenceMapping(Mapping):
         deleted_count = new.selector.delete(terminal)
         if deleted_count == 0:
             raise crexc.CrdsError("Terminal '%s' could not be found and deleted." % terminal)
+        new.clear_bestref_cache()
         return new
 
     def todict(self, recursive=10):
@@ -1589,33 +1988,126 @@ class ReferenceMapping(Mapping):
 
 # ===================================================================
 
+# Default ReferenceMapping hooks,  module level so rmaps can recognize them.
+
+def _no_precondition_header(rmap, header):
+    """Default precondition_header hook,  returns `header` unchanged."""
+    return header
+
+def _no_fallback_header(rmap, header):
+    """Default fallback_header hook,  defines no fallback lookup."""
+    return None
+
+# Bestref cache key value for parameters missing from the header.
+_UNDEFINED_KEY = ("UNDEFINED",)
+
+# Bestref cache entry recording an exception raised by the primary lookup.
+_RaisedBestref = namedtuple("_RaisedBestref", ["exception_class", "args"])
+
+def _header_rows(headers):
+    """Return `headers` as a list of header dictionaries,  where `headers` is either
+    a sequence of dictionaries or a columnar dictionary of { key : values,  one per header }.
+
+    >>> import numpy as np
+    >>> _header_rows({"DETECTOR" : np.array(["HRC", "WFC"]), "CCDGAIN" : np.array([b"1.0", b"2.0"])})
+    [{'DETECTOR': 'HRC', 'CCDGAIN': '1.0'}, {'DETECTOR': 'WFC', 'CCDGAIN': '2.0'}]
+    """
+    if not isinstance(headers, dict):
+        return [dict(header) for header in headers]
+    import numpy as np
+    columns = {}
+    for key, values in headers.items():
+        values = np.asarray(values)
+        if values.dtype.kind == "S":
+            values = np.char.decode(values, "utf-8")
+        columns[key] = values.astype(str).tolist()
+    if len({len(values) for values in columns.values()}) > 1:
+        raise ValueError("Columnar headers must have the same number of values for every key.")
+    return [dict(zip(columns.keys(), row)) for row in zip(*columns.values())]
+
+def _code_names(code):
+    """Return the set of variable names referenced by compiled `code` and any
+    code nested within it,  e.g. comprehensions.
+    """
+    names = set(code.co_names) | set(code.co_varnames)
+    for const in code.co_consts:
+        if hasattr(const, "co_names"):
+            names |= _code_names(const)
+    return names
+
+# ===================================================================
+
 def _load(mapping, **keys):
     """Stand-off function to call load_mapping, fetch_mapping, or get_cached_mapping
     depending on the "loader" value of `keys`.
     """
     return keys["loader"](mapping, **keys)
 
+def _preload_selections(contexts, workers=None):
+    """Concurrently load the unloaded nested mappings of each ContextMapping in
+    `contexts` using a pool of `workers` threads,  then install them in sorted order.
+
+    Return the number of mappings loaded.
+    """
+    pending = {}
+    for context in contexts:
+        for key, name in context.selections.unloaded_items():
+            pending.setdefault(name, []).append((context, key))
+    if not pending:
+        return 0
+    names = sorted(pending)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = { name : pool.submit(_preload_mapping, name, pending[name][0][0].selections._xx_load_keys)
+                    for name in names }
+    loaded = 0
+    for name in names:
+        try:
+            mapping = futures[name].result()
+        except Exception as exc:
+            log.verbose("Preloading", repr(name), "failed:", str(exc), verbosity=55)
+            continue
+        for context, key in pending[name]:
+            keys = context.selections._xx_load_keys
+            if keys["loader"] is get_cached_mapping:
+                mapping = _load_mapping.setdefault(_load_mapping.cache_key(name, **keys), mapping)
+                mapping.freeze()
+            mapping = context.selections.install(key, mapping)
+        loaded += 1
+    return loaded
+
+def _preload_mapping(name, keys):
+    """Load mapping `name` for a preload worker thread.   Cached mappings are
+    fetched but not added to the cache,  which is left to the calling thread.
+    """
+    keys = dict(keys)
+    if keys["loader"] in [get_cached_mapping, fetch_mapping]:
+        return _load_mapping.readonly(name, **keys)
+    return keys["loader"](name, **keys)
+
 def get_cached_mapping(mapping, **keys):
     """Load `mapping` from the file system or cache,  adding it and all it's
     descendents to the cache.
 
-    NOTE:   mutations to the mapping are reflected in the cache.   This call is
-    not suitable for experimental mappings which need to be reloaded from the
-    file system since the cached version will be returned instead.   This call
-    always returns the same Mapping object for a given set of parameters so it
-    should not be used where a copy is required.
+    NOTE:   This call is not suitable for experimental mappings which need to be
+    reloaded from the file system since the cached version will be returned instead.
+    This call always returns the same Mapping object for a given set of parameters
+    so it should not be used where a copy is required.   Cached mappings are shared
+    by all threads and are frozen;  modify a copy() or a load_mapping() instead.
 
     Return a PipelineContext, InstrumentContext, or ReferenceMapping.
     """
     keys["loader"] = get_cached_mapping
-    return _load_mapping(mapping, **keys)
+    loaded = _load_mapping(mapping, **keys)
+    loaded.freeze()
+    return loaded
 
 def fetch_mapping(mapping, **keys):
     """Load any `mapping`,  exploiting Mapping's already in the cache but not
     adding anything extra.   This is safe for experimental mappings and temporaries
     because new mappings not in the cache are not added to the cache.
 
-    This call only returns a copy of mappings not already in the cache.
+    This call only returns a copy of mappings not already in the cache,  mappings
+    from the cache are frozen.
 
     Return a PipelineContext, InstrumentContext, or ReferenceMapping.
     """
@@ -1689,6 +2181,57 @@ def asmapping(filename_or_mapping, cached=False, **keys):
     else:
         raise TypeError("asmapping: parameter should be a string or mapping.")
 
+def derive_mapping(mapping, old_mapping, cached=False, **keys):
+    """Load context `mapping` reusing the already loaded nested mappings of
+    context `old_mapping`,  nominally the previous operational context.
+
+    Since CRDS mapping names are never reused for different contents,  any
+    nested mapping of `mapping` with the same basename as a loaded mapping of
+    `old_mapping` is shared rather than reloaded.   The changed mappings which
+    replace mappings `old_mapping` had loaded are loaded now so the new context
+    is ready to use for the same work;  everything else stays demand loaded.
+    `cached` and `keys` are as for asmapping().
+
+    Return the new PipelineContext or InstrumentContext.
+    """
+    old_mapping = asmapping(old_mapping, cached=cached, **keys)
+    new_mapping = asmapping(mapping, cached=cached, **keys)
+    loaded = _loaded_mappings(old_mapping, {})
+    reused = _derive_selections(new_mapping, old_mapping, loaded)
+    log.verbose("Derived", repr(new_mapping.basename), "from", repr(old_mapping.basename),
+                "reusing", reused, "loaded mappings.", verbosity=55)
+    return new_mapping
+
+def _loaded_mappings(mapping, loaded):
+    """Add `mapping` and its already loaded nested mappings to dict `loaded`
+    keyed by basename,  returning `loaded`.
+    """
+    loaded[mapping.basename] = mapping
+    if isinstance(mapping, ContextMapping):
+        for nested in mapping.selections.loaded_values():
+            _loaded_mappings(nested, loaded)
+    return loaded
+
+def _derive_selections(context, old_context, loaded):
+    """Install the mappings of `loaded` for the unloaded nested mappings of
+    `context` with the same basenames.   Load the other nested mappings whose
+    counterparts in `old_context` were loaded,  recursively deriving them.
+
+    Return the number of mappings reused.
+    """
+    reused = 0
+    old_loaded = set(old_context.selections.normal_keys()) - {
+        key for (key, _name) in old_context.selections.unloaded_items()}
+    for key, name in context.selections.unloaded_items():
+        if os.path.basename(name) in loaded:
+            context.selections.install(key, loaded[os.path.basename(name)])
+            reused += 1
+        elif key in old_loaded:
+            nested, old_nested = context.selections[key], old_context.selections[key]
+            if isinstance(nested, ContextMapping) and isinstance(old_nested, ContextMapping):
+                reused += _derive_selections(nested, old_nested, loaded)
+    return reused
+
 # =============================================================================
 
 class MappingSelectionsDict(LazyFileDict):
@@ -1851,7 +2394,8 @@ def get_best_references(context_file, header, include=None, condition=True):
     """
     ctx = asmapping(context_file, cached=True)
     minheader = ctx.minimize_header(header)
-    log.verbose("Bestrefs header:\n", log.PP(minheader))
+    if log.enabled_for():
+        log.verbose("Bestrefs header:\n", log.PP(minheader))
     if condition:
         minheader = utils.condition_header(minheader)
     return ctx.get_best_references(minheader, include=include)
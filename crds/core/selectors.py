@@ -87,9 +87,15 @@ with ClosestTime utilizing "time" and SelectVersion utilizing "sw_version".
 
 import os
 import re
+import bisect
+import contextlib
+import itertools
 import fnmatch
 import sys
+import threading
+import time
 import numbers
+import operator
 from collections import namedtuple
 import ast
 import copy
@@ -206,12 +212,28 @@ def dict_wo_dups(items):
 # Selection = namedtuple("Selection", ("key", "choice"))
 
 class Selection(tuple):
+    """A (key, choice) item of a Selector.   Slotted since a loaded context holds
+    one for every choice of every rmap.
+
+    >>> s = Selection(("HRC", "foo.fits"))
+    >>> s.key, s.choice
+    ('HRC', 'foo.fits')
+    >>> import pickle
+    >>> pickle.loads(pickle.dumps(s)).choice
+    'foo.fits'
+    """
+    __slots__ = ()
+
     def __new__(cls, t):
         return super(Selection, cls).__new__(cls, t)
 
-    def __init__(self, t):
-        self.key = t[0]
-        self.choice = t[1]
+    key = property(operator.itemgetter(0))
+    choice = property(operator.itemgetter(1))
+
+    def __setstate__(self, state):
+        """Ignore the key and choice attributes of Selections pickled before
+        __slots__ were defined,  they're the tuple items.
+        """
 
     def _cmp_key(self, key):
         return tuple(str(field) for field in key) if isinstance(key, tuple) else (str(key),)
@@ -237,6 +259,111 @@ DEFAULT_SUBSTITUTIONS = {
 
 # ==============================================================================
 
+# Opt-in lookup instrumentation:   { rmap_name : { statistic : value, ... } } or None
+# when disabled.   Statistics are diagnostic and not synchronized between threads.
+_SELECTOR_STATS = None
+
+_STATS_LOCAL = threading.local()
+
+def enable_stats(enabled=True):
+    """Turn lookup instrumentation on or off,  returning the prior setting.   Enabling
+    instrumentation discards previously collected statistics.
+
+    >>> old = enable_stats()
+    >>> m = MatchSelector(("foo","bar"), {
+    ...    ("A", "B") : "100",
+    ...    ("A", "D") : "200",
+    ...    ("C", "*") : "300",
+    ... }, rmap_header={"name" : "test.rmap"})
+    >>> m.choose({"foo":"A", "bar":"B"})
+    '100'
+    >>> stats = get_stats()["test.rmap"]
+    >>> stats["lookups"], stats["match_cases"], stats["winnowed"]
+    (1, 3, {'foo': 2, 'bar': 1})
+
+    >>> _ = enable_stats(old)
+    >>> stats_enabled()
+    False
+    """
+    global _SELECTOR_STATS
+    old = stats_enabled()
+    _SELECTOR_STATS = {} if enabled else None
+    return old
+
+def stats_enabled():
+    """Return True IFF lookup instrumentation is on."""
+    return _SELECTOR_STATS is not None
+
+def clear_stats():
+    """Discard collected lookup statistics,  leaving instrumentation on or off."""
+    if _SELECTOR_STATS is not None:
+        _SELECTOR_STATS.clear()
+
+def get_stats():
+    """Return a copy of the lookup statistics collected for each rmap:
+
+    lookups        outermost Selector.choose() calls
+    seconds        time spent in outermost Selector.choose() calls
+    selector_calls { selector short name : choose() calls,  including nested selectors }
+    match_cases    Match cases considered before winnowing
+    winnowed       { parameter : Match cases surviving after binding parameter }
+    bsearches      UseAfter binary searches
+    fallbacks      lookups retried with the fallback header hook
+    dnr_checks     Do Not Reprocess checks after failed lookups
+    """
+    return copy.deepcopy(_SELECTOR_STATS or {})
+
+def increment_stat(rmap_name, name, amount=1):
+    """Add `amount` to statistic `name` of `rmap_name` when instrumentation is on."""
+    stats = _rmap_stats(rmap_name)
+    if stats is not None:
+        stats[name] += amount
+
+def format_stats(stats=None):
+    """Return a text table of lookup `stats`,  nominally get_stats(),  ordered by time."""
+    stats = get_stats() if stats is None else stats
+    lines = ["{:<40} {:>9} {:>10} {:>11} {:>9} {:>9} {:>10}".format(
+        "rmap", "lookups", "seconds", "match_cases", "bsearches", "fallbacks", "dnr_checks")]
+    for name, rstats in sorted(stats.items(), key=lambda item: (-item[1]["seconds"], item[0])):
+        lines.append("{:<40} {:>9} {:>10.4f} {:>11} {:>9} {:>9} {:>10}".format(
+            name, rstats["lookups"], rstats["seconds"], rstats["match_cases"],
+            rstats["bsearches"], rstats["fallbacks"], rstats["dnr_checks"]))
+        if rstats["winnowed"]:
+            lines.append("    winnowed: " + " ".join(
+                parkey + "=" + str(count) for (parkey, count) in rstats["winnowed"].items()))
+    return "\n".join(lines)
+
+def _rmap_stats(rmap_name):
+    """Return the mutable statistics dict for `rmap_name`,  or None if instrumentation is off."""
+    stats = _SELECTOR_STATS
+    if stats is None:
+        return None
+    if rmap_name not in stats:
+        stats[rmap_name] = dict(lookups=0, seconds=0.0, selector_calls={}, match_cases=0,
+                                winnowed={}, bsearches=0, fallbacks=0, dnr_checks=0)
+    return stats[rmap_name]
+
+@contextlib.contextmanager
+def _instrumented_lookup(selector, lookups=1):
+    """Count a choose() call of `selector`,  and for outermost calls,  `lookups` and
+    their elapsed time.
+    """
+    stats = _rmap_stats(selector._rmap_name)
+    calls = stats["selector_calls"]
+    calls[selector.short_name] = calls.get(selector.short_name, 0) + lookups
+    depth = getattr(_STATS_LOCAL, "depth", 0)
+    _STATS_LOCAL.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _STATS_LOCAL.depth = depth
+        if not depth:
+            stats["lookups"] += lookups
+            stats["seconds"] += time.perf_counter() - start
+
+# ==============================================================================
+
 class Selector:
     """Baseclass for CRDS file selectors defining the basic protocol
     of a Selector:
@@ -541,14 +668,43 @@ class Selector:
         """Return the list of items which can be selected."""
         return [s.choice for s in self._selections]
 
+    @property
+    def _rmap_name(self):
+        """Basename of the rmap defining this selector,  used to break down statistics."""
+        return self._rmap_header.get("name", "unknown")
+
     def choose(self, header):
         """Given `header`,  operate on self.keys() to choose one of self.choices()."""
+        if _SELECTOR_STATS is not None:
+            with _instrumented_lookup(self):
+                return self._choose(header)
+        return self._choose(header)
+
+    def _choose(self, header):
+        """Uninstrumented implementation of choose()."""
         self._check_defined(header)
         lookup_key = self._validate_header(header)  # may return header or a key
+        return self._choose_from(self.get_selection(lookup_key), header)
+
+    def choose_batch(self, headers):
+        """Return a list with the result of choose() for each header of the sequence
+        `headers`,  or the exception raised by choose() for that header.
+        """
+        results = []
+        for header in headers:
+            try:
+                results.append(self.choose(header))
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+    def _choose_from(self, selections, header):
+        """Return the final choice of the first of `selections` which succeeds for `header`."""
         last_exc = None
-        for selection in self.get_selection(lookup_key):  # iterate over weighted selections, best match first.
+        for selection in selections:  # iterate over weighted selections, best match first.
             try:
-                log.verbose("Trying", selection, verbosity=60)
+                if log.enabled_for(60):
+                    log.verbose("Trying", selection, verbosity=60)
                 return self.get_choice(selection, header) # recursively,  what's final choice?
             except CrdsLookupError as exc:
                 last_exc = exc
@@ -718,15 +874,18 @@ class Selector:
         for JWST may (eventually) come from the data model schema instead.
         """
         if value in valid_list or utils.condition_value(value) in valid_list:   # typical |-glob valid_list membership
-            log.verbose("Value for", repr(name), "of", repr(value), "is in", repr(valid_list), verbosity=60)
+            if log.enabled_for(60):
+                log.verbose("Value for", repr(name), "of", repr(value), "is in", repr(valid_list), verbosity=60)
             return
         # Wild-cards in the rmap are handled here for the sake of runtime match headers
         if runtime and ("*" in valid_list or "ANY" in valid_list or "N/A" in valid_list):
-            log.verbose("Valid list for", repr(name), "includes wild cards. OK, no other check.", verbosity=60)
+            if log.enabled_for(60):
+                log.verbose("Valid list for", repr(name), "includes wild cards. OK, no other check.", verbosity=60)
             return
         # Some TPNs are type-only, empty list
         if not valid_list:
-            log.verbose("Valid list for", repr(name), "is empty.  No other check.", verbosity=60)
+            if log.enabled_for(60):
+                log.verbose("Valid list for", repr(name), "is empty.  No other check.", verbosity=60)
             return
         if value.startswith("NOT"):
             log.verbose("NOT expression for", repr(name), "of", repr(value),
@@ -734,8 +893,9 @@ class Selector:
             self._validate_value(name, value[len("NOT"):].strip(), valid_list, runtime)
             return
         if esoteric_key(value) or value in ["*", "ANY", "N/A"]:   # exempt
-            log.verbose("Value of", repr(name), "of", repr(value),
-                        "is unchecked esoteric or wild card.  OK, no other check.", verbosity=60)
+            if log.enabled_for(60):
+                log.verbose("Value of", repr(name), "of", repr(value),
+                            "is unchecked esoteric or wild card.  OK, no other check.", verbosity=60)
             return
         if value.lower().startswith("between"):
             log.verbose("Checking 'between' expression for", repr(name), "of", repr(value), verbosity=60)
@@ -746,8 +906,9 @@ class Selector:
         if len(valid_list) == 1 and ":" in valid_list[0]:   # handle ranges in .tpns as n1:n2
             min, max = [float(x) for x in valid_list[0].split(":")]  # normalize everything as float
             if min <= float(value) <= max:
-                log.verbose("Numeric value of", repr(name), "of", repr(value),
-                            "is in range", repr(min), "...", repr(max), verbosity=60)
+                if log.enabled_for(60):
+                    log.verbose("Numeric value of", repr(name), "of", repr(value),
+                                "is in range", repr(min), "...", repr(max), verbosity=60)
                 return
             else:
                 raise ValidationError(
@@ -817,14 +978,39 @@ class Selector:
         raise AmbiguousMatchError("More than one match was found at the same weight and " +
             self.short_name + " does not support merging.")
 
+    def precompute_merges(self):
+        """Merge the groups of equally weighted nested selectors which lookups are
+        expected to require,  remembering them in the merge caches of nested Match
+        selectors.   Return the number of groups merged.
+        """
+        return sum(choice.precompute_merges() for choice in self.choices() if isinstance(choice, Selector))
+
+    def merge_cache_stats(self):
+        """Return the merge cache statistics of all Match selectors nested in this
+        selector,  summed.
+        """
+        totals = dict(size=0, maxsize=0, hits=0, misses=0, evictions=0)
+        for choice in self.choices():
+            if isinstance(choice, Selector):
+                for name, value in choice.merge_cache_stats().items():
+                    totals[name] += value
+        return totals
+
     # ------------------------------------------------------------------------
 
     def delete(self, terminal):
         """Remove all instances of `terminal` from `self`."""
         deleted = self._delete(self._selections, terminal)
         deleted += self._delete( self._raw_selections, terminal)
+        if deleted:
+            self._reindex()
         return deleted
 
+    def _reindex(self):
+        """Recompute any lookup structures derived from self._selections,  required
+        after self._selections is edited in place.   Overridden by subclasses with indexes.
+        """
+
     def _delete(self, selections, terminal):
         """Remove all instances of `terminal` from `selections`.   Directly mutates selections."""
         deleted = 0
@@ -1220,9 +1406,19 @@ class Matcher:
     """Matches a single key of a matching tuple to a dataset value.  Every
     key of a MatchSelector will have a tuple of corresponding Matchers.
     """
+    __slots__ = ("_key",)
+
     def __init__(self, key):
         self._key = key
 
+    def __setstate__(self, state):
+        """Restore slot and __dict__ attributes,  also accepting the plain dict
+        state of Matchers pickled before __slots__ were defined.
+        """
+        dict_state, slot_state = state if isinstance(state, tuple) else (state, None)
+        for name, value in list((dict_state or {}).items()) + list((slot_state or {}).items()):
+            setattr(self, name, value)
+
     def match(self, value):
         """Return 1 (match),  0 (don't care), or -1 (no match).
         """
@@ -1236,6 +1432,57 @@ class Matcher:
     def __repr__(self):
         return self.__class__.__name__ + "('%s')" % self._key
 
+class LiteralMatcher(Matcher):
+    """Matcher for a single literal value,  matched by string equality.
+
+    >>> m = LiteralMatcher("F435W")
+    >>> m.match("F435W"), m.match("F435"), m.match("*"), m.match("N/A")
+    (1, -1, 1, 0)
+    """
+    __slots__ = ()
+
+    def __init__(self, key):
+        super(LiteralMatcher, self).__init__(sys.intern(key))
+
+    def match(self, value):
+        if value == self._key or value == "*":
+            return 1
+        elif value == "N/A":
+            return 0
+        else:
+            return -1
+
+class OrLiteralMatcher(Matcher):
+    """Matcher for an or-ed set of literal values,  e.g. from the glob 'A|B|C'
+    or the tuple ('A','B','C'),  matched by set membership.
+
+    >>> m = OrLiteralMatcher(["A", "B", "N/A"])
+    >>> m
+    OrLiteralMatcher('A|B|N/A')
+    >>> m.match("B"), m.match("C"), m.match("*"), m.match("N/A")
+    (1, -1, 1, 0)
+    """
+    __slots__ = ("_values",)
+
+    def __init__(self, values):
+        self._values = frozenset(sys.intern(value) for value in values)
+        super(OrLiteralMatcher, self).__init__("|".join(sorted(self._values)))
+
+    @property
+    def values(self):
+        """The frozenset of literal values matched."""
+        return self._values
+
+    def match(self, value):
+        if value == "*":
+            return 1
+        elif value == "N/A":
+            return 0
+        elif value in self._values:
+            return 1
+        else:
+            return -1
+
 class RegexMatcher(Matcher):
     """Matcher for raw regular expressions."""
     def __init__(self, key):
@@ -1381,6 +1628,8 @@ class BinaryMatcher(Matcher):
 
 class NaMatcher(Matcher):
     """Matcher that always matches,  simplifies/speeds code elsewhere."""
+    __slots__ = ()
+
     def __init__(self, key="N/A"):
         super(NaMatcher, self).__init__(key)
 
@@ -1607,11 +1856,11 @@ def matcher(key):
 
     """
     if isinstance(key, tuple):
-        return GlobMatcher("|".join(key))
+        return or_matcher("|".join(key))
     elif key.startswith("(") and key.endswith(")"):
         return RegexMatcher(key[1:-1])
     elif key.startswith("{") and key.endswith("}"):
-        return Matcher(key[1:-1])
+        return LiteralMatcher(key[1:-1])
     elif key.startswith("#") and key.endswith("#"):
         key = key.upper()
         if " AND " in key:
@@ -1629,14 +1878,115 @@ def matcher(key):
         return BinaryMatcher(">=" + parts[1]+ " AND <" + parts[2], "AND")
     elif key.upper().startswith("NOT "):
         return NotMatcher(key)
-    elif "|" in key or "*" in key:
+    elif "|" in key:
+        return or_matcher(key)
+    elif "*" in key:
         return GlobMatcher(key)
     elif key == "N/A":
         return NaMatcher("N/A")
     elif key.startswith((">","<")):
         return InequalityMatcher(key)
     else:
-        return Matcher(key)
+        return LiteralMatcher(key)
+
+# fnmatch pattern characters which make a glob more than a literal.
+GLOB_SPECIAL_CHARS = set("*?[")
+
+def or_matcher(key):
+    """Return the cheapest Matcher for |-joined glob expression `key`:  an
+    OrLiteralMatcher when none of the alternatives contain glob pattern
+    characters,  otherwise a GlobMatcher.
+
+    >>> or_matcher("A | B|C")
+    OrLiteralMatcher('A|B|C')
+    >>> or_matcher("A|B*")
+    GlobMatcher('^((?s:A)\\Z|(?s:B.*)\\Z)$')
+    """
+    parts = glob_list(key)
+    if parts and not any(GLOB_SPECIAL_CHARS & set(part) for part in parts):
+        return OrLiteralMatcher(parts)
+    else:
+        return GlobMatcher(key)
+
+class MatchIndex:
+    """Compiled decision index over the match tuples of a MatchSelector.
+
+    For each parameter,  cases whose matcher is a literal or or-ed literal are
+    bucketed by value so a header value selects its surviving literal cases
+    with one dictionary lookup.   NaMatcher cases always survive with weight
+    0.   Everything else (globs, regexes, inequalities, binary and NOT
+    expressions) stays in a per-parameter scan list evaluated with match().
+
+    >>> m = MatchSelector(("foo","bar"), {
+    ...    ('1.0', 'N/A') : "100",
+    ...    ('1.0', '2.0') : "200",
+    ...    ('4.0', '*') : "300",
+    ...    ('>4.5', '2.0|3.0') : "400",
+    ... })
+    >>> index = m._match_index
+    >>> index.literals[0]["1.0"] == {index.ordinals[('1.0', '2.0')], index.ordinals[('1.0', 'N/A')]}
+    True
+    >>> sorted(index.na_cases[1]) == [index.ordinals[('1.0', 'N/A')]]
+    True
+    >>> index.literals[1]["3.0"] == {index.ordinals[('>4.5', '2.0|3.0')]}
+    True
+    >>> index.scan_cases[1]
+    [(2, GlobMatcher('^((?s:.*)\\Z)$'))]
+
+    The indexed winnow produces the same survivors,  in the same order,  with the
+    same weights as the linear scan:
+
+    >>> def same_winnow(header):
+    ...     weights1, remaining1 = m._winnow(header, dict(m._match_selections))
+    ...     weights2, remaining2 = m._winnow_linear(header, dict(m._match_selections))
+    ...     return list(remaining1.items()) == list(remaining2.items()) and \\
+    ...         all(weights1[key] == weights2[key] for key in remaining2)
+    >>> all(same_winnow(header) for header in [
+    ...     dict(foo="1.0", bar="2.0"), dict(foo="4.0", bar="9.0"), dict(foo="5.0", bar="3.0"),
+    ...     dict(foo="*", bar="2.0"), dict(foo="N/A", bar="N/A"), dict(foo="7.0")])
+    True
+    """
+
+    # Header values for which literal Matchers don't reduce to value equality.
+    SPECIAL_VALUES = ("*", "N/A")
+
+    def __init__(self, match_selections, nparameters):
+        self.match_tuples = tuple(match_selections.keys())
+        self.ordinals = { match_tuple: i for (i, match_tuple) in enumerate(self.match_tuples) }
+        self.literals = [dict() for _i in range(nparameters)]
+        self.na_cases = [set() for _i in range(nparameters)]
+        self.scan_cases = [[] for _i in range(nparameters)]
+        for ordinal, match_tuple in enumerate(self.match_tuples):
+            matchers = match_selections[match_tuple][0]
+            for i, mat in enumerate(matchers):
+                if type(mat) in (Matcher, LiteralMatcher):
+                    self.literals[i].setdefault(mat._key, set()).add(ordinal)
+                elif type(mat) is OrLiteralMatcher:
+                    for value in mat.values:
+                        self.literals[i].setdefault(value, set()).add(ordinal)
+                elif type(mat) is NaMatcher:
+                    self.na_cases[i].add(ordinal)
+                else:
+                    self.scan_cases[i].append((ordinal, mat))
+
+    def winnow(self, i, value, candidates, weights):
+        """Winnow the ordinal set `candidates` based on `value` of parameter `i`,
+        decrementing `weights[ordinal]` for each literal or pattern match.
+
+        Returns the surviving set of ordinals.
+        """
+        literal_hits = self.literals[i].get(value, ())
+        survivors = candidates.intersection(literal_hits)
+        for ordinal in survivors:
+            weights[ordinal] -= 1
+        survivors.update(candidates.intersection(self.na_cases[i]))
+        for ordinal, mat in self.scan_cases[i]:
+            if ordinal in candidates:
+                match_status = mat.match(value)
+                if match_status != -1:
+                    survivors.add(ordinal)
+                    weights[ordinal] -= match_status
+        return survivors
 
 class MatchSelection(Selection):
     """
@@ -1646,6 +1996,7 @@ class MatchSelection(Selection):
     and there are indeed multiple equal weighted keys.   Note that a MatchSelection still
     reduces to a single merged choice.
     """
+    __slots__ = ()
 
 class MatchSelector(Selector):
     """Matching selector does a modified dictionary lookup by directly matching
@@ -1825,9 +2176,24 @@ Restore original debug behavior:
 
     def __init__(self, parameters, selections, rmap_header={}):
         super(MatchSelector, self).__init__(parameters, selections, rmap_header)
-        self._match_selections = self.get_matcher_selections(dict_wo_dups(self._selections))
+        self._merge_cache = utils.LruCache(config.MERGE_CACHE_SIZE.get())
+        self._reindex()
         self._value_map = self.get_value_map()
 
+    def __setstate__(self, state):
+        """Restore pickled `state`,  adding a merge cache to selectors pickled without one."""
+        self.__dict__.update(state)
+        if "_merge_cache" not in state:
+            self._merge_cache = utils.LruCache(config.MERGE_CACHE_SIZE.get())
+
+    def _reindex(self):
+        """Recompute the Matcher selections and MatchIndex from self._selections.
+        Merged groups may include edited nested selectors so they are discarded.
+        """
+        self._match_selections = self.get_matcher_selections(dict_wo_dups(self._selections))
+        self._match_index = MatchIndex(self._match_selections, len(self._parameters))
+        self._merge_cache.clear()
+
     def _equal_keys(self, key1, key2):
         """Return True IFF `key1` is equivalent to `key2` for rmap modification.  Ignore comment pars."""
         key1, key2 = self.condition_key(key1), self.condition_key(key2)
@@ -1902,7 +2268,12 @@ Restore original debug behavior:
         matching value (fewest *'s) to least specific matching value.
         """
         weights, remaining = self._winnow(header, dict(self._match_selections))
+        return self._ranked_selections(weights, remaining)
 
+    def _ranked_selections(self, weights, remaining):
+        """Generate MatchSelection's for the winnowed `remaining` selections in order of
+        best `weights` first,  merging or rejecting equally weighted selections.
+        """
         sorted_candidates = self._rank_candidates(weights, remaining)
 
         # Yield successive candidates in order from best match to worst,
@@ -1918,7 +2289,8 @@ Restore original debug behavior:
                     selector = subselectors
             else:
                 selector = remaining[match_tuples[0]].choice
-            log.verbose("Matched", repr(match_tuples[0]), "returning", repr(selector), verbosity=60)
+            if log.enabled_for(60):
+                log.verbose("Matched", repr(match_tuples[0]), "returning", repr(selector), verbosity=60)
             yield MatchSelection((match_tuples, selector))
         raise MatchingError("No match found.")
 
@@ -1928,26 +2300,139 @@ Restore original debug behavior:
         selection,  weight each parkey which matches exactly as -1 and
         "don't care" matches as 0.
 
+        Literal parkey values are resolved through the compiled MatchIndex;
+        header values of "*" or "N/A" and selections not covered by the index
+        fall back to the linear scan of _winnow_linear().
+
+        returns   ( {match_tuple:weight ...},   remaining_selections )
+        """
+        index = self._match_index
+        if len(remaining) != len(index.match_tuples) or \
+            any(value in MatchIndex.SPECIAL_VALUES for value in
+                (header.get(parkey, "UNDEFINED") for parkey in self._parameters)):
+            return self._winnow_linear(header, remaining)
+        candidates = set(range(len(index.match_tuples)))
+        weights = [0] * len(index.match_tuples)
+        stats = _rmap_stats(self._rmap_name) if _SELECTOR_STATS is not None else None
+        if stats is not None:
+            stats["match_cases"] += len(candidates)
+        for i, parkey in enumerate(self._parameters):
+            value = header.get(parkey, "UNDEFINED")
+            if log.enabled_for(60):
+                log.verbose("Binding", repr(parkey), "=", repr(value), verbosity=60)
+            candidates = index.winnow(i, value, candidates, weights)
+            if stats is not None:
+                stats["winnowed"][parkey] = stats["winnowed"].get(parkey, 0) + len(candidates)
+            if not candidates:
+                break
+        survivors = [index.match_tuples[ordinal] for ordinal in sorted(candidates)]
+        if log.enabled_for(60):
+            log.verbose("Winnowed", len(index.match_tuples), "cases to", len(survivors), verbosity=60)
+        return ({ match_tuple : weights[index.ordinals[match_tuple]] for match_tuple in survivors },
+                { match_tuple : remaining[match_tuple] for match_tuple in survivors })
+
+    def _winnow_linear(self, header, remaining):
+        """Linear scan version of _winnow() which calls match() on every
+        selection in `remaining` for each parkey value in `header`.
+
         returns   ( {match_tuple:weight ...},   remaining_selections
         """
         # weights counts the # of parkey value matches, establishing a
         # goodness-of-match weighting.  negative weights are better matches
         weights = { match_tuple:0 for match_tuple in remaining.keys() }
+        verbose = log.enabled_for(60)
+        stats = _rmap_stats(self._rmap_name) if _SELECTOR_STATS is not None else None
+        if stats is not None:
+            stats["match_cases"] += len(remaining)
 
         for i, parkey in enumerate(self._parameters):
             value = header.get(parkey, "UNDEFINED")
-            log.verbose("Binding", repr(parkey), "=", repr(value), verbosity=60)
+            if verbose:
+                log.verbose("Binding", repr(parkey), "=", repr(value), verbosity=60)
             for match_tuple, (matchers, _subselector) in list(remaining.items()):
                 # Match the key to the current header vaue
                 match_status = matchers[i].match(value)
                 # returns 1 (match), 0 (don't care), or -1 (no match)
                 if match_status == -1:
-                    log.verbose("Eliminating", match_tuple, "based on", parkey + "=" + repr(value), verbosity=60)
+                    if verbose:
+                        log.verbose("Eliminating", match_tuple, "based on", parkey + "=" + repr(value), verbosity=60)
                     del remaining[match_tuple]   # winnow!
                 else: # matched or don't care,  set weights accordingly
                     weights[match_tuple] -= match_status
+            if stats is not None:
+                stats["winnowed"][parkey] = stats["winnowed"].get(parkey, 0) + len(remaining)
         return weights, remaining
 
+    def choose_batch(self, headers):
+        """Return a list with the result of choose() for each header of the sequence
+        `headers`,  or the exception raised by choose() for that header.   Winnowing
+        is vectorized over all the headers with _winnow_batch().
+        """
+        if _SELECTOR_STATS is not None:
+            with _instrumented_lookup(self, len(headers)):
+                return self._choose_batch(headers)
+        return self._choose_batch(headers)
+
+    def _choose_batch(self, headers):
+        """Uninstrumented implementation of choose_batch()."""
+        results = [None] * len(headers)
+        valid = []
+        for i, header in enumerate(headers):
+            try:
+                self._check_defined(header)
+                self._validate_header(header)
+            except Exception as exc:
+                results[i] = exc
+            else:
+                valid.append(i)
+        for start in range(0, len(valid), self.BATCH_CHUNK_SIZE):
+            chunk = valid[start:start+self.BATCH_CHUNK_SIZE]
+            winnowed = self._winnow_batch([headers[i] for i in chunk])
+            for i, (weights, remaining) in zip(chunk, winnowed):
+                try:
+                    results[i] = self._choose_from(self._ranked_selections(weights, remaining), headers[i])
+                except Exception as exc:
+                    results[i] = exc
+        return results
+
+    # Number of headers winnowed at once by choose_batch(),  bounds the weight matrix size.
+    BATCH_CHUNK_SIZE = 4096
+
+    def _winnow_batch(self, headers):
+        """Vectorized equivalent of _winnow() for each of the sequence `headers`.
+
+        Each parameter column is reduced to its unique values,  which are matched
+        against every selection's Matcher,  and the resulting match status matrix is
+        broadcast back over all the headers.
+
+        Returns [ ({match_tuple:weight ...},   remaining_selections), ... ]
+        """
+        import numpy as np
+        match_tuples = self._match_index.match_tuples
+        alive = np.ones((len(match_tuples), len(headers)), dtype=bool)
+        weights = np.zeros((len(match_tuples), len(headers)), dtype=np.int32)
+        stats = _rmap_stats(self._rmap_name) if _SELECTOR_STATS is not None else None
+        if stats is not None:
+            stats["match_cases"] += alive.size
+        for i, parkey in enumerate(self._parameters):
+            column = np.array([header.get(parkey, "UNDEFINED") for header in headers], dtype=object)
+            values, inverse = np.unique(column, return_inverse=True)
+            status = np.array(
+                [[self._match_selections[match_tuple][0][i].match(value) for value in values]
+                 for match_tuple in match_tuples], dtype=np.int8).reshape(len(match_tuples), len(values))
+            row_status = status[:, inverse.ravel()]
+            alive &= (row_status != -1)
+            weights -= np.maximum(row_status, 0)
+            if stats is not None:
+                stats["winnowed"][parkey] = stats["winnowed"].get(parkey, 0) + int(alive.sum())
+        winnowed = []
+        for column in range(len(headers)):
+            survivors = [match_tuples[ordinal] for ordinal in np.flatnonzero(alive[:, column])]
+            winnowed.append((
+                { match_tuple : int(weights[self._match_index.ordinals[match_tuple], column]) for match_tuple in survivors },
+                { match_tuple : self._match_selections[match_tuple] for match_tuple in survivors }))
+        return winnowed
+
     def _rank_candidates(self, weights, remaining):
         """Rank the possible matches in `remaining` according to
         their corresponding `weights`,  with lowest values indicating
@@ -1964,10 +2449,10 @@ Restore original debug behavior:
         # Sort candidates into:  [ (weight, [match_tuples...]) ... ]
         # Lowest weight is best match
         candidates = sorted([(x[0], tuple(x[1])) for x in candidates.items()])
-        log.verbose("Candidates:\n", log.PP(candidates), verbosity=60)
+        if log.enabled_for(60):
+            log.verbose("Candidates:\n", log.PP(candidates), verbosity=60)
         return candidates
 
-    @utils.cached
     def merge_group(self, equivalent_selectors):
         """Merge a group of equal-weighted selectors into a single
         combined selector.  Nominally this merges special case
@@ -1976,14 +2461,77 @@ Restore original debug behavior:
         dynamically helps keep rmaps small by factoring out the
         special cases and not repeating common info for every special
         case.
+
+        Merged groups are remembered in a bounded LRU cache of
+        CRDS_MERGE_CACHE_SIZE entries which is pickled with the selector.
         """
-        log.verbose("Merging equivalent selectors", equivalent_selectors, verbosity=60)
+        combined = self._merge_cache.get(equivalent_selectors)
+        if combined is not utils.LruCache.MISSING:
+            return combined
+        if log.enabled_for(60):
+            log.verbose("Merging equivalent selectors", equivalent_selectors, verbosity=60)
         combined = equivalent_selectors[0]
         for esel in equivalent_selectors[1:]:
             combined = combined.merge(esel)
-        log.verbose("Merge result:\n", log.Deferred(combined.format), verbosity=70)
+        if log.enabled_for(70):
+            log.verbose("Merge result:\n", log.Deferred(combined.format), verbosity=70)
+        self._merge_cache[equivalent_selectors] = combined
         return combined
 
+    def merge_cache_stats(self):
+        """Return the merge cache statistics of this selector and nested Match
+        selectors,  summed.
+        """
+        totals = super(MatchSelector, self).merge_cache_stats()
+        for name, value in self._merge_cache.stats().items():
+            totals[name] += value
+        return totals
+
+    def clear_merge_cache(self):
+        """Discard the merged selector groups remembered by this selector."""
+        self._merge_cache.clear()
+
+    # Maximum number of representative headers precompute_merges() tries per match tuple.
+    MERGE_PRECOMPUTE_LIMIT = 64
+
+    def precompute_merges(self):
+        """Merge the groups of equally weighted selections matched by headers made
+        from the literal values of each match tuple,  as well as any merges required
+        by nested selectors.   Return the number of groups merged.
+        """
+        merged = super(MatchSelector, self).precompute_merges()
+        if not self._merge_overlaps:
+            return merged
+        groups = set()
+        for header in self._representative_headers():
+            weights, remaining = self._winnow(header, dict(self._match_selections))
+            for _weight, match_tuples in self._rank_candidates(weights, remaining):
+                subselectors = tuple([remaining[match_tuple].choice for match_tuple in match_tuples])
+                if len(match_tuples) > 1 and isinstance(subselectors[0], Selector) and \
+                        match_tuples not in groups:
+                    groups.add(match_tuples)
+                    with log.verbose_warning_on_exception(
+                            "Failed precomputing merge for", self.short_name, repr(match_tuples)):
+                        self.merge_group(subselectors)
+        return merged + len(groups)
+
+    def _representative_headers(self):
+        """Generate a header for each combination of the literal values of each match
+        tuple,  up to MERGE_PRECOMPUTE_LIMIT per tuple.   Parameters matched by patterns
+        or N/A are bound to a value which matches no literal.
+        """
+        for matchers, _choice in self._match_selections.values():
+            columns = []
+            for matcher_obj in matchers:
+                if isinstance(matcher_obj, OrLiteralMatcher):
+                    columns.append(sorted(matcher_obj.values))
+                elif type(matcher_obj) in (Matcher, LiteralMatcher):
+                    columns.append([matcher_obj._key])
+                else:
+                    columns.append(["\0"])
+            for values in itertools.islice(itertools.product(*columns), self.MERGE_PRECOMPUTE_LIMIT):
+                yield dict(zip(self._parameters, values))
+
     def get_selector_value_map(self):
         """Return { parameter : set([values in use...]) }"""
         vmap = {}
@@ -2213,29 +2761,48 @@ Restore debug configuration.
     """
     error_class = UseAfterError
 
-    def get_selection(self, date):
-        log.verbose("Matching", date, " ", verbosity=60)
-        yield self.bsearch(date, self._selections)
+    def __init__(self, *args, **keys):
+        super(UseAfterSelector, self).__init__(*args, **keys)
+        self._reindex()
 
-    def bsearch(self, date, selections):
-        """Do a binary search over a sorted selections list."""
-        if len(selections) == 0:
+    def _reindex(self):
+        """Precompute the keys for bisect.   condition_selections() sorts self._selections
+        by the conditioned keys themselves,  e.g. the int tuples of VersionAfter,  not by
+        the string comparison of Selection.__lt__,  and merge() and delete() preserve that order.
+        """
+        self._selection_keys = [selection.key for selection in self._selections]
+
+    def get_selection(self, date):
+        if log.enabled_for(60):
+            log.verbose("Matching", date, " ", verbosity=60)
+        yield self.bsearch(date)
+
+    def bsearch(self, date):
+        """Do a binary search over the sorted selection keys,  returning the
+        selection with the greatest key <= `date`.
+
+        >>> u = UseAfterSelector(("DATE-OBS", "TIME-OBS"), {
+        ...        '2003-09-26 01:28:00':'nal1503ij_bia.fits',
+        ...        '2004-02-14 00:00:00':'o3913216j_bia.fits',
+        ...        '2004-04-25 21:31:00':'o5d10135j_bia.fits',
+        ... })
+        >>> u.bsearch('2004-02-14 00:00:00')
+        ('2004-02-14 00:00:00', 'o3913216j_bia.fits')
+        >>> u.bsearch('2004-04-25 21:30:59')
+        ('2004-02-14 00:00:00', 'o3913216j_bia.fits')
+        >>> u.bsearch('2003-09-26 01:27:59')
+        Traceback (most recent call last):
+        ...
+        UseAfterError: No selection <= '2003-09-26 01:27:59'
+        """
+        if _SELECTOR_STATS is not None:
+            increment_stat(self._rmap_name, "bsearches")
+        index = bisect.bisect_right(self._selection_keys, date) - 1
+        if index < 0:
             raise self.error_class("No selection <= " + repr(date))
-        elif len(selections) > 1:
-            left = selections[:len(selections)//2]
-            right = selections[len(selections)//2:]
-            compared = right[0].key
-            log.verbose("...against", compared, end="", verbosity=60)
-            if date >= compared:
-                return self.bsearch(date, right)
-            else:
-                return self.bsearch(date, left)
-        else:
-            if date >= selections[0].key:
-                log.verbose("matched", repr(selections[0]), verbosity=60)
-                return selections[0]
-            else:
-                raise self.error_class("No selection <= " + repr(date))
+        if log.enabled_for(60):
+            log.verbose("matched", repr(self._selections[index]), verbosity=60)
+        return self._selections[index]
 
     def _validate_raw_key(self, key, valid_values_map):
         """Validate a selector date/time field for this UseAfter."""
@@ -2298,7 +2865,7 @@ Restore debug configuration.
             merge_selections.append(appended)
         merge_selections.extend(ownsel)
         merge_selections.extend(othersel)
-        return self.__class__(self._parameters[:], merge_selections=merge_selections)
+        return self.__class__(self._parameters[:], rmap_header=self._rmap_header, merge_selections=merge_selections)
 
     def get_parkey_map(self):
         return { par:"*" for par in self._parameters}
@@ -2369,6 +2936,22 @@ Earlier than all entries
     ...
     VersionAfterError: No selection <= '0.0.1'
 
+Versions are ordered numerically,  not as strings where '1.10' < '1.9' < '10.1' < '2.0'
+
+    >>> u = VersionAfterSelector(("CAL_VER",), {
+    ...        '1.9':'test_19.json',
+    ...        '1.10':'test_110.json',
+    ...        '10.1':'test_101.json',
+    ...        '2.0':'test_20.json',
+    ... })
+    >>> [u.choose({'CAL_VER': version}) for version in ['1.9.5', '1.10', '1.11', '2.0', '9.9', '10.1']]
+    ['test_19.json', 'test_110.json', 'test_110.json', 'test_20.json', 'test_20.json', 'test_101.json']
+
+    >>> v = VersionAfterSelector(("CAL_VER",), {'1.9.9':'test_199.json', '10.0':'test_100.json'})
+    >>> m = u.merge(v)
+    >>> [m.choose({'CAL_VER': version}) for version in ['1.9.9', '1.10', '9.9', '10.0', '10.1']]
+    ['test_199.json', 'test_110.json', 'test_20.json', 'test_100.json', 'test_101.json']
+
 VersionAfter versions should look like x, x.y, x.y.z
 
     >>> u = VersionAfterSelector(("CAL_VER",), {
@@ -2498,9 +3081,17 @@ class ClosestTimeSelector(UseAfterSelector):
     'cref_flatfield_123.fits'
     """
     def get_selection(self, date):
-        import numpy as np
-        diff = np.array([abs_time_delta(date, key) for key in self.keys()], 'f')
-        index = np.argmin(diff)
+        """Bisect the sorted selection keys for `date` and yield whichever neighbor is
+        closer in time,  the earlier selection when both are equally close.
+        """
+        if not self._selection_keys:
+            raise self.error_class("No selection near " + repr(date))
+        index = bisect.bisect_left(self._selection_keys, date)
+        if index == len(self._selection_keys):
+            index -= 1
+        elif index > 0 and abs_time_delta(date, self._selection_keys[index-1]) <= \
+                abs_time_delta(date, self._selection_keys[index]):
+            index -= 1
         yield self._selections[index]
 
 # ==============================================================================
@@ -2556,17 +3147,76 @@ Effective_wavelength doesn't have to be covered by valid_values_map:
     ...
     ValidationError: GeometricallyNearest Invalid number for 'effective_wavelength' value='foo'
 
+Keys are compared numerically as float64,  not as conditioned strings,  and many
+values can be looked up in one vectorized call:
+
+    >>> r = GeometricallyNearestSelector(("effective_wavelength",), {
+    ...  9.0 : "cref_flatfield_090.fits",
+    ...  10.0 : "cref_flatfield_100.fits",
+    ...  1.00000001 : "cref_flatfield_010.fits",
+    ...  1.00000003 : "cref_flatfield_011.fits",
+    ... })
+    >>> [sel.choice for sel in r.get_selections([9.6, 1.00000003, 1.0, 100])]
+    ['cref_flatfield_100.fits', 'cref_flatfield_011.fits', 'cref_flatfield_010.fits', 'cref_flatfield_100.fits']
+
+A value equidistant from two keys selects the key which comes first in the
+selector's string ordering of its keys,  here 12.0 rather than 8.0:
+
+    >>> r = GeometricallyNearestSelector(("effective_wavelength",), {8.0 : "a8.fits", 12.0 : "b12.fits"})
+    >>> r.choose({"effective_wavelength" : "10.0"})
+    'b12.fits'
+
+Keys are converted to numbers when the selector is first used,  so a selector
+with a non-numeric key loads but fails on lookup:
+
+    >>> r = GeometricallyNearestSelector(("effective_wavelength",), {"abc" : "a8.fits", 12.0 : "b12.fits"})
+    >>> r.choose({"effective_wavelength" : "10.0"})
+    Traceback (most recent call last):
+    ...
+    ValueError: could not convert string to float: 'ABC'
     """
+    def __init__(self, *args, **keys):
+        super(GeometricallyNearestSelector, self).__init__(*args, **keys)
+        self._reindex()
+
+    def _reindex(self):
+        """Discard the cached numerical index of the selections,  rebuilt on the next lookup."""
+        self._numeric_index = None
+
+    def _get_numeric_index(self):
+        """Return the cached _NumericIndex of this selector's keys."""
+        if getattr(self, "_numeric_index", None) is None:
+            self._numeric_index = _NumericIndex(self._selections)
+        return self._numeric_index
+
     @classmethod
     def condition_key(cls, key):
         return utils.condition_value(key)
 
     def get_selection(self, keyval):
+        yield self.get_selections([keyval])[0]
+
+    def get_selections(self, keyvals):
+        """Return the list of selections nearest to each of the numbers in `keyvals`,
+        an array or sequence,  computed in a single vectorized search.   Where a value
+        is equidistant from two keys,  the key which comes first in the selector's
+        (string) order of keys is selected.
+        """
         import numpy as np
-        nkeys = np.array(self.keys(), dtype='f')
-        diff = np.abs(nkeys - keyval)
-        index = np.argmin(diff)
-        yield self._selections[index]
+        index = self._get_numeric_index()
+        if not len(index.selections):
+            raise CrdsLookupError("No selections for", self.short_name)
+        keys, ranks = index.keys, index.ranks
+        keyvals = np.asarray(keyvals, dtype=np.float64)
+        greater = np.clip(np.searchsorted(keys, keyvals), 1, max(len(keys)-1, 1))
+        less = greater - 1
+        if len(keys) == 1:
+            indices = np.zeros(len(keyvals), dtype=int)
+        else:
+            less_diff, greater_diff = np.abs(keyvals - keys[less]), np.abs(keys[greater] - keyvals)
+            tied = np.where(ranks[less] < ranks[greater], less, greater)
+            indices = np.where(less_diff < greater_diff, less, np.where(greater_diff < less_diff, greater, tied))
+        return [index.selections[i] for i in indices]
 
     def _validate_raw_key(self, key, valid_values_map):
         parname = self._parameters[0]
@@ -2620,7 +3270,26 @@ class BracketSelector(Selector):
 
     >>> r.choose({"effective_wavelength":'6.0'})
     ('cref_flatfield_137.fits', 'cref_flatfield_137.fits')
+
+    Many values can be bracketed in one vectorized call:
+
+    >>> [(sel.less.choice, sel.greater.choice) for sel in r.get_selections([1.0, 1.5, 2.0])]
+    [('cref_flatfield_120.fits', 'cref_flatfield_120.fits'), ('cref_flatfield_124.fits', 'cref_flatfield_124.fits'), ('cref_flatfield_124.fits', 'cref_flatfield_137.fits')]
     """
+    def __init__(self, *args, **keys):
+        super(BracketSelector, self).__init__(*args, **keys)
+        self._reindex()
+
+    def _reindex(self):
+        """Discard the cached numerical index of the selections,  rebuilt on the next lookup."""
+        self._numeric_index = None
+
+    def _get_numeric_index(self):
+        """Return the cached _NumericIndex of this selector's keys."""
+        if getattr(self, "_numeric_index", None) is None:
+            self._numeric_index = _NumericIndex(self._selections)
+        return self._numeric_index
+
     def get_selection(self, keyval):
         """Returns BracketSelection() corresponding to keyval.   This is an atypical
         Selection which is really two selections, right and left.   Consequently,  the
@@ -2633,17 +3302,30 @@ class BracketSelector(Selector):
         of Selection but is rather (less, greater) where `less` and `greater` are normal
         (key, choice) Selections.
         """
-        index = 0
-        selections = self._selections
-        while index < len(selections) and keyval > selections[index].key:
-            index += 1
-        if index == len(selections):
-            less, greater = selections[index-1], selections[index-1]
-        elif index == 0 or keyval == selections[index].key:
-            less, greater = selections[index], selections[index]
-        else:
-            less, greater = selections[index-1], selections[index]
-        yield BracketSelection(less, greater)   # XXXX non-standard interface
+        yield self.get_selections([keyval])[0]   # XXXX non-standard interface
+
+    def get_selections(self, keyvals):
+        """Return the list of BracketSelection's for each of the numbers in `keyvals`,
+        an array or sequence,  computed in a single vectorized search.
+        """
+        import numpy as np
+        index = self._get_numeric_index()
+        selections = index.selections
+        if not len(selections):
+            raise CrdsLookupError("No selections for", self.short_name)
+        keys = index.keys
+        keyvals = np.asarray(keyvals, dtype=np.float64)
+        indices = np.searchsorted(keys, keyvals)
+        brackets = []
+        for index, keyval in zip(indices, keyvals):
+            if index == len(selections):
+                less, greater = selections[index-1], selections[index-1]
+            elif index == 0 or keyval == keys[index]:
+                less, greater = selections[index], selections[index]
+            else:
+                less, greater = selections[index-1], selections[index]
+            brackets.append(BracketSelection(less, greater))
+        return brackets
 
     def get_choice(self, bracket_selection, header):
         """Return the paired choices of the BracketSelector based on an atypical
@@ -2884,7 +3566,34 @@ class SelectVersionSelector(Selector):
 
     >>> r.choose({"sw_version":'default'})
     'cref_flatfield_123.fits'
+
+    Without a default,  versions beyond every relation have no selection:
+
+    >>> r = SelectVersionSelector(("sw_version",), {
+    ...  '<3.1':    'cref_flatfield_65.fits',
+    ...  '= 5':     'cref_flatfield_73.fits',
+    ... })
+    >>> r.choose({"sw_version":'5.0'})
+    'cref_flatfield_73.fits'
+    >>> r.choose({"sw_version":'5.1'})
+    Traceback (most recent call last):
+    ...
+    IndexError: list index out of range
     """
+    def __init__(self, *args, **keys):
+        super(SelectVersionSelector, self).__init__(*args, **keys)
+        self._reindex()
+
+    def _reindex(self):
+        """Pre-normalize the sorted version relations into (version, relation) tuples
+        for bisection.   Relations with non-numerical versions are left to the linear
+        search so that comparisons report the same incompatible type errors.
+        """
+        if all(isinstance(selection.key.version, numbers.Number) for selection in self._selections):
+            self._relation_keys = [selection.key._cmpkey() for selection in self._selections]
+        else:
+            self._relation_keys = None
+
     def get_parkey_map(self):
         return {}
 
@@ -2897,9 +3606,15 @@ class SelectVersionSelector(Selector):
 
     def get_selection(self, version):
         """Based on `version`,  return the corresponding selection."""
-        index = 0
-        while self._selections[index][0] < version:
-            index += 1
+        index = None
+        if self._relation_keys:
+            relation = version if isinstance(version, VersionRelation) else VersionRelation(str(version))
+            if isinstance(relation.version, numbers.Number):
+                index = bisect.bisect_left(self._relation_keys, relation._cmpkey())
+        if index is None:
+            index = 0
+            while self._selections[index][0] < version:
+                index += 1
         yield self._selections[index]
 
     def _validate_raw_key(self, key, valid_values_map):
@@ -2915,6 +3630,22 @@ class SelectVersionSelector(Selector):
         self._validate_value(parname, header[parname], [])
         return header[parname]
 
+class _NumericIndex:
+    """The keys of numerically keyed `selections` as a float64 array in ascending
+    order,  the correspondingly ordered selections,  and the rank of each in the
+    original order of `selections`.
+
+    The index is built when a selector is first looked up,  so a selector with
+    non-numeric keys loads and fails only when it is used.
+    """
+    def __init__(self, selections):
+        import numpy as np
+        keys = np.array([float(selection.key) for selection in selections], dtype=np.float64)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.ranks = order
+        self.selections = [selections[index] for index in order]
+
 def abs_time_delta(time1, time2):
     """Return abs(time1 - time2) in total seconds."""
     date1 = timestamp.parse_date(time1)
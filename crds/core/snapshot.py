@@ -0,0 +1,379 @@
+"""This module defines a compact binary snapshot format for the closure of a CRDS
+context,  an alternative to pickling the fully loaded PipelineContext.
+
+A snapshot records the header, selector parameters, and comment of each mapping
+rather than live Mapping and Selector objects,  so it does not depend on class
+layout.   Snapshots are memory mapped and mappings are decoded only as they are
+demanded by the LazyFileDict selections of their parent contexts,  so a process
+which uses one instrument only decodes that instrument's imap and rmaps.
+
+Layout,  little endian:
+
+    magic              8 bytes      b"CRDSSNAP"
+    version            uint32
+    string count       uint32
+    strings offset     uint64
+    index offset       uint64
+    records            uint32 tokens,  one record per mapping,  grouped by instrument
+    strings            uint32 offsets[string count + 1],  then UTF-8 text
+    index              uint32 tokens,  { "context" : name,
+                                         "mappings" : { name : (offset, tokens) },
+                                         "instruments" : { instrument : (names, ...) } }
+
+Records and the index are token encoded values.  Each value is a tag token
+followed by its payload:  string, int, and float values refer to the string
+table,  containers give their length followed by their items,  and selectors
+give their name and number of (key, choice) pairs.   Each record is the tuple
+(header, selector, comment) of a mapping.
+
+>>> import tempfile
+>>> from crds.core import rmap
+>>> r = rmap.ReferenceMapping.from_string('''
+... header = {
+...     'derived_from' : 'by hand',
+...     'filekind' : 'DARKFILE',
+...     'instrument' : 'ACS',
+...     'mapping' : 'REFERENCE',
+...     'name' : 'hst_acs_darkfile.rmap',
+...     'observatory' : 'HST',
+...     'parkey' : (('DETECTOR',), ('DATE-OBS', 'TIME-OBS')),
+... }
+... selector = Match({
+...     ('HRC',) : UseAfter({
+...         '1992-01-01 00:00:00' : 'lcb12060j_drk.fits',
+...     }),
+... })
+... ''', "hst_acs_darkfile.rmap", ignore_checksum=True)
+>>> with tempfile.TemporaryDirectory() as tmpdir:
+...     save_snapshot(tmpdir + "/hst_acs_darkfile.rmap.snap", r)
+...     loaded = load_snapshot(tmpdir + "/hst_acs_darkfile.rmap.snap")
+>>> loaded
+ReferenceMapping('hst_acs_darkfile.rmap')
+>>> loaded.format() == r.format()
+True
+
+Snapshots can also be published in shared memory so that many worker processes
+on a node attach to a single copy of a context's tables instead of each loading
+their own.   Published snapshots are named "shm://<segment name>":
+
+>>> segment = publish_shared(r, "crds_doctest_" + str(os.getpid()) + ".rmap")
+>>> attached = load_snapshot("shm://" + segment.name)
+>>> attached.format() == r.format()
+True
+>>> segment.close(); segment.unlink()
+"""
+import os
+import sys
+import mmap
+import struct
+from array import array
+from multiprocessing import shared_memory, resource_tracker
+
+# ============================================================================
+
+from . import rmap, log, utils, selectors
+from .exceptions import SnapshotFormatError
+
+# ============================================================================
+
+MAGIC = b"CRDSSNAP"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sIIQQ")
+
+# Token tags
+NONE, TRUE, FALSE, STR, INT, FLOAT, TUPLE, LIST, DICT, SELECTOR = range(10)
+
+MAPPING_CLASSES = {
+    "pipeline" : rmap.PipelineContext,
+    "instrument" : rmap.InstrumentContext,
+    "reference" : rmap.ReferenceMapping,
+}
+
+# ============================================================================
+
+class _SnapshotWriter:
+    """Accumulates the string table and token records of a snapshot."""
+
+    def __init__(self):
+        self.strings = {}
+        self.records = array("I")
+
+    def intern(self, string):
+        """Return the string table index of `string`,  adding it as needed."""
+        index = self.strings.get(string)
+        if index is None:
+            index = self.strings[string] = len(self.strings)
+        return index
+
+    def encode(self, value, tokens):
+        """Append the tokens for `value` to array `tokens`."""
+        if value is None:
+            tokens.append(NONE)
+        elif value is True:
+            tokens.append(TRUE)
+        elif value is False:
+            tokens.append(FALSE)
+        elif isinstance(value, str):
+            tokens.extend((STR, self.intern(value)))
+        elif isinstance(value, int):
+            tokens.extend((INT, self.intern(str(value))))
+        elif isinstance(value, float):
+            tokens.extend((FLOAT, self.intern(repr(value))))
+        elif isinstance(value, (tuple, list)):
+            tokens.extend((TUPLE if isinstance(value, tuple) else LIST, len(value)))
+            for item in value:
+                self.encode(item, tokens)
+        elif isinstance(value, dict):
+            tokens.extend((DICT, len(value)))
+            for key, item in dict.items(value):   # raw values,  not LowerCaseDict's
+                self.encode(key, tokens)
+                self.encode(item, tokens)
+        elif isinstance(value, selectors.Selector):
+            raw = value._raw_selections
+            tokens.extend((SELECTOR, self.intern(value.short_name), len(raw)))
+            for selection in raw:
+                self.encode(selection.key, tokens)
+                self.encode(selection.choice, tokens)
+        else:
+            raise SnapshotFormatError("Can't snapshot value of type " + repr(type(value).__name__))
+
+    def add_mapping(self, mapping):
+        """Append the record for `mapping` and return its (offset, tokens) relative
+        to the start of the records.
+        """
+        start = len(self.records)
+        self.encode((mapping.header, mapping.selector, mapping.comment), self.records)
+        return 4 * start, len(self.records) - start
+
+    def tobytes(self, index):
+        """Return the snapshot file contents for the accumulated records and `index`."""
+        index_tokens = array("I")
+        self.encode(index, index_tokens)
+        encoded = [string.encode("utf-8") for string in self.strings]
+        offsets = array("I", [0])
+        for string in encoded:
+            offsets.append(offsets[-1] + len(string))
+        if sys.byteorder == "big":
+            for tokens in [self.records, index_tokens, offsets]:
+                tokens.byteswap()
+        records = self.records.tobytes()
+        strings = offsets.tobytes() + b"".join(encoded)
+        strings += b"\0" * (-len(strings) % 4)
+        strings_offset = _HEADER.size + len(records)
+        index_offset = strings_offset + len(strings)
+        header = _HEADER.pack(MAGIC, VERSION, len(encoded), strings_offset, index_offset)
+        return header + records + strings + index_tokens.tobytes()
+
+def _walk(name, mapping):
+    """Yield (name, mapping) for `mapping` and all the mappings it refers to,  named
+    as their parent contexts refer to them and loading them as needed.
+    """
+    yield name, mapping
+    if isinstance(mapping, rmap.ContextMapping):
+        for key, nested_name in sorted(mapping.selector.items()):
+            if not mapping.selections.is_special_value(nested_name):
+                yield from _walk(nested_name, mapping.selections[key])
+
+def dumps(mapping):
+    """Return the snapshot file contents for `mapping` and its closure."""
+    writer = _SnapshotWriter()
+    mappings, instruments = {}, {}
+    if isinstance(mapping, rmap.PipelineContext):
+        mappings[mapping.filename] = writer.add_mapping(mapping)
+        groups = [(key.lower(), name, mapping.selections[key])
+                  for (key, name) in sorted(mapping.selector.items())
+                  if not mapping.selections.is_special_value(name)]
+    elif isinstance(mapping, rmap.InstrumentContext):
+        groups = [(mapping.instrument, mapping.filename, mapping)]
+    else:
+        groups = [(None, mapping.filename, mapping)]
+    for instrument, top_name, top in groups:
+        names = []
+        for name, nested in _walk(top_name, top):
+            if name not in mappings:
+                mappings[name] = writer.add_mapping(nested)
+            names.append(name)
+        if instrument is not None:
+            instruments[instrument] = tuple(names)
+    mappings = { name : (_HEADER.size + offset, count) for (name, (offset, count)) in mappings.items() }
+    return writer.tobytes(dict(context=mapping.filename, mappings=mappings, instruments=instruments))
+
+def save_snapshot(filename, mapping):
+    """Write the snapshot of `mapping` and its closure to `filename`."""
+    contents = dumps(mapping)
+    with open(filename, "wb+") as handle:
+        handle.write(contents)
+
+# ============================================================================
+
+class ContextSnapshot:
+    """Lazily decodes the mappings of snapshot `data`,  a bytes-like or mmap object.
+    Mappings loaded from the snapshot load their nested mappings from it on demand.
+    """
+    def __init__(self, data, filename=None, owner=None):
+        self._data = data
+        self._owner = owner   # object keeping `data` mapped,  e.g. a SharedMemory segment
+        self.filename = filename
+        if len(data) < _HEADER.size:
+            raise SnapshotFormatError("Context snapshot " + repr(filename) + " is truncated.")
+        magic, version, nstrings, strings_offset, index_offset = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise SnapshotFormatError("File " + repr(filename) + " is not a CRDS context snapshot.")
+        if version != VERSION:
+            raise SnapshotFormatError(
+                "Unsupported context snapshot version " + repr(version) + " for " + repr(filename))
+        offsets = self._tokens(strings_offset, nstrings + 1)
+        self._string_offsets = offsets
+        self._text_offset = strings_offset + 4 * (nstrings + 1)
+        self._strings = [None] * nstrings
+        self.index = self._decode(self._tokens(index_offset, (len(data) - index_offset) // 4))
+
+    def __reduce__(self):
+        """Pickle snapshot backed mappings by reopening the snapshot file."""
+        return (open_snapshot, (self.filename,))
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + repr(self.filename) + ")"
+
+    @property
+    def context(self):
+        """Name of the top level mapping of this snapshot."""
+        return self.index["context"]
+
+    @property
+    def instruments(self):
+        """Instruments of this snapshot,  each with the list of mappings in its closure."""
+        return self.index["instruments"]
+
+    def _tokens(self, offset, count):
+        """Return the `count` uint32 tokens at byte `offset` as an array."""
+        tokens = array("I")
+        tokens.frombytes(self._data[offset : offset + 4 * count])
+        if sys.byteorder == "big":
+            tokens.byteswap()
+        return tokens
+
+    def _string(self, index):
+        """Return string table entry `index`,  decoding it on first use."""
+        string = self._strings[index]
+        if string is None:
+            start = self._text_offset + self._string_offsets[index]
+            stop = self._text_offset + self._string_offsets[index + 1]
+            string = self._strings[index] = sys.intern(str(self._data[start:stop], "utf-8"))
+        return string
+
+    def _decode(self, tokens):
+        """Return the value encoded by the uint32 `tokens`."""
+        next_token = iter(tokens).__next__
+        string = self._string
+
+        def decode():
+            tag = next_token()
+            if tag == STR:
+                return string(next_token())
+            elif tag == TUPLE:
+                return tuple([decode() for _i in range(next_token())])
+            elif tag == DICT:
+                return { decode() : decode() for _i in range(next_token()) }
+            elif tag == SELECTOR:
+                name = string(next_token())
+                return selectors.SELECTORS[name]({ decode() : decode() for _i in range(next_token()) })
+            elif tag == LIST:
+                return [decode() for _i in range(next_token())]
+            elif tag == NONE:
+                return None
+            elif tag == TRUE:
+                return True
+            elif tag == FALSE:
+                return False
+            elif tag == INT:
+                return int(string(next_token()))
+            elif tag == FLOAT:
+                return float(string(next_token()))
+            raise SnapshotFormatError("Invalid token " + repr(tag) + " in context snapshot " + repr(self.filename))
+
+        try:
+            return decode()
+        except StopIteration:
+            raise SnapshotFormatError("Context snapshot " + repr(self.filename) + " is truncated.") from None
+
+    def load_mapping(self, name, **keys):
+        """Decode and return mapping `name` from this snapshot,  the LazyFileDict
+        loader for the nested mappings of snapshot mappings.
+        """
+        try:
+            offset, count = self.index["mappings"][name]
+        except KeyError:
+            raise SnapshotFormatError(
+                "Mapping " + repr(name) + " is not in context snapshot " + repr(self.filename)) from None
+        header, selector, comment = self._decode(self._tokens(offset, count))
+        cls = MAPPING_CLASSES[header["mapping"].lower()]
+        keys["loader"] = self.load_mapping
+        return cls.from_namespace(dict(header=header, selector=selector, comment=comment), name, **keys)
+
+    def load(self, **keys):
+        """Return the top level mapping of this snapshot."""
+        return self.load_mapping(self.context, **keys)
+
+def open_snapshot(uri):
+    """Return the ContextSnapshot at `uri`,  memory mapping local files and
+    attaching to shared memory for "shm://" URIs.
+    """
+    if uri.startswith(SHARED_PREFIX):
+        return attach_shared(uri[len(SHARED_PREFIX):])
+    if uri.startswith(("s3://", "http://", "https://")):
+        return ContextSnapshot(utils.get_uri_content(uri, mode="binary"), uri)
+    with open(uri, "rb") as handle:
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    return ContextSnapshot(data, uri)
+
+def load_snapshot(uri, **keys):
+    """Return the top level mapping of the snapshot at `uri`.   Nested mappings
+    are decoded as they are accessed.
+    """
+    snapshot = open_snapshot(uri)
+    log.verbose("Opened context snapshot", repr(uri), "with",
+                len(snapshot.index["mappings"]), "mappings", verbosity=55)
+    return snapshot.load(**keys)
+
+# ============================================================================
+
+SHARED_PREFIX = "shm://"
+
+_PUBLISHED = set()   # names of the segments published by this process
+
+def shared_memory_name(mapping):
+    """Return the shared memory segment name for the snapshot of `mapping`.
+
+    >>> shared_memory_name("/cache/mappings/hst/hst_1000.pmap")
+    'crds_hst_1000.pmap'
+    """
+    return "crds_" + os.path.basename(mapping)
+
+def publish_shared(mapping, name=None):
+    """Publish the snapshot of `mapping` and its closure in a new shared memory
+    segment named `name`,  by default shared_memory_name(mapping.filename).
+
+    Return the SharedMemory segment,  which the publisher should keep open for
+    as long as the context is published and unlink() when it is retired.
+    """
+    contents = dumps(mapping)
+    name = name or shared_memory_name(mapping.filename)
+    segment = shared_memory.SharedMemory(name=name, create=True, size=len(contents))
+    segment.buf[:len(contents)] = contents
+    _PUBLISHED.add(name)
+    log.verbose("Published context snapshot", repr(mapping.filename), "as",
+                repr(SHARED_PREFIX + name), "with", len(contents), "bytes", verbosity=55)
+    return segment
+
+def attach_shared(name):
+    """Return the ContextSnapshot published in shared memory segment `name`,
+    raising FileNotFoundError if it has not been published.
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    # Attaching registers the segment with this process's resource tracker,
+    # which would unlink it when this process exits.   Only the publisher may.
+    if name not in _PUBLISHED:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    return ContextSnapshot(segment.buf, SHARED_PREFIX + name, owner=segment)
@@ -11,7 +11,9 @@ import re
 import hashlib
 import io
 import functools
-from collections import Counter, defaultdict
+import threading
+import time
+from collections import Counter, defaultdict, OrderedDict
 import datetime
 import ast
 import gc
@@ -167,7 +169,8 @@ def cached(func):
     fetches results for prior calls from the cache.   The wrapped function has
     extra attributes:
 
-    .cache                      -- { key(parameters): old_result } dictionary
+    .cache                      -- { key(parameters): old_result } FunctionCache
+    .stats()                    -- cache size and hit, miss, and eviction counts
     .uncached(*args, **keys)    -- original unwrapped function
     .readonly(*args, **keys)    -- function variant which uses but doesn't update cache
     .cache_key(*args, **keys)   -- returns tuple used to locate a function call result
@@ -188,7 +191,7 @@ def cached(func):
     >>> sum(1,2)
     3
 
-    Dump or operate on the cache like this, it's just a dict:
+    Dump or operate on the cache like this, it acts like a dict:
 
     >>> sum.cache
     {(1, 2): 3}
@@ -245,6 +248,20 @@ class xcached:
 
     >>> sum.readonly(2,2,3)
     6
+
+    maxsize,  maxbytes,  and ttl bound the cache as described for FunctionCache:
+
+    >>> @xcached(maxsize=1)
+    ... def square(x):
+    ...     return x * x
+
+    >>> square(2), square(3), square(3)
+    (4, 9, 9)
+    >>> square.cache
+    {(3,): 9}
+    >>> stats = square.stats()
+    >>> stats["hits"], stats["misses"], stats["evictions"]
+    (1, 2, 1)
     """
     def __init__(self, *args, **keys):
         """Stash the decorator parameters"""
@@ -263,19 +280,44 @@ class xcached:
 class CachedFunction:
     """Class to support the @cached function decorator.   Called at runtime
     for typical caching version of function.
+
+    Results are kept in a FunctionCache bounded by `maxsize`, `maxbytes`, and
+    `ttl`.   Calls are thread safe,  and concurrent calls with the same cache key
+    wait for the first to compute the result rather than computing it again:
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> calls = []
+    >>> @cached
+    ... def slow(x):
+    ...     calls.append(x)
+    ...     time.sleep(0.1)
+    ...     return x
+
+    >>> with ThreadPoolExecutor(4) as pool:
+    ...     list(pool.map(slow, [1, 1, 1, 1]))
+    [1, 1, 1, 1]
+    >>> calls
+    [1]
     """
 
     cache_set = set()
 
-    def __init__(self, func, omit_from_key=None):
-        self.cache = dict()
+    def __init__(self, func, omit_from_key=None, maxsize=None, maxbytes=None, ttl=None, sizeof=sys.getsizeof):
+        self.cache = FunctionCache(maxsize=maxsize, maxbytes=maxbytes, ttl=ttl, sizeof=sizeof)
         self.uncached = func
         self.omit_from_key = [] if omit_from_key is None else omit_from_key
+        self._lock = threading.RLock()
+        self._pending = {}   # { cache_key : (threading.Event, computing thread ident) }
         self.cache_set.add(self)
         self.__doc__ = self.uncached.__doc__
         self.__module__ = self.uncached.__module__
         self.__name__ = self.uncached.__name__ + " [cached]"
 
+    @property
+    def qualified_name(self):
+        """Module qualified name of the cached function, e.g. 'crds.core.rmap._load_mapping'."""
+        return self.uncached.__module__ + "." + self.uncached.__qualname__
+
     def cache_key(self, *args, **keys):
         """Compute the cache key for the given parameters."""
         args = tuple([ a for (i, a) in enumerate(args) if i not in self.omit_from_key])
@@ -285,9 +327,11 @@ class CachedFunction:
     def _readonly(self, *args, **keys):
         """Compute (cache_key, func(*args, **keys)).   Do not add to cache."""
         key = self.cache_key(*args, **keys)
-        if key in self.cache:
+        with self._lock:
+            result = self.cache.get(key)
+        if result is not FunctionCache.MISSING:
             log.verbose("Cached call", self.uncached.__name__, repr(key), verbosity=80)
-            return key, self.cache[key]
+            return key, result
         else:
             log.verbose("Uncached call", self.uncached.__name__, repr(key), verbosity=80)
             return key, self.uncached(*args, **keys)
@@ -303,10 +347,50 @@ class CachedFunction:
         """Compute or fetch func(*args, **keys).  Add the result to the cache.
         return func(*args, **keys)
         """
-        key, result = self._readonly(*args, **keys)
-        self.cache[key] = result
+        key = self.cache_key(*args, **keys)
+        while True:
+            with self._lock:
+                result = self.cache.get(key)
+                if result is not FunctionCache.MISSING:
+                    log.verbose("Cached call", self.uncached.__name__, repr(key), verbosity=80)
+                    return result
+                pending = self._pending.get(key)
+                if pending is None:
+                    done = threading.Event()
+                    self._pending[key] = (done, threading.get_ident())
+                    break
+            done, owner = pending
+            if owner == threading.get_ident():   # recursive call for the same key
+                return self.uncached(*args, **keys)
+            done.wait()   # for the computing thread,  then look again
+        try:
+            log.verbose("Uncached call", self.uncached.__name__, repr(key), verbosity=80)
+            result = self.uncached(*args, **keys)
+            with self._lock:
+                self.cache[key] = result
+        finally:
+            with self._lock:
+                del self._pending[key]
+            done.set()
         return result
 
+    def setdefault(self, key, value):
+        """Return the result cached for `key`,  first caching `value` for it if
+        there is none,  as computed elsewhere for cache_key(...) `key`.
+        """
+        with self._lock:
+            return self.cache.setdefault(key, value)
+
+    def clear(self):
+        """Discard all the cached results of this function."""
+        with self._lock:
+            self.cache.clear()
+
+    def stats(self):
+        """Return a dictionary of the cache size and lookup statistics of this function."""
+        with self._lock:
+            return self.cache.stats()
+
     def __get__(self, obj, objtype):
         '''Support instance methods.'''
         return functools.partial(self.__call__, obj)
@@ -315,12 +399,281 @@ def clear_function_caches():
     "Clear all the caches created using @utils.cached or @utils.xcached."""
     for cache_func in CachedFunction.cache_set:
         log.verbose("Clearing cache for", repr(cache_func.uncached), verbosity=80)
-        cache_func.cache = dict()
+        cache_func.clear()
+
+def cached_function_stats():
+    """Return { qualified function name : cache statistics } for all the functions
+    supporting caching under @utils.cached or @utils.xcached.
+    """
+    return { cache_func.qualified_name : cache_func.stats() for cache_func in list(CachedFunction.cache_set) }
 
 def list_cached_functions():
-    """List all the functions supporting caching under @utils.cached or @utils.xcached."""
-    for cache_func in sorted(CachedFunction.cache_set):
-        print(repr(cache_func.uncached))
+    """List all the functions supporting caching under @utils.cached or @utils.xcached
+    with their cache statistics.
+    """
+    for name, stats in sorted(cached_function_stats().items()):
+        print(name, " ".join("{}={}".format(key, value) for (key, value) in stats.items()))
+
+# ===================================================================
+
+class LruCache:
+    """A bounded dictionary-like cache which discards the least recently used
+    items when it grows beyond `maxsize` entries.   Lookups and evictions are
+    counted to support tuning.   A `maxsize` of 0 disables caching.
+
+    LruCache is used by threads concurrently without locking:  each OrderedDict
+    operation is atomic,  and a key evicted by another thread between two of them
+    just costs a lookup.   The counters are approximate under concurrency.
+
+    >>> cache = LruCache(maxsize=2)
+    >>> cache.get("a") is LruCache.MISSING
+    True
+    >>> cache["a"] = 1
+    >>> cache["b"] = 2
+    >>> cache.get("a")
+    1
+
+    Adding "c" evicts "b",  the least recently used key:
+
+    >>> cache["c"] = 3
+    >>> sorted(cache.keys())
+    ['a', 'c']
+    >>> cache.stats()
+    {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+    >>> cache.clear()
+    >>> len(cache), cache.stats()["hits"]
+    (0, 1)
+
+    >>> disabled = LruCache(maxsize=0)
+    >>> disabled["a"] = 1
+    >>> len(disabled)
+    0
+    """
+
+    MISSING = object()
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        """Return the value cached for `key`,  or `default` if not found.
+        Count hits and misses.
+        """
+        value = self._lookup(key)
+        if value is self.MISSING:
+            self.misses += 1
+            return default
+        try:
+            self._items.move_to_end(key)
+        except KeyError:   # evicted by another thread
+            pass
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        if self._disabled():
+            return
+        self._store(key, value)
+        while self._over_limit():
+            if not self._discard_oldest():
+                break
+            self.evictions += 1
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is self.MISSING:
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key):
+        self._discard(key)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not self.MISSING
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def keys(self):
+        """Return the cached keys in order from least to most recently used."""
+        return list(self._items.keys())
+
+    def values(self):
+        """Return the cached values in order from least to most recently used."""
+        return [self._value_of(entry) for entry in list(self._items.values())]
+
+    def items(self):
+        """Return the cached (key, value) pairs in order from least to most recently used."""
+        return [(key, self._value_of(entry)) for (key, entry) in list(self._items.items())]
+
+    def setdefault(self, key, value):
+        """Return the value cached for `key`,  caching and returning `value` if there is none."""
+        existing = self._lookup(key)
+        if existing is self.MISSING:
+            self[key] = value
+            return value
+        return existing
+
+    def clear(self):
+        """Discard all cached items,  preserving the lookup counters."""
+        self._items.clear()
+
+    def stats(self):
+        """Return a dictionary of cache size and lookup statistics."""
+        return dict(size=len(self._items), maxsize=self.maxsize,
+                    hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+    # The methods below define how entries are stored and bounded,  and are
+    # overridden by subclasses which store more than the value.
+
+    def _lookup(self, key):
+        """Return the value cached for `key` or MISSING without counting a lookup."""
+        entry = self._items.get(key, self.MISSING)
+        return entry if entry is self.MISSING else self._value_of(entry)
+
+    def _value_of(self, entry):
+        """Return the value stored in cache `entry`."""
+        return entry
+
+    def _store(self, key, value):
+        """Cache `value` for `key` as the most recently used item."""
+        self._items[key] = value
+        try:
+            self._items.move_to_end(key)
+        except KeyError:   # evicted by another thread
+            pass
+
+    def _discard(self, key):
+        """Remove `key` from the cache."""
+        del self._items[key]
+
+    def _discard_oldest(self):
+        """Remove the least recently used item,  returning False if there was none."""
+        try:
+            self._items.popitem(last=False)
+        except KeyError:   # emptied by another thread
+            return False
+        return True
+
+    def _disabled(self):
+        """Return True if nothing should be cached."""
+        return self.maxsize <= 0
+
+    def _over_limit(self):
+        """Return True if the cache holds more than it should."""
+        return len(self._items) > self.maxsize
+
+class FunctionCache(LruCache):
+    """The dictionary-like result cache of a @cached function.   Values are
+    discarded least recently used first when there are more than `maxsize` of
+    them or their estimated sizes total more than `maxbytes`,  and expire `ttl`
+    seconds after they are cached.   A `maxsize` of None defaults to
+    CRDS_CACHED_FUNCTION_SIZE,  and 0 is unbounded.   Value sizes are estimated
+    by `sizeof`,  by default sys.getsizeof() which does not count the objects a
+    value refers to.
+
+    >>> cache = FunctionCache(maxsize=2)
+    >>> cache["a"] = 1
+    >>> cache["b"] = 2
+    >>> cache.get("a")
+    1
+    >>> cache["c"] = 3
+    >>> cache
+    {'a': 1, 'c': 3}
+
+    >>> now = [0.0]
+    >>> cache = FunctionCache(maxbytes=10, ttl=60, sizeof=len, clock=lambda: now[0])
+    >>> cache["a"] = "x" * 6
+    >>> cache["b"] = "y" * 6
+    >>> list(cache)
+    ['b']
+    >>> now[0] = 61.0
+    >>> "b" in cache
+    False
+    >>> cache.stats()
+    {'size': 0, 'maxsize': None, 'nbytes': 0, 'maxbytes': 10, 'ttl': 60, 'hits': 0, 'misses': 0, 'evictions': 1, 'expirations': 1}
+    """
+    def __init__(self, maxsize=None, maxbytes=None, ttl=None, sizeof=sys.getsizeof, clock=time.monotonic):
+        super(FunctionCache, self).__init__(maxsize)
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.clock = clock
+        self.nbytes = 0
+        self.expirations = 0
+
+    def clear(self):
+        """Discard all cached items,  preserving the lookup counters."""
+        super(FunctionCache, self).clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """Return a dictionary of cache size and lookup statistics."""
+        return dict(size=len(self._items), maxsize=self.maxsize, nbytes=self.nbytes, maxbytes=self.maxbytes,
+                    ttl=self.ttl, hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    expirations=self.expirations)
+
+    # Entries are (value, expiration time or None, size).
+
+    def _lookup(self, key):
+        """Return the unexpired value for `key` or MISSING without counting a lookup."""
+        try:
+            value, expires, _size = self._items[key]
+        except KeyError:
+            return self.MISSING
+        if expires is not None and self.clock() >= expires:
+            self._discard(key)
+            self.expirations += 1
+            return self.MISSING
+        return value
+
+    def _value_of(self, entry):
+        """Return the value stored in cache `entry`."""
+        return entry[0]
+
+    def _store(self, key, value):
+        """Cache `value` for `key` with its expiration time and size."""
+        if key in self._items:
+            self._discard(key)
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        self._items[key] = (value, expires, size)
+        self.nbytes += size
+
+    def _discard(self, key):
+        """Remove `key` and its size from the cache."""
+        _value, _expires, size = self._items.pop(key)
+        self.nbytes -= size
+
+    def _discard_oldest(self):
+        """Remove the least recently used item and its size."""
+        _key, (_value, _expires, size) = self._items.popitem(last=False)
+        self.nbytes -= size
+        return True
+
+    def _disabled(self):
+        """Return False,  a FunctionCache always caches."""
+        return False
+
+    def _over_limit(self):
+        """Return True if the cache holds more than `maxsize` items or `maxbytes`,  always
+        keeping the most recent item.
+        """
+        maxsize = self.maxsize if self.maxsize is not None else config.CACHED_FUNCTION_SIZE.get()
+        return len(self._items) > 1 and (
+            (maxsize and len(self._items) > maxsize) or
+            (self.maxbytes is not None and self.nbytes > self.maxbytes))
 
 # ===================================================================
 
@@ -936,6 +1289,28 @@ def condition_header(header, needed_keys=None):
     conditioned = { key:condition_value(header[key]) for key in needed_keys }
     return conditioned
 
+def condition_headers(headers):
+    """Return the list of condition_header() results for each of the sequence of
+    `headers`,  conditioning each distinct value only once.
+
+    >>> condition_headers([{"detector" : "hrc", "ccdgain" : 1}, {"DETECTOR" : "hrc", "CCDGAIN" : True}])
+    [{'DETECTOR': 'HRC', 'CCDGAIN': '1.0'}, {'DETECTOR': 'HRC', 'CCDGAIN': 'T'}]
+    """
+    values = {}
+    results = []
+    for header in headers:
+        conditioned = {}
+        for key, value in header.items():
+            value_key = (type(value), value)   # True == 1 but conditions differently
+            try:
+                conditioned[key.upper()] = values[value_key]
+            except KeyError:
+                conditioned[key.upper()] = values[value_key] = condition_value(value)
+            except TypeError:
+                conditioned[key.upper()] = condition_value(value)
+        results.append(conditioned)
+    return results
+
 def _eval_keys(keys):
     """Return the replacement mapping from rmap-visible parkeys to eval-able keys.
 
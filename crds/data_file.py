@@ -44,7 +44,7 @@ def get_header(filepath, needed_keys=(), original_name=None, observatory=None):
 # A clearer name
 get_unconditioned_header = get_header
 
-@utils.cached
+@utils.xcached(maxsize=1000)
 # @utils.gc_collected
 def get_free_header(filepath, needed_keys=(), original_name=None, observatory=None):
     """Return the complete unconditioned header dictionary of a reference file.
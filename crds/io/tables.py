@@ -25,7 +25,7 @@ def ntables(filename):
     else:
         return 1
 
-@utils.cached
+@utils.xcached(maxsize=100)
 def tables(filename):
     """Return [ SimpleTable(filename, segment), ... ] for each table segment in filename.
 
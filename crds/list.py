@@ -4,6 +4,7 @@ server.   More generally it's for printing out information on CRDS files.
 """
 import os.path
 import sys
+import time
 from collections import OrderedDict
 import json
 
@@ -362,6 +363,9 @@ jwst_niriss_superbias_0005.rmap
         self.add_argument("--file-properties", nargs="*", default=None,
                           help="print the instrument, filekind, filename for each of the files specified.")
 
+        self.add_argument("--benchmark-loaders", action="store_true",
+            help="time loading the specified contexts with the 'exec' and 'ast' mapping loaders (CRDS_MAPPING_LOADER).")
+
         super(ListScript, self).add_args()
 
     def main(self):
@@ -409,6 +413,9 @@ jwst_niriss_superbias_0005.rmap
         if self.args.required_parkeys:
             self.list_required_parkeys()
 
+        if self.args.benchmark_loaders:
+            self.benchmark_loaders()
+
         return log.errors()
 
     def list_resolved_contexts(self):
@@ -692,6 +699,23 @@ jwst_niriss_superbias_0005.rmap
              ])
         _print_dict(None, status)
 
+    def benchmark_loaders(self):
+        """Print the time taken to load each of self.contexts from the file system
+        using each CRDS_MAPPING_LOADER.
+        """
+        old_loader = config.MAPPING_LOADER.get()
+        try:
+            for context in self.contexts:
+                for loader in ["exec", "ast"]:
+                    config.MAPPING_LOADER.set(loader)
+                    start = time.perf_counter()
+                    mapping = rmap.load_mapping(context)
+                    elapsed = time.perf_counter() - start
+                    print("{:<30} {:<5} {:>4} mappings {:>10.4f} seconds".format(
+                        context, loader, len(mapping.mapping_names()), elapsed))
+        finally:
+            config.MAPPING_LOADER.set(old_loader)
+
     def list_required_parkeys(self):
         """Print out the parkeys required for matching using the specified contexts."""
         for name in self.contexts:
@@ -42,7 +42,7 @@ def update_derivation(new_path, old_basename=None):
     """Set the 'derived_from' and 'name' header fields of `new_path`.
     This function works for all Mapping classes:  pmap, imap, and rmap.
     """
-    new = rmap.fetch_mapping(new_path)
+    new = rmap.fetch_mapping(new_path).copy()
     if old_basename is None:    # assume new is a copy of old, with old's name in header
         derived_from = new.name
     else:
@@ -97,7 +97,7 @@ def rmap_insert_references(old_rmap, new_rmap, inserted_references, observatory=
     Return None,  `new_rmap` is already the implicit result
     """
     observatory = utils.file_to_observatory(inserted_references[0]) if observatory is None else observatory
-    new = old = rmap.fetch_mapping(old_rmap, ignore_checksum=True)
+    new = old = rmap.fetch_mapping(old_rmap, ignore_checksum=True).copy()
     inserted_cases = {}
     for reference in inserted_references:
         log.info("Inserting", os.path.basename(reference), "into", repr(new.name))
@@ -132,7 +132,7 @@ def rmap_delete_references(old_rmap, new_rmap, deleted_references):
 
     Return new ReferenceMapping named `new_rmap`
     """
-    new = old = rmap.fetch_mapping(old_rmap, ignore_checksum=True)
+    new = old = rmap.fetch_mapping(old_rmap, ignore_checksum=True).copy()
     for reference in deleted_references:
         log.info("Deleting", repr(reference), "from", repr(new.name))
         new = new.delete(reference)
@@ -24,7 +24,7 @@ def update_derivation(new_path, old_basename=None):
     """Set the 'derived_from' and 'name' header fields of `new_path`.
     This function works for all Mapping classes:  pmap, imap, and rmap.
     """
-    new = rmap.fetch_mapping(new_path)
+    new = rmap.fetch_mapping(new_path).copy()
     if old_basename is None:    # assume new is a copy of old, with old's name in header
         derived_from = new.name
     else:
@@ -43,7 +43,7 @@ def rmap_insert_references(old_rmap, new_rmap, inserted_references):
 
     Return new ReferenceMapping named `new_rmap`
     """
-    new = old = rmap.fetch_mapping(old_rmap, ignore_checksum=True)
+    new = old = rmap.fetch_mapping(old_rmap, ignore_checksum=True).copy()
     new.header["derived_from"] = old.basename
     for reference in inserted_references:
         baseref = os.path.basename(reference)
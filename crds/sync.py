@@ -32,7 +32,7 @@ import glob
 # ============================================================================
 
 import crds
-from crds.core import log, config, utils, rmap, heavy_client, cmdline, crds_cache_locking
+from crds.core import log, config, utils, rmap, heavy_client, cmdline, crds_cache_locking, mapping_cache
 from crds import data_file
 from crds.core.log import srepr
 from crds.client import api
@@ -309,6 +309,10 @@ class SyncScript(cmdline.ContextsScript):
         else:
             self.update_context()
 
+        # record the mappings verified while syncing so readonly cache users don't rehash them.
+        if config.writable_cache_or_verbose("skipping verified file registry update."):
+            mapping_cache.save_verified_registry()
+
         self.report_stats()
         log.standard_status()
         return log.errors()
@@ -414,11 +418,12 @@ class SyncScript(cmdline.ContextsScript):
             log.warning("Errors occurred during sync,  skipping CRDS cache config and context update.")
 
     def clear_pickles(self):
-        """Remove all pickles."""
+        """Remove all pickles,  including the parsed mapping cache."""
         log.info("Removing all context pickles.  Use --save-pickles to recreate for specified contexts.")
-        for path in rmap.list_pickles("*.pmap", self.observatory, full_path=True):
+        for path in rmap.list_pickles("*.[pi]map", self.observatory, full_path=True):   # imaps for CRDS_PARTITIONED_PICKLES
             if os.path.exists(path):
                 utils.remove(path, self.observatory)
+        mapping_cache.clear_parsed(self.observatory)
 
     def pickle_contexts(self, contexts):
         """Save pickled versions of `contexts` in the CRDS cache.
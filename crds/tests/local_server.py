@@ -0,0 +1,159 @@
+"""This module defines a minimal stand-in for the CRDS server which runs on a
+local port for testing crds.client without network access.   It serves JSONRPC
+calls on /json/<method>/<id>/ from a dictionary of python functions and file
+contents on /files/<name> from a dictionary of bytes over HTTP/1.1 keep-alive
+connections,  and counts the connections,  requests,  and concurrent requests
+it handles.   It also serves requests sent to it as an HTTP proxy.
+"""
+import json
+import time
+import socket
+import threading
+from http import server
+from urllib import parse
+
+# ==============================================================================
+
+class LocalServer:
+    """Serve `methods` { jsonrpc_method : function(*params) } and `files` { name : bytes }
+    on a local port,  delaying each response by `delay` seconds.
+
+    >> with LocalServer({"get_default_context" : lambda obs: "hst_0001.pmap"}) as srv:
+    ..     api.set_crds_server(srv.url)
+    """
+    def __init__(self, methods=None, files=None, delay=0.0):
+        self.methods = methods or {}
+        self.files = files or {}
+        self.delay = delay
+        self.failures = {}    # { method_or_file : number of times to respond with HTTP 500 }
+        self.redirects = {}   # { method_or_file : (redirect status, location) }
+        self.last_headers = None   # headers of the last request
+        self.keep_alive = True   # False drops each connection after its response,  like an idle timeout
+        self.connections = 0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.proxied = 0      # requests sent to this server as an HTTP proxy
+        self.lock = threading.Lock()
+        self.httpd = server.ThreadingHTTPServer(("localhost", 0), _handler_class(self))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """The base URL of this server."""
+        return "http://localhost:{}".format(self.httpd.server_address[1])
+
+    @property
+    def files_url(self):
+        """The base URL of the files served by this server."""
+        return self.url + "/files/"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def _begin(self):
+        """Count the start of a request."""
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+            self.max_active = max(self.active, self.max_active)
+        time.sleep(self.delay)
+
+    def _end(self):
+        """Count the end of a request."""
+        with self.lock:
+            self.active -= 1
+
+    def _should_fail(self, name):
+        """Return True if the request for `name` should fail with HTTP 500."""
+        with self.lock:
+            if self.failures.get(name):
+                self.failures[name] -= 1
+                return True
+        return False
+
+def _handler_class(local_server):
+    """Return the request handler class serving `local_server`."""
+
+    class Handler(server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Send the headers and body of responses without waiting on delayed ACKs.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with local_server.lock:
+                local_server.connections += 1
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            local_server._begin()
+            try:
+                method = self._path().split("/")[2]
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if method in local_server.redirects:
+                    return self._respond_redirect(*local_server.redirects[method])
+                if local_server._should_fail(method):
+                    return self._respond(500, b"Internal Server Error")
+                try:
+                    params = body["params"]
+                    if isinstance(params, dict):
+                        result = local_server.methods[method](**params)
+                    else:
+                        result = local_server.methods[method](*params)
+                    response = dict(id=body["id"], result=result, error=None)
+                except Exception as exc:
+                    response = dict(id=body["id"], result=None, error=dict(message=str(exc)))
+                self._respond(200, json.dumps(response).encode("utf-8"), "application/json")
+            finally:
+                local_server._end()
+
+        def do_GET(self):
+            local_server._begin()
+            try:
+                path = self._path()
+                name = path.split("/")[-1]
+                if name in local_server.redirects:
+                    self._respond_redirect(*local_server.redirects[name])
+                elif not path.startswith("/files/") or name not in local_server.files:
+                    self._respond(404, b"Not Found")
+                elif local_server._should_fail(name):
+                    self._respond(500, b"Internal Server Error")
+                else:
+                    self._respond(200, local_server.files[name])
+            finally:
+                local_server._end()
+
+        def _path(self):
+            """Return the path requested,  also when the request was sent to this server as an HTTP proxy."""
+            local_server.last_headers = self.headers
+            if self.path.startswith("http:"):
+                with local_server.lock:
+                    local_server.proxied += 1
+            return parse.urlsplit(self.path).path
+
+        def _respond_redirect(self, status, location):
+            self.send_response(status)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _respond(self, status, data, content_type="application/octet-stream"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            if not local_server.keep_alive:
+                self.close_connection = True
+
+    return Handler
@@ -0,0 +1,225 @@
+"""This module tests the asyncio client API crds.client.aio against a local
+stand-in for the CRDS server.
+"""
+import os
+import asyncio
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from urllib import request
+
+from crds.core import config
+from crds.core.exceptions import CrdsLookupError, CrdsDownloadError, ServiceError
+from crds.client import aio, api, proxy, transport
+from crds.tests import test_config
+from crds.tests.local_server import LocalServer
+
+# ==================================================================================
+
+BESTREFS = {
+    "j8bt05njq" : {"biasfile" : "m991609sj_bia.fits"},
+    "j8bt06o6q" : {"biasfile" : "m4r1753rj_bia.fits"},
+    }
+
+FILES = {
+    "m991609sj_bia.fits" : b"bias one" * 1000,
+    "m4r1753rj_bia.fits" : b"bias two" * 1000,
+    "hst_acs_biasfile_0250.rmap" : b"header = {}\n",
+    }
+
+def get_best_references_by_header_map(context, header_map, reftypes):
+    if context != "hst_0001.pmap":
+        raise ValueError("Unknown context " + repr(context))
+    return { dataset_id : BESTREFS[dataset_id] for dataset_id in header_map }
+
+def get_dataset_headers_by_id(context, dataset_ids, datasets_since):
+    return { dataset_id : {"INSTRUME" : "ACS", "DATASET" : dataset_id} for dataset_id in dataset_ids }
+
+def get_file_info_map(observatory, files, fields):
+    return proxy.crds_encode({ name : { "size" : str(len(FILES[name])),
+                                        "sha1sum" : hashlib.sha1(FILES[name]).hexdigest() }
+                               for name in files if name in FILES })
+
+def _run(coroutine):
+    """Run `coroutine` on a new event loop,  closing the loop's pooled connections afterwards."""
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            aio.reset_pool()
+    return asyncio.run(run())
+
+# ==================================================================================
+
+class TestAio(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer({
+            "get_best_references_by_header_map" : get_best_references_by_header_map,
+            "get_dataset_headers_by_id" : get_dataset_headers_by_id,
+            "get_file_info_map" : get_file_info_map,
+            }, files=dict(FILES), delay=0.02)
+        self.server.__enter__()
+        self.cache = tempfile.TemporaryDirectory()
+        self.old_state = test_config.setup(cache=self.cache.name, url=self.server.url, observatory="hst")
+        os.environ["CRDS_REFERENCE_URI"] = self.server.files_url
+        os.environ["CRDS_MAPPING_URI"] = self.server.files_url
+        os.environ["CRDS_CLIENT_MAX_CONCURRENCY"] = "3"
+        transport.reset_pool()
+
+    def tearDown(self):
+        transport.reset_pool()
+        test_config.cleanup(self.old_state)
+        self.server.__exit__()
+        self.cache.cleanup()
+
+    def test_get_best_references_by_header_map(self):
+        bestrefs = _run(aio.get_best_references_by_header_map(
+            "hst_0001.pmap", { dataset_id : {} for dataset_id in BESTREFS }, ["biasfile"]))
+        self.assertEqual(bestrefs, BESTREFS)
+
+    def test_get_best_references_by_header_map_error(self):
+        with self.assertRaisesRegex(CrdsLookupError, "Unknown context 'hst_9999.pmap'"):
+            _run(aio.get_best_references_by_header_map("hst_9999.pmap", {"j8bt05njq" : {}}))
+
+    def test_matches_blocking_api(self):
+        async def both():
+            return (await aio.get_dataset_headers_by_id("/path/hst_0001.pmap", ["j8bt05njq"]),
+                    await aio.get_file_info_map("hst", ["m4r1753rj_bia.fits"], ["sha1sum", "size"]))
+        self.assertEqual(_run(both()),
+                         (api.get_dataset_headers_by_id("/path/hst_0001.pmap", ["j8bt05njq"]),
+                          api.get_file_info_map("hst", ["m4r1753rj_bia.fits"], ["sha1sum", "size"])))
+
+    def test_bounded_concurrency(self):
+        ids = ["id{:03d}".format(i) for i in range(40)]
+        headers = _run(aio.get_dataset_headers_unlimited("hst_0001.pmap", ids, max_ids_per_rpc=2))
+        self.assertEqual(sorted(headers), ids)
+        self.assertEqual(self.server.requests, 20)
+        self.assertEqual(self.server.max_active, 3)
+
+    def test_retries(self):
+        config.CLIENT_RETRY_COUNT.set(3)
+        self.server.failures["get_dataset_headers_by_id"] = 2
+        headers = _run(aio.get_dataset_headers_by_id("hst_0001.pmap", ["j8bt05njq"]))
+        self.assertEqual(list(headers), ["j8bt05njq"])
+        self.assertEqual(self.server.requests, 3)
+
+    def test_retries_exhausted(self):
+        config.CLIENT_RETRY_COUNT.set(2)
+        self.server.failures["get_dataset_headers_by_id"] = 2
+        with self.assertRaisesRegex(ServiceError, "HTTP Error 500"):
+            _run(aio.get_dataset_headers_by_id("hst_0001.pmap", ["j8bt05njq"]))
+
+    def test_connections_reused(self):
+        async def sequential():
+            for dataset_id in BESTREFS:
+                await aio.get_dataset_headers_by_id("hst_0001.pmap", [dataset_id])
+            return await aio.dump_files("hst_0001.pmap", ["m991609sj_bia.fits"])
+        _run(sequential())
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_environment_proxy(self):
+        api.set_crds_server("http://crds.invalid")
+        with mock.patch.dict(os.environ, {"http_proxy" : self.server.url, "no_proxy" : ""}):
+            request.install_opener(None)   # build the default opener from the proxy variables above
+            try:
+                headers = _run(aio.get_dataset_headers_by_id("hst_0001.pmap", ["j8bt05njq"]))
+            finally:
+                request.install_opener(None)
+        self.assertEqual(list(headers), ["j8bt05njq"])
+        self.assertEqual(self.server.proxied, 1)
+
+    def test_user_agent(self):
+        _run(aio.get_dataset_headers_by_id("hst_0001.pmap", ["j8bt05njq"]))
+        self.assertEqual(self.server.last_headers["User-Agent"], transport.USER_AGENT)
+
+    def test_redirects(self):
+        self.server.redirects["m991609sj_bia.fits"] = (302, "/files/m4r1753rj_bia.fits")
+        self.server.files["m4r1753rj_bia.fits"] = FILES["m991609sj_bia.fits"]
+        self.assertEqual(_run(aio.dump_files("hst_0001.pmap", ["m991609sj_bia.fits"]))[1:],
+                         (1, len(FILES["m991609sj_bia.fits"])))
+        self.server.redirects["get_dataset_headers_by_id"] = (307, "/json/get_dataset_headers_by_id/1/")
+        with self.assertRaisesRegex(ServiceError, "HTTP Error 307"):   # like urllib,  POSTs are not redirected
+            _run(aio.get_dataset_headers_by_id("hst_0001.pmap", ["j8bt05njq"]))
+
+    def test_https_default_context(self):
+        with mock.patch("ssl._create_default_https_context", side_effect=ValueError("default https context")):
+            with self.assertRaisesRegex(ValueError, "default https context"):
+                _run(aio.urlopen("https://localhost:1/"))
+
+    def test_keep_alive_disabled(self):
+        config.CLIENT_KEEP_ALIVE.set(False)
+        _run(aio.get_dataset_headers_unlimited("hst_0001.pmap", ["id1", "id2", "id3"], max_ids_per_rpc=1))
+        self.assertEqual(self.server.connections, 3)
+
+    def test_stale_connection_replaced(self):
+        self.server.keep_alive = False
+        async def sequential():
+            for dataset_id in BESTREFS:
+                await aio.get_dataset_headers_by_id("hst_0001.pmap", [dataset_id])
+        _run(sequential())
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_cancelled_download(self):
+        self.server.delay = 1.0
+        path = config.locate_file("m991609sj_bia.fits", "hst")
+        async def cancelled():
+            cacher = aio.AsyncFileCacher("hst_0001.pmap")
+            task = asyncio.ensure_future(cacher.download("m991609sj_bia.fits", path))
+            await asyncio.sleep(0.2)
+            with open(path, "wb") as handle:   # stands in for a partial download
+                handle.write(b"partial")
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        with mock.patch("crds.client.aio._run_blocking", side_effect=AssertionError("blocking call")):
+            _run(cancelled())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(api._DOWNLOAD_LOCKS, {})
+
+    def test_file_cacher_downloads(self):
+        localpaths, downloads, nbytes = _run(aio.dump_files("hst_0001.pmap", FILES))
+        self.assertEqual(downloads, 3)
+        self.assertEqual(nbytes, sum(len(data) for data in FILES.values()))
+        for name, path in localpaths.items():
+            self.assertEqual(path, config.locate_file(name, "hst"))
+            with open(path, "rb") as handle:
+                self.assertEqual(handle.read(), FILES[name])
+        self.assertEqual(_run(aio.dump_files("hst_0001.pmap", FILES))[1:], (0, 0))
+
+    def test_file_cacher_concurrent_downloads(self):
+        async def twice():
+            return await asyncio.gather(aio.dump_files("hst_0001.pmap", ["m991609sj_bia.fits"]),
+                                        aio.dump_files("hst_0001.pmap", ["m991609sj_bia.fits"]))
+        self.assertEqual([result[1] for result in _run(twice())], [1, 1])
+        with open(config.locate_file("m991609sj_bia.fits", "hst"), "rb") as handle:
+            self.assertEqual(handle.read(), FILES["m991609sj_bia.fits"])
+        self.assertEqual(self.server.requests, 3)   # two get_file_info_map calls and one download
+        self.assertEqual(api._DOWNLOAD_LOCKS, {})
+
+    def test_file_cacher_bad_checksum(self):
+        self.server.files["m991609sj_bia.fits"] = b"bias bad" * 1000
+        with self.assertRaisesRegex(CrdsDownloadError, "sha1sum .* does not match server sha1sum"):
+            _run(aio.dump_files("hst_0001.pmap", ["m991609sj_bia.fits"]))
+        self.assertFalse(os.path.exists(config.locate_file("m991609sj_bia.fits", "hst")))
+
+    def test_file_cacher_errors_logged(self):
+        localpaths, downloads, nbytes = _run(aio.dump_files(
+            "hst_0001.pmap", ["m991609sj_bia.fits", "unknown_bia.fits"], raise_exceptions=False))
+        self.assertEqual(downloads, 2)
+        self.assertEqual(nbytes, len(FILES["m991609sj_bia.fits"]))
+        self.assertTrue(os.path.exists(localpaths["m991609sj_bia.fits"]))
+        self.assertFalse(os.path.exists(localpaths["unknown_bia.fits"]))
+
+# ==================================================================================
+
+def main():
+    """Run module tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAio)
+    return unittest.TextTestRunner().run(suite)
+
+if __name__ == "__main__":
+    print(main())
@@ -2,10 +2,13 @@ import os
 import json
 import shutil
 import datetime
+import tempfile
+import unittest
 
 from crds import bestrefs
 from crds.bestrefs import BestrefsScript
 from crds import assign_bestrefs
+from crds.core import heavy_client
 from crds.tests import test_config
 
 """
@@ -573,14 +576,47 @@ class TestBestrefs(test_config.CRDSTestCase):
 
         os.remove(test_copy)
 
+class TestBestrefsParallel(unittest.TestCase):
+    """Compare bestrefs computed serially and with --processes using the mappings
+    in the test data directory and a serverless cache.
+    """
+    def setUp(self):
+        self.cache = tempfile.TemporaryDirectory()
+        self.old_state = test_config.setup(
+            cache=self.cache.name, url="https://hst-serverless-mode.stsci.edu", observatory="hst")
+        os.environ["CRDS_MAPPATH_SINGLE"] = test_config.TEST_DATA
+        heavy_client.cache_server_info(heavy_client.ConfigInfo(
+            observatory="hst", operational_context="hst_0001.pmap", edit_context="hst_0001.pmap",
+            bad_files="", bad_files_list=[], force_remote_mode=False, last_synced="2022-11-04 00:00:00"), "hst")
+
+    def tearDown(self):
+        test_config.cleanup(self.old_state)
+        self.cache.cleanup()
+
+    def run_bestrefs(self, processes):
+        script = BestrefsScript(
+            "crds.bestrefs --new-context hst_0002.pmap --compare-source-bestrefs "
+            "--files data/j8bt05njq_raw.fits data/missing_raw.fits data/j8bt06o6q_raw.fits "
+            "data/j8bt09jcq_raw.fits data/cos_N8XTZCAWQ.fits --processes {}".format(processes))
+        errors = script()
+        self.assertEqual(script.prefetched, {})
+        return errors, script.updates, script.kill_list
+
+    def test_bestrefs_parallel_matches_serial(self):
+        errors, updates, kill_list = self.run_bestrefs(1)
+        self.assertEqual(errors, 1)
+        self.assertEqual(list(updates), ["data/cos_N8XTZCAWQ.fits", "data/j8bt05njq_raw.fits",
+                                         "data/j8bt06o6q_raw.fits", "data/j8bt09jcq_raw.fits"])
+        self.assertEqual(self.run_bestrefs(2), (errors, updates, kill_list))
 
 # ==================================================================================
 
 def main():
     """Run module tests,  for now just doctests only."""
-    import unittest
     suite = unittest.TestLoader().loadTestsFromTestCase(TestBestrefs)
     unittest.TextTestRunner().run(suite)
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestBestrefsParallel)
+    unittest.TextTestRunner().run(suite)
 
     from crds.tests import test_bestrefs, tstmod
     return tstmod(test_bestrefs)
@@ -74,6 +74,155 @@ def dt_getreferences_imap_omit():
     >>> test_config.cleanup(old_state)
     """
 
+def dt_getrecommendations_many():
+    """
+    >>> old_state = test_config.setup(cache=None, url="https://jwst-crds.stsci.edu")
+    >>> os.environ["CRDS_MAPPATH_SINGLE"] = test_config.TEST_DATA
+
+    >>> heavy_client.getrecommendations_many({
+    ...    "rmap_na" : {"META.INSTRUMENT.NAME":"NIRISS", "META.INSTRUMENT.DETECTOR":"NIS",
+    ...                 "META.INSTRUMENT.FILTER":"BOGUS2", "META.EXPOSURE.TYPE":"NIS_IMAGE"},
+    ...    "rmap_omit" : {"META.INSTRUMENT.NAME":"NIRISS", "META.INSTRUMENT.DETECTOR":"NIS",
+    ...                   "META.INSTRUMENT.FILTER":"BOGUS1", "META.EXPOSURE.TYPE":"NIS_IMAGE"},
+    ...    "imap_na" : {"META.INSTRUMENT.NAME":"FGS", "META.EXPOSURE.TYPE":"FGS_IMAGE"},
+    ...    "imap_omit" : {"META.INSTRUMENT.NAME":"MIRI", "META.EXPOSURE.TYPE":"MIR_IMAGE"},
+    ...    }, observatory="jwst", context="jwst_na_omit.pmap", reftypes=["flat"])
+    {'rmap_na': {'flat': 'NOT FOUND n/a'}, 'rmap_omit': {}, 'imap_na': {'flat': 'NOT FOUND n/a'}, 'imap_omit': {}}
+
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_hv_best_references_many():
+    """
+    >>> old_state = test_config.setup()
+    >>> os.environ["CRDS_MAPPATH_SINGLE"] = test_config.TEST_DATA
+    >>> from crds import data_file
+
+    >>> header = data_file.get_header("data/j8bt06o6q_raw.fits")
+    >>> headers = { "wfc" : header,  "hrc" : dict(header, DETECTOR="HRC"),  "ccdamp" : dict(header, CCDAMP="A"),
+    ...             "cos" : {"INSTRUME":"COS", "DETECTOR":"FUV", "DATE-OBS":"2010-01-01", "TIME-OBS":"00:00:00"} }
+    >>> bestrefs = heavy_client.hv_best_references_many("data/hst_0001.pmap", headers)
+    >>> list(bestrefs)
+    ['wfc', 'hrc', 'ccdamp', 'cos']
+    >>> bestrefs == { dataset_id : heavy_client.hv_best_references("data/hst_0001.pmap", header)
+    ...               for (dataset_id, header) in headers.items() }
+    True
+    >>> heavy_client.hv_best_references_many("data/hst_0001.pmap", headers, ["biasfile", "darkfile"])["hrc"]
+    {'biasfile': 'm4r1753rj_bia.fits', 'darkfile': 'n3o1059hj_drk.fits'}
+
+    >>> mixed = { "wfc" : header,  "foo" : dict(header, INSTRUME="FOO"),  "none" : {"DATE-OBS":"2010-01-01"},
+    ...           "hrc" : dict(header, DETECTOR="HRC") }
+    >>> bestrefs = heavy_client.hv_best_references_many("data/hst_0001.pmap", mixed)
+    >>> bestrefs["foo"]
+    CrdsUnknownInstrumentError("Unknown instrument 'foo' for context 'hst_0001.pmap'")
+    >>> bestrefs["none"]
+    CrdsError("Missing 'INSTRUME' keyword in header for determining instrument.")
+    >>> bestrefs["wfc"] == heavy_client.hv_best_references("data/hst_0001.pmap", header)
+    True
+    >>> bestrefs["hrc"] == heavy_client.hv_best_references("data/hst_0001.pmap", dict(header, DETECTOR="HRC"))
+    True
+
+    >>> p = rmap.get_cached_mapping("data/hst_0001.pmap")
+    >>> foo, wfc = p.get_best_references_batch([dict(header, INSTRUME="FOO"), header])
+    >>> foo
+    CrdsUnknownInstrumentError("Unknown instrument 'foo' for context 'hst_0001.pmap'")
+    >>> wfc == p.get_best_references(header)
+    True
+
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_parallel_best_references():
+    """
+    >>> old_state = test_config.setup()
+    >>> os.environ["CRDS_MAPPATH_SINGLE"] = test_config.TEST_DATA
+    >>> from crds import data_file
+    >>> from crds.core import parallel
+
+    >>> header = data_file.get_header("data/j8bt06o6q_raw.fits")
+    >>> headers = [(str(i), dict(header, DETECTOR=detector, CCDAMP=ccdamp))
+    ...            for i, (detector, ccdamp) in enumerate([("WFC", "ABCD"), ("HRC", "A"), ("SBC", "C")] * 5)]
+    >>> headers.insert(7, ("bad", {"INSTRUME" : "FOO"}))
+    >>> serial = [(dataset_id, heavy_client.hv_best_references("data/hst_0001.pmap", header))
+    ...           for (dataset_id, header) in headers if dataset_id != "bad"]
+
+    >>> results = list(parallel.best_references("data/hst_0001.pmap", headers, processes=2, chunksize=4))
+    CRDS - ERROR -  Failed computing bestrefs for 'bad' : Unknown instrument 'foo' for context 'hst_0001.pmap'
+    >>> results[7]
+    ('bad', None)
+    >>> results[:7] + results[8:] == serial
+    True
+
+    >>> with parallel.BestrefsPool(["data/hst_0001.pmap"], processes=1, start_method="spawn") as pool:
+    ...     spawned = list(pool.imap((dataset_id, "data/hst_0001.pmap", header, ["biasfile"]) for (dataset_id, header) in headers))
+    >>> spawned[1]
+    ('1', {'biasfile': 'm991609sj_bia.fits'})
+    >>> spawned[7]
+    ('bad', CrdsUnknownInstrumentError("Unknown instrument 'foo' for context 'hst_0001.pmap'"))
+
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_get_final_context_shared_info():
+    """
+    >>> old_state = test_config.setup()
+    >>> info = heavy_client.ConfigInfo(observatory="hst", operational_context="hst_0001.pmap", status="cache")
+    >>> heavy_client.get_final_context(info, "hst_0002.pmap")
+    'hst_0002.pmap'
+    >>> with config.thread_context("hst_0003.pmap"):
+    ...     heavy_client.get_final_context(info, None)
+    'hst_0003.pmap'
+    >>> heavy_client.get_final_context(info, None)
+    'hst_0001.pmap'
+    >>> info.status
+    'cache'
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_concurrent_getreferences():
+    """
+    Many threads calling getreferences() at once on a cold cache load each mapping
+    once and get the same answers as a single thread,  including threads which
+    select their own context with config.thread_context().
+
+    >>> import tempfile
+    >>> from concurrent import futures
+    >>> from crds import data_file
+    >>> from crds.core import utils
+    >>> old_state = test_config.setup(cache=tempfile.mkdtemp(), url="https://hst-serverless-mode.stsci.edu", observatory="hst")
+    >>> os.environ["CRDS_MAPPATH_SINGLE"] = test_config.TEST_DATA
+    >>> heavy_client.cache_server_info(heavy_client.ConfigInfo(
+    ...     observatory="hst", operational_context="hst_0001.pmap", edit_context="hst_0001.pmap",
+    ...     bad_files="", bad_files_list=[], force_remote_mode=False, last_synced="2022-11-04 00:00:00"), "hst")
+
+    >>> header = data_file.get_header("data/j8bt06o6q_raw.fits")
+    >>> headers = [dict(header, DETECTOR=detector, CCDAMP=ccdamp)
+    ...            for detector in ["WFC", "HRC", "SBC"] for ccdamp in ["A", "ABCD", "C"]]
+    >>> reftypes = ["bpixtab", "darkfile", "idctab", "imphttab", "mdriztab"]
+    >>> expected = [heavy_client.hv_best_references("hst_0001.pmap", header, reftypes) for header in headers]
+    >>> expected2 = [heavy_client.hv_best_references("hst_0002.pmap", header, reftypes) for header in headers]
+    >>> for bestrefs in expected + expected2:
+    ...     for reference in bestrefs.values():
+    ...         path = config.locate_file(reference, "hst")
+    ...         utils.ensure_dir_exists(path)
+    ...         open(path, "w").close()
+    >>> utils.clear_function_caches()
+
+    >>> def lookup(i):
+    ...     with config.thread_context("hst_0002.pmap" if i % 2 else "hst_0001.pmap"):
+    ...         bestrefs = heavy_client.getreferences(headers[i % len(headers)], observatory="hst", reftypes=reftypes, fast=True)
+    ...     return { filekind : os.path.basename(path) for (filekind, path) in bestrefs.items() }
+    >>> with futures.ThreadPoolExecutor(32) as pool:
+    ...     results = list(pool.map(lookup, range(320)))
+
+    >>> all(results[i] == expected[i % len(headers)] for i in range(0, 320, 2))
+    True
+    >>> all(results[i] == expected2[i % len(headers)] for i in range(1, 320, 2))
+    True
+
+    >>> test_config.cleanup(old_state)
+    """
+
 def dt_getreferences_ignore_cache():
     """
     >>> old_state = test_config.setup(url="https://jwst-crds.stsci.edu")
@@ -214,6 +363,65 @@ def dt_pickled_mappings(mapping):
     >>> test_config.cleanup(old_state)
     """
 
+def dt_partitioned_pickled_mappings():
+    """
+    >>> old_state = test_config.setup()
+    >>> old_partitioned = config.PARTITIONED_PICKLES.set(True)
+
+    >>> p = rmap.load_mapping("data/jwst_na_omit.pmap", path="data")
+    >>> heavy_client.save_pickled_mapping("jwst_na_omit.pmap", p)  # doctest: +ELLIPSIS
+    CRDS - INFO -  Saved pickled context '.../pickles/jwst/jwst_na_omit.pmap.pkl'
+    >>> assert os.path.exists(config.locate_pickle("jwst_niriss_na_omit.imap"))
+
+    >>> q = heavy_client.load_pickled_mapping("jwst_na_omit.pmap")
+    CRDS - INFO -  Loaded pickled context 'jwst_na_omit.pmap'
+    >>> q.get_imap("niriss")  # doctest: +ELLIPSIS
+    CRDS - INFO -  Loaded pickled context 'jwst_niriss_na_omit.imap'
+    InstrumentContext('...jwst_niriss_na_omit.imap')
+    >>> sorted(q.selections._contents)
+    ['niriss']
+
+    >>> with open(config.locate_pickle("jwst_miri_omit.imap"), "wb") as handle:
+    ...     _ = handle.write(b"corrupt")
+    >>> miri = q.get_imap("miri")
+    >>> miri is rmap.get_cached_mapping("jwst_miri_omit.imap", path="data")
+    True
+    >>> miri.keys["loader"] is rmap.get_cached_mapping
+    True
+    >>> miri.difference(p.get_imap("miri"))
+    []
+
+    >>> for name in ["jwst_na_omit.pmap", "jwst_fgs_na.imap", "jwst_miri_omit.imap", "jwst_niriss_na_omit.imap"]:
+    ...     os.remove(config.locate_pickle(name))
+
+    >>> _ = config.PARTITIONED_PICKLES.set(old_partitioned)
+    >>> test_config.cleanup(old_state)
+    """
+
+def dt_shared_contexts():
+    """
+    >>> old_state = test_config.setup()
+    >>> old_shared = config.SHARED_CONTEXTS.set(True)
+    >>> from crds.core import snapshot
+
+    >>> p = rmap.load_mapping("data/jwst_na_omit.pmap", path="data")
+    >>> segment = snapshot.publish_shared(p, snapshot.shared_memory_name("jwst_na_omit.pmap"))
+    >>> segment.name
+    'crds_jwst_na_omit.pmap'
+
+    >>> q = heavy_client.get_pickled_mapping.uncached("jwst_na_omit.pmap")
+    >>> q.format() == p.format()
+    True
+    >>> q.get_imap("niriss").format() == p.get_imap("niriss").format()
+    True
+    >>> sorted(q.selections._contents)
+    ['niriss']
+
+    >>> segment.close(); segment.unlink()
+    >>> _ = config.SHARED_CONTEXTS.set(old_shared)
+    >>> test_config.cleanup(old_state)
+    """
+
 def dt_check_parameters():
     """
     >>> old_state = test_config.setup(url="https://jwst-crds-serverless.stsci.edu", observatory="jwst")
@@ -2,6 +2,7 @@
 complex features of the basic rmap infrastructure.
 """
 import os
+import glob
 import json
 from pprint import pprint as pp
 import pickle
@@ -922,6 +923,333 @@ selector = Match({
                 "TIME-OBS" : "00:34:32",
                 }) is None
 
+    def test_rmap_bestref_cache(self):
+        r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+        header = {
+                "DETECTOR" : "HRC",
+                "CCDAMP" : "A",
+                "CCDGAIN" : "1.0",
+                "DATE-OBS" : "2002-03-19",
+                "TIME-OBS" : "00:34:32",
+                "ROOTNAME" : "J8BT06O6Q",
+                }
+        self.assertEqual(r.get_best_ref(header), "n3o1022fj_drk.fits")
+        header["ROOTNAME"] = "J8BT06O7Q"   # not a parkey,  same cache entry
+        self.assertEqual(r.get_best_ref(header), "n3o1022fj_drk.fits")
+        stats = r.bestref_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+        header["DATE-OBS"] = "2002-03-21"
+        self.assertEqual(r.get_best_ref(header), "n3o1022ij_drk.fits")
+        self.assertEqual(r.bestref_cache_stats()["size"], 2)
+
+    def test_rmap_bestref_cache_na_omit(self):
+        r = rmap.load_mapping("data/hst_acs_darkfile_na_omit.rmap")
+        header = {
+                "DETECTOR" : "SBC",
+                "CCDAMP" : "A",
+                "CCDGAIN" : "1.0",
+                "DATE-OBS" : "1993-01-01",
+                "TIME-OBS" : "12:00:00",
+                }
+        for _i in range(2):
+            with self.assertRaises(IrrelevantReferenceTypeError):
+                r._get_best_ref(header)
+        header.update({ "DATE-OBS" : "2002-03-19", "TIME-OBS" : "00:34:32" })
+        for _i in range(2):
+            with self.assertRaises(OmitReferenceTypeError):
+                r._get_best_ref(header)
+        self.assertEqual(r.bestref_cache_stats()["hits"], 2)
+
+    def test_rmap_bestref_cache_insert_delete(self):
+        r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+        header = {
+                "DETECTOR" : "HRC",
+                "CCDAMP" : "A",
+                "CCDGAIN" : "1.0",
+                "DATE-OBS" : "2002-03-19",
+                "TIME-OBS" : "00:34:32",
+                }
+        self.assertEqual(r.get_best_ref(header), "n3o1022fj_drk.fits")
+        r2 = r.delete("n3o1022fj_drk.fits")
+        self.assertEqual(r2.bestref_cache_stats()["size"], 0)
+        self.assertEqual(r2.get_best_ref(header), "n3o1022ej_drk.fits")
+        self.assertEqual(r.get_best_ref(header), "n3o1022fj_drk.fits")
+
+    def test_rmap_bestref_cache_disabled(self):
+        old = config.BESTREF_CACHE_SIZE.set(0)
+        try:
+            r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+            header = {
+                    "DETECTOR" : "HRC",
+                    "CCDAMP" : "A",
+                    "CCDGAIN" : "1.0",
+                    "DATE-OBS" : "2002-03-19",
+                    "TIME-OBS" : "00:34:32",
+                    }
+            self.assertEqual(r.get_best_ref(header), "n3o1022fj_drk.fits")
+            self.assertEqual(r.get_best_ref(header), "n3o1022fj_drk.fits")
+            self.assertEqual(r.bestref_cache_stats()["size"], 0)
+        finally:
+            config.BESTREF_CACHE_SIZE.set(old)
+
+    def test_rmap_bestref_cache_pickling(self):
+        r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+        header = {
+                "DETECTOR" : "HRC",
+                "CCDAMP" : "A",
+                "CCDGAIN" : "1.0",
+                "DATE-OBS" : "2002-03-19",
+                "TIME-OBS" : "00:34:32",
+                }
+        r.get_best_ref(header)
+        q = pickle.loads(pickle.dumps(r))
+        self.assertEqual(q.bestref_cache_stats()["size"], 0)
+        self.assertEqual(q.get_best_ref(header), "n3o1022fj_drk.fits")
+
+    def test_rmap_merge_cache(self):
+        header = {
+                "DETECTOR" : "HRC",
+                "CCDAMP" : "C",
+                "CCDGAIN" : "1.0",
+                "DATE-OBS" : "2004-03-19",
+                "TIME-OBS" : "00:34:32",
+                }
+        expected = rmap.load_mapping("data/hst_acs_darkfile.rmap").get_best_ref(header)
+        r = rmap.load_mapping("data/hst_acs_darkfile.rmap")
+        self.assertEqual(r.precompute_merges(), 8)
+        self.assertEqual(r.merge_cache_stats()["size"], 8)
+        q = pickle.loads(pickle.dumps(r))
+        self.assertEqual(q.merge_cache_stats()["size"], 8)
+        self.assertEqual(q.get_best_ref(header), expected)
+        stats = q.merge_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 8))
+
+    def test_rmap_merge_cache_bounded(self):
+        old = config.MERGE_CACHE_SIZE.set(2)
+        try:
+            r = rmap.load_mapping("data/hst_acs_darkfile.rmap")
+            r.precompute_merges()
+            stats = r.merge_cache_stats()
+            self.assertEqual((stats["size"], stats["evictions"]), (2, 6))
+        finally:
+            config.MERGE_CACHE_SIZE.set(old)
+
+    def test_rmap_mapping_loaders_agree(self):
+        for name in sorted(glob.glob("data/*.[pir]map")):
+            text = open(name).read()
+            results = []
+            for loader in ["exec", "ast"]:
+                try:
+                    header, selector, comment = rmap.Mapping._parse_header_selector(text, name, mapping_loader=loader)
+                except Exception as exc:
+                    results.append((exc.__class__, str(exc)))
+                else:
+                    selector = selector if isinstance(selector, dict) else selector.format()
+                    results.append((dict(header), selector, comment))
+            self.assertEqual(results[0], results[1], name)
+
+    def test_rmap_mapping_loader_format_error(self):
+        for statement in ["import os", "lambda: 0"]:
+            text = open("data/hst_acs_darkfile.rmap").read() + "\n" + statement + "\n"
+            for loader in ["exec", "ast"]:
+                with self.assertRaisesRegex(MappingError, "Illegal statement or expression in mapping"):
+                    rmap.Mapping._parse_header_selector(text, "bad.rmap", mapping_loader=loader)
+
+    def test_rmap_snapshot_roundtrip(self):
+        from crds.core import snapshot
+        p = rmap.load_mapping("data/jwst_na_omit.pmap", path="data")
+        p.force_load()
+        snapshot.save_snapshot("jwst_na_omit.pmap.snap", p)
+        try:
+            s = snapshot.open_snapshot("jwst_na_omit.pmap.snap")
+            self.assertEqual(sorted(s.instruments), ["fgs", "miri", "niriss"])
+            q = s.load()
+            self.assertEqual(q.format(), p.format())
+            self.assertEqual(q.selections._contents, {})   # nothing nested decoded yet
+            self.assertEqual(q.get_imap("niriss").format(), p.get_imap("niriss").format())
+            self.assertEqual(list(q.selections._contents), ["niriss"])
+            self.assertEqual(q.mapping_names(), p.mapping_names())
+            self.assertEqual(pickle.loads(pickle.dumps(q)).mapping_names(), p.mapping_names())
+        finally:
+            os.remove("jwst_na_omit.pmap.snap")
+
+    def test_rmap_preload(self):
+        serial = rmap.load_mapping("data/jwst_na_omit.pmap", path="data")
+        serial.force_load()
+        p = rmap.load_mapping("data/jwst_na_omit.pmap", path="data")
+        self.assertEqual(p.preload(workers=4), len(serial.mapping_names()) - 1)
+        self.assertEqual(p.selections.unloaded_items(), [])
+        for imap in p.selections.normal_values():
+            self.assertEqual(imap.selections.unloaded_items(), [])
+        self.assertEqual(p.mapping_names(), serial.mapping_names())
+        self.assertEqual(p.preload(workers=4), 0)
+
+    def test_rmap_preload_cached(self):
+        utils.clear_function_caches()
+        try:
+            p = rmap.get_cached_mapping("data/jwst_na_omit.pmap", path="data")
+            p.preload(workers=2)
+            imap = rmap.get_cached_mapping(p.selector["MIRI"], path="data")
+            self.assertIs(p.get_imap("miri"), imap)
+        finally:
+            utils.clear_function_caches()
+
+    def test_rmap_cached_mappings_frozen(self):
+        utils.clear_function_caches()
+        try:
+            p = rmap.get_cached_mapping("data/jwst_na_omit.pmap", path="data")
+            p.preload(workers=2)
+            r = p.get_imap("niriss").get_rmap("flat")
+            for mapping in [p, p.get_imap("miri"), r]:
+                with self.assertRaises(FrozenMappingError):
+                    mapping.header["derived_from"] = "something else"
+                with self.assertRaises(FrozenMappingError):
+                    mapping.write(os.path.join(self.temp_dir, "frozen.rmap"))
+            with self.assertRaises(FrozenMappingError):
+                p.set_item("miri", "jwst_miri_0001.imap")
+            self.assertIs(rmap.fetch_mapping("data/jwst_na_omit.pmap", path="data"), p)
+            copy = rmap.fetch_mapping(r.filename, path="data").copy()
+            copy.header["derived_from"] = r.basename
+            copy.write(os.path.join(self.temp_dir, "thawed.rmap"))
+            self.assertEqual(r.header["derived_from"], rmap.load_mapping(r.filename).header["derived_from"])
+            self.assertFalse(rmap.load_mapping("data/jwst_na_omit.pmap", path="data")._frozen)
+            self.assertTrue(pickle.loads(pickle.dumps(r))._frozen)
+        finally:
+            utils.clear_function_caches()
+
+    def test_rmap_derive_mapping(self):
+        import shutil
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in rmap.load_mapping("data/jwst_na_omit.pmap", path="data").mapping_names():
+                shutil.copy(os.path.join("data", name), tmpdir)
+            with open(os.path.join(tmpdir, "jwst_na_omit.pmap")) as handle:
+                text = handle.read().replace("jwst_niriss_na_omit.imap", "jwst_niriss_new.imap")
+            with open(os.path.join(tmpdir, "jwst_new.pmap"), "w+") as handle:
+                handle.write(text)
+            shutil.copy(os.path.join(tmpdir, "jwst_niriss_na_omit.imap"), os.path.join(tmpdir, "jwst_niriss_new.imap"))
+            old = rmap.load_mapping("jwst_na_omit.pmap", path=tmpdir)
+            old.get_imap("niriss").force_load()
+            old.get_imap("miri")
+            new = rmap.derive_mapping("jwst_new.pmap", old, path=tmpdir, ignore_checksum=True)
+            self.assertIs(new.get_imap("miri"), old.get_imap("miri"))
+            self.assertEqual(new.selections.unloaded_items(), [("fgs", "jwst_fgs_na.imap")])
+            new_niriss, old_niriss = new.selections._contents["niriss"], old.get_imap("niriss")
+            self.assertIsNot(new_niriss, old_niriss)
+            self.assertEqual(new_niriss.basename, "jwst_niriss_new.imap")
+            self.assertEqual(new_niriss.selections.unloaded_items(), [])
+            self.assertIs(new_niriss.selections["flat"], old_niriss.selections["flat"])
+
+    def test_rmap_parsed_mapping_cache(self):
+        from unittest import mock
+        import tempfile
+        from crds.core import mapping_cache
+        old_picklepath = os.environ.get("CRDS_PICKLEPATH")
+        old_enabled = config.PARSED_MAPPING_CACHE.set(True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ["CRDS_PICKLEPATH"] = tmpdir
+            try:
+                r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+                self.assertTrue(os.path.exists(mapping_cache.get_parsed_path(r.sha1sum, "hst")))
+                with mock.patch.object(rmap.ReferenceMapping, "_parse_header_selector", side_effect=AssertionError):
+                    s = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+                self.assertEqual(s.format(), r.format())
+                self.assertEqual(s.comment, r.comment)
+                mapping_cache.clear_parsed("hst")
+                self.assertFalse(os.path.exists(mapping_cache.get_parsed_path(r.sha1sum, "hst")))
+            finally:
+                config.PARSED_MAPPING_CACHE.set(old_enabled)
+                if old_picklepath is None:
+                    del os.environ["CRDS_PICKLEPATH"]
+                else:
+                    os.environ["CRDS_PICKLEPATH"] = old_picklepath
+
+    def test_rmap_verified_registry(self):
+        from unittest import mock
+        import tempfile
+        from crds.core import mapping_cache
+        old_cfgpath = os.environ.get("CRDS_CFGPATH")
+        old_mode = config.VERIFIED_REGISTRY.set("true")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ["CRDS_CFGPATH"] = tmpdir
+            mapping_cache.clear_verified_registry()
+            try:
+                r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+                mapping_cache.save_verified_registry()
+                mapping_cache.clear_verified_registry()
+                with open(mapping_cache.get_verified_registry_path("hst")) as handle:
+                    registry = json.load(handle)
+                self.assertEqual(registry[os.path.abspath("data/hst_acs_darkfile_comment.rmap")][2], r.sha1sum)
+                with mock.patch.object(rmap.Mapping, "_check_hash", side_effect=AssertionError):
+                    s = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+                    self.assertEqual(s.format(), r.format())
+                    config.VERIFIED_REGISTRY.set("false")
+                    with self.assertRaises(AssertionError):
+                        rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+            finally:
+                config.VERIFIED_REGISTRY.set(old_mode)
+                mapping_cache.clear_verified_registry()
+                if old_cfgpath is None:
+                    del os.environ["CRDS_CFGPATH"]
+                else:
+                    os.environ["CRDS_CFGPATH"] = old_cfgpath
+
+    def test_rmap_snapshot_bad_magic(self):
+        from crds.core import snapshot
+        with self.assertRaisesRegex(SnapshotFormatError, "not a CRDS context snapshot"):
+            snapshot.ContextSnapshot(b"\0" * 64, "bogus.snap")
+
+    def test_rmap_get_best_refs_batch(self):
+        r = rmap.load_mapping("data/hst_acs_darkfile_na_omit.rmap")
+        headers = [
+            dict(DETECTOR="HRC", CCDAMP="A", CCDGAIN="1.0", **{"DATE-OBS":"2002-03-19", "TIME-OBS":"00:34:32"}),
+            dict(DETECTOR="SBC", CCDAMP="A", CCDGAIN="1.0", **{"DATE-OBS":"1993-01-01", "TIME-OBS":"12:00:00"}),
+            dict(DETECTOR="SBC", CCDAMP="A", CCDGAIN="1.0", **{"DATE-OBS":"2002-03-19", "TIME-OBS":"00:34:32"}),
+            dict(DETECTOR="HRC", CCDAMP="A", CCDGAIN="1.0", **{"DATE-OBS":"1980-01-01", "TIME-OBS":"00:00:00"}),
+            dict(DETECTOR="HRC", CCDAMP="A", CCDGAIN="1.0", **{"DATE-OBS":"2002-03-19", "TIME-OBS":"00:34:32"}),
+        ]
+        expected = [rmap.load_mapping("data/hst_acs_darkfile_na_omit.rmap").get_best_ref(header) for header in headers]
+        self.assertEqual(r.get_best_refs_batch(headers), expected)
+        self.assertEqual(expected[1:3], ["NOT FOUND n/a", None])
+        self.assertTrue(expected[3].startswith("NOT FOUND"))
+
+    def test_rmap_get_best_refs_batch_columns(self):
+        import numpy as np
+        r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+        columns = {
+            "DETECTOR" : np.array(["HRC", "HRC", "WFC"]),
+            "CCDAMP" : np.array(["A", "B", "A"]),
+            "CCDGAIN" : np.array(["1.0", "2.0", "1.0"]),
+            "DATE-OBS" : np.array(["2002-03-19", "2002-03-21", "2002-03-19"]),
+            "TIME-OBS" : np.array(["00:34:32", "00:34:32", "00:34:32"]),
+        }
+        headers = [{ key : str(values[i]) for (key, values) in columns.items() } for i in range(3)]
+        self.assertEqual(r.get_best_refs_batch(columns), [r.get_best_ref(header) for header in headers])
+
+    def test_rmap_selector_stats(self):
+        from crds.core import selectors
+        header = {
+                "DETECTOR" : "HRC",
+                "CCDAMP" : "A",
+                "CCDGAIN" : "1.0",
+                "DATE-OBS" : "2002-03-19",
+                "TIME-OBS" : "00:34:32",
+                }
+        r = rmap.load_mapping("data/hst_acs_darkfile_comment.rmap")
+        old = selectors.enable_stats()
+        try:
+            r.get_best_ref(header)
+            stats = selectors.get_stats()
+        finally:
+            selectors.enable_stats(old)
+        self.assertEqual(list(stats.keys()), ["hst_acs_darkfile_comment.rmap"])
+        rstats = stats["hst_acs_darkfile_comment.rmap"]
+        self.assertEqual(rstats["lookups"], 1)
+        self.assertEqual(rstats["bsearches"], 1)
+        self.assertTrue(rstats["match_cases"] >= rstats["winnowed"]["CCDAMP"] > 0)
+        self.assertIn("hst_acs_darkfile_comment.rmap", selectors.format_stats(stats))
+        self.assertEqual(selectors.get_stats(), {})
+
     def test_rmap_todict(self):
         p = rmap.get_cached_mapping("hst.pmap")
         p.todict()
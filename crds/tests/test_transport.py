@@ -0,0 +1,188 @@
+"""This module tests the pooled keep-alive HTTP transport used by crds.client
+for JSON RPC calls and downloads,  counting the connections made to a local
+stand-in for the CRDS server.
+"""
+import os
+import ssl
+import http
+import tempfile
+import unittest
+from unittest import mock
+from concurrent import futures
+from urllib import error, request
+
+from crds.core import config
+from crds.core.exceptions import ServiceError
+from crds.client import api, transport
+from crds.tests import test_config, test_aio
+from crds.tests.local_server import LocalServer
+
+# ==================================================================================
+
+def get_server_info():
+    return {"download_metadata" : test_aio.get_file_info_map("hst", list(test_aio.FILES), None)}
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer({
+            "get_dataset_headers_by_id" : test_aio.get_dataset_headers_by_id,
+            "get_server_info" : get_server_info,
+            }, files=dict(test_aio.FILES))
+        self.server.__enter__()
+        self.cache = tempfile.TemporaryDirectory()
+        self.old_state = test_config.setup(cache=self.cache.name, url=self.server.url, observatory="hst")
+        os.environ["CRDS_REFERENCE_URI"] = self.server.files_url
+        os.environ["CRDS_MAPPING_URI"] = self.server.files_url
+        transport.reset_pool()
+
+    def tearDown(self):
+        transport.reset_pool()
+        test_config.cleanup(self.old_state)
+        self.server.__exit__()
+        self.cache.cleanup()
+
+    def get_headers(self, i=0):
+        dataset_id = "id{:03d}".format(i)
+        return api.get_dataset_headers_by_id("hst_0001.pmap", [dataset_id])[dataset_id]
+
+    def test_rpcs_share_connection(self):
+        for i in range(20):
+            self.assertEqual(self.get_headers(i)["DATASET"], "id{:03d}".format(i))
+        self.assertEqual(self.server.requests, 20)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_keep_alive_disabled(self):
+        config.CLIENT_KEEP_ALIVE.set(False)
+        for i in range(5):
+            self.get_headers(i)
+        self.assertEqual(self.server.connections, 5)
+
+    def test_rpcs_and_downloads_share_connection(self):
+        localpaths, downloads, nbytes = api.dump_files("hst_0001.pmap", list(test_aio.FILES))
+        self.assertEqual(downloads, 3)
+        for name, path in localpaths.items():
+            with open(path, "rb") as handle:
+                self.assertEqual(handle.read(), test_aio.FILES[name])
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_concurrent_downloads(self):
+        with futures.ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda i: api.dump_files("hst_0001.pmap", list(test_aio.FILES)), range(8)))
+        for localpaths, downloads, nbytes in results:
+            for name, path in localpaths.items():
+                with open(path, "rb") as handle:
+                    self.assertEqual(handle.read(), test_aio.FILES[name])
+        self.assertEqual(self.server.requests, len(test_aio.FILES) + 1)   # one download each and get_server_info
+        self.assertEqual(api._DOWNLOAD_LOCKS, {})
+
+    def test_threads(self):
+        with futures.ThreadPoolExecutor(4) as pool:
+            headers = list(pool.map(self.get_headers, range(100)))
+        self.assertEqual([header["DATASET"] for header in headers], ["id{:03d}".format(i) for i in range(100)])
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_pool_size(self):
+        os.environ["CRDS_CLIENT_POOL_SIZE"] = "1"
+        transport.reset_pool()
+        responses = [transport.urlopen(self.server.files_url + name) for name in test_aio.FILES]
+        for response in responses:
+            response.read()
+        self.assertEqual(self.server.connections, 3)
+        for name in test_aio.FILES:
+            with transport.urlopen(self.server.files_url + name) as response:
+                self.assertEqual(response.read(), test_aio.FILES[name])
+        self.assertEqual(self.server.connections, 3)
+
+    def test_partial_read_not_reused(self):
+        with transport.urlopen(self.server.files_url + "m991609sj_bia.fits") as response:
+            self.assertEqual(response.read(4), b"bias")
+        self.get_headers()
+        self.assertEqual(self.server.connections, 2)
+        self.get_headers()
+        self.assertEqual(self.server.connections, 2)
+
+    def test_stale_connections_replaced(self):
+        self.server.keep_alive = False
+        for i in range(5):
+            self.assertEqual(self.get_headers(i)["DATASET"], "id{:03d}".format(i))
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(self.server.connections, 5)
+
+    def test_http_errors(self):
+        with self.assertRaisesRegex(error.HTTPError, "HTTP Error 404: Not Found"):
+            transport.urlopen(self.server.files_url + "missing.fits")
+        self.server.failures["get_dataset_headers_by_id"] = 1
+        with self.assertRaisesRegex(ServiceError, "HTTP Error 500: Internal Server Error"):
+            self.get_headers()
+        self.assertEqual(self.get_headers()["DATASET"], "id000")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_user_agent(self):
+        self.get_headers()
+        pooled = self.server.last_headers["User-Agent"]
+        request.urlopen(self.server.files_url + "m991609sj_bia.fits").read()
+        self.assertEqual(pooled, self.server.last_headers["User-Agent"])
+        self.assertEqual(pooled, transport.USER_AGENT)
+
+    def outcomes(self, url, data=None):
+        """Return the outcomes of opening `url` on a pooled connection and with urllib,
+        checking that the pooled request and its redirects share one connection.
+        """
+        results = []
+        for urlopen in [transport.urlopen, request.urlopen]:
+            connections = self.server.connections
+            try:
+                with urlopen(url, data) as response:
+                    results.append((response.status, response.read()))
+            except error.HTTPError as exc:
+                results.append((exc.code, exc.reason))
+            if urlopen is transport.urlopen:
+                self.assertLessEqual(self.server.connections - connections, 1)
+        return results
+
+    def test_redirects_like_urllib(self):
+        bias = test_aio.FILES["m991609sj_bia.fits"]
+        for status in [301, 302, 303, 307, 308]:
+            self.server.redirects["old_bia.fits"] = (status, "/files/m991609sj_bia.fits")
+            self.server.redirects["moved_method"] = (status, "/files/m991609sj_bia.fits")
+            self.assertEqual(self.outcomes(self.server.files_url + "old_bia.fits"), [(200, bias)] * 2)
+            expected = (200, bias) if status in (301, 302, 303) else (status, http.HTTPStatus(status).phrase)
+            self.assertEqual(self.outcomes(self.server.url + "/json/moved_method/1/", b"{}"), [expected] * 2)
+
+    def test_redirect_loop(self):
+        self.server.redirects["loop_bia.fits"] = (302, "/files/loop_bia.fits")
+        pooled, urllib = self.outcomes(self.server.files_url + "loop_bia.fits")
+        self.assertEqual(pooled, urllib)
+        self.assertEqual(pooled[0], 302)
+        self.assertIn("infinite loop", pooled[1])
+
+    def test_redirect_scheme_not_allowed(self):
+        self.server.redirects["local_bia.fits"] = (302, "file:///etc/passwd")
+        pooled, urllib = self.outcomes(self.server.files_url + "local_bia.fits")
+        self.assertEqual(pooled, urllib)
+        self.assertIn("is not allowed", pooled[1])
+
+    def test_https_default_context(self):
+        with mock.patch.object(ssl, "_create_default_https_context", wraps=ssl._create_default_https_context) as context:
+            with self.assertRaises(OSError):    # the local server does not speak TLS
+                transport.urlopen(self.server.url.replace("http:", "https:") + "/files/m991609sj_bia.fits")
+        context.assert_called()
+
+    def test_retries(self):
+        config.CLIENT_RETRY_COUNT.set(2)
+        self.server.failures["get_dataset_headers_by_id"] = 1
+        self.assertEqual(self.get_headers()["DATASET"], "id000")
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(self.server.connections, 1)
+
+# ==================================================================================
+
+def main():
+    """Run module tests."""
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTransport)
+    return unittest.TextTestRunner().run(suite)
+
+if __name__ == "__main__":
+    print(main())